@@ -0,0 +1,36 @@
+# Export the COCO SSD MobileNet v3 frozen graph to ONNX for the "onnx" backend
+#
+#   python export_onnx.py            # -> ssd_mobilenet_v3_large_coco.onnx
+#
+# This is the float32 model camera.py loads by default (ONNX_MODEL). For the
+# int8 copy, calibrate it on frames from the feeder camera afterwards:
+#
+#   python quantize_onnx.py ssd_mobilenet_v3_large_coco.onnx calib_frames/ \
+#          ssd_mobilenet_v3_large_coco_int8.onnx
+#
+# and point ONNX_MODEL at the _int8 file. The graph keeps TF's uint8
+# image_tensor input and detection_boxes / detection_classes /
+# detection_scores outputs, which is what OnnxRuntimeDetector looks for.
+#
+# Needs TensorFlow and tf2onnx (pip install tf2onnx) on the machine that runs
+# the conversion only; the Pi just needs onnxruntime.
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+OPSET = 13
+
+if __name__ == "__main__":
+    src = os.path.join(HERE, "frozen_inference_graph.pb")
+    dst = os.path.join(HERE, "ssd_mobilenet_v3_large_coco.onnx")
+
+    subprocess.run([
+        sys.executable, "-m", "tf2onnx.convert",
+        "--graphdef", src,
+        "--inputs", "image_tensor:0",
+        "--outputs", "detection_boxes:0,detection_classes:0,detection_scores:0,num_detections:0",
+        "--opset", str(OPSET),
+        "--output", dst,
+    ], check=True)
+    print(f"Wrote {dst} ({os.path.getsize(dst) / 1e6:.1f} MB)")
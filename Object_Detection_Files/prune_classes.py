@@ -0,0 +1,103 @@
+# Derive a cat/dog-only SSD MobileNet v3 from the COCO model for camera.py
+#
+#   python prune_classes.py                 # cat + dog (default)
+#   python prune_classes.py cat dog person  # any subset of coco.names
+#
+# Writes next to this script:
+#   frozen_inference_graph_pruned.pb              ClassPredictor convs sliced
+#   ssd_mobilenet_v3_large_pruned.pbtxt           91 -> N+1 classes in the head
+#   pruned.names                                  class list, in the new id order
+#
+# The six BoxPredictor_k/ClassPredictor 1x1 convs emit anchors * 91 channels
+# (background + 90 COCO ids per anchor). Keeping only background and the chosen
+# ids per anchor shrinks those convs, the sigmoid and DetectionOutput's NMS to
+# N+1 classes. Scores are per-class sigmoids, so the kept classes score exactly
+# as before. New ids are 1..N in the order given, so classNames[classId - 1]
+# against pruned.names keeps working unchanged.
+#
+# Needs TensorFlow (any 2.x) on the machine that runs the conversion only;
+# the Pi keeps loading the result through cv2.dnn.
+import os
+import re
+import sys
+
+import numpy as np
+import tensorflow as tf
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+NUM_COCO_CLASSES = 91  # background + 90 ids, as in the original head
+
+SRC_PB = os.path.join(HERE, "frozen_inference_graph.pb")
+SRC_PBTXT = os.path.join(HERE, "ssd_mobilenet_v3_large_coco_2020_01_14.pbtxt")
+SRC_NAMES = os.path.join(HERE, "coco.names")
+
+DST_PB = os.path.join(HERE, "frozen_inference_graph_pruned.pb")
+DST_PBTXT = os.path.join(HERE, "ssd_mobilenet_v3_large_pruned.pbtxt")
+DST_NAMES = os.path.join(HERE, "pruned.names")
+
+
+def keep_channels(depth, class_ids):
+    # Channel layout is [anchor0: c0..c90, anchor1: c0..c90, ...]
+    anchors = depth // NUM_COCO_CLASSES
+    assert anchors * NUM_COCO_CLASSES == depth, f"unexpected ClassPredictor depth {depth}"
+    keep = [0] + list(class_ids)
+    return [a * NUM_COCO_CLASSES + c for a in range(anchors) for c in keep]
+
+
+def prune_weights(class_ids):
+    graph_def = tf.compat.v1.GraphDef()
+    with open(SRC_PB, "rb") as f:
+        graph_def.ParseFromString(f.read())
+
+    pruned = 0
+    for node in graph_def.node:
+        if not re.fullmatch(r"BoxPredictor_\d+/ClassPredictor/(weights|biases)", node.name):
+            continue
+        value = tf.make_ndarray(node.attr["value"].tensor)
+        value = np.take(value, keep_channels(value.shape[-1], class_ids), axis=-1)
+        node.attr["value"].tensor.CopyFrom(tf.make_tensor_proto(value))
+        pruned += 1
+
+    if pruned != 12:
+        raise RuntimeError(f"expected 6 ClassPredictor weight/bias pairs, pruned {pruned} tensors")
+
+    with open(DST_PB, "wb") as f:
+        f.write(graph_def.SerializeToString())
+
+
+def prune_config(num_classes):
+    with open(SRC_PBTXT, "rt") as f:
+        text = f.read()
+
+    # Reshape feeding the class sigmoid: [0, -1, 91] -> [0, -1, N+1]
+    text, n1 = re.subn(r'(name: "ClassPredictor/concat3d/shape".*?int_val: -1\s+int_val: )91',
+                       rf"\g<1>{num_classes}", text, count=1, flags=re.S)
+    # DetectionOutput's class count
+    text, n2 = re.subn(r'(key: "num_classes"\s+value \{\s+i: )91',
+                       rf"\g<1>{num_classes}", text, count=1)
+    if n1 != 1 or n2 != 1:
+        raise RuntimeError("pbtxt layout not recognised; is this the COCO 2020_01_14 config?")
+
+    with open(DST_PBTXT, "wt") as f:
+        f.write(text)
+
+
+if __name__ == "__main__":
+    wanted = sys.argv[1:] or ["cat", "dog"]
+
+    with open(SRC_NAMES, "rt") as f:
+        coco = f.read().rstrip("\n").split("\n")
+    missing = [name for name in wanted if name not in coco]
+    if missing:
+        print("Not in coco.names:", ", ".join(missing))
+        sys.exit(1)
+
+    class_ids = [coco.index(name) + 1 for name in wanted]
+
+    prune_weights(class_ids)
+    prune_config(len(class_ids) + 1)
+    with open(DST_NAMES, "wt") as f:
+        f.write("\n".join(wanted) + "\n")
+
+    print(f"Pruned head to {wanted} (COCO ids {class_ids})")
+    print("Wrote", DST_PB, DST_PBTXT, DST_NAMES, sep="\n  ")
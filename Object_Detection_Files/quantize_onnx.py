@@ -0,0 +1,57 @@
+# Build an int8 copy of the ONNX detector for the "onnx" backend in camera.py
+# (the float model comes from export_onnx.py; set camera.ONNX_MODEL to the output)
+#
+#   python quantize_onnx.py ssd_mobilenet_v3_large_coco.onnx calib_frames/ \
+#          ssd_mobilenet_v3_large_coco_int8.onnx
+#
+# Static (calibrated) QDQ quantization: activations are calibrated on a folder
+# of real frames from the feeder camera, so use a few dozen shots of the room
+# with and without pets in view. Input/output tensors stay float, so the
+# quantized model is a drop-in replacement for OnnxRuntimeDetector.
+import os
+import sys
+
+import cv2
+import numpy as np
+import onnxruntime as ort
+from onnxruntime.quantization import (CalibrationDataReader, QuantFormat, QuantType,
+                                      quantize_static)
+
+
+class FrameReader(CalibrationDataReader):
+    def __init__(self, model_path, frames_dir, size=(320, 320), limit=200):
+        inp = ort.InferenceSession(model_path, providers=["CPUExecutionProvider"]).get_inputs()[0]
+        self.input_name = inp.name
+        self.raw_uint8 = inp.type == "tensor(uint8)"
+        self.nchw = len(inp.shape) == 4 and inp.shape[1] == 3
+        self.size = size
+
+        files = sorted(f for f in os.listdir(frames_dir)
+                       if f.lower().endswith((".jpg", ".jpeg", ".png")))[:limit]
+        self.paths = iter(os.path.join(frames_dir, f) for f in files)
+
+    def get_next(self):
+        for path in self.paths:
+            img = cv2.imread(path)
+            if img is None:
+                continue
+            rgb = cv2.cvtColor(cv2.resize(img, self.size), cv2.COLOR_BGR2RGB)
+            blob = rgb if self.raw_uint8 else (rgb.astype(np.float32) - 127.5) / 127.5
+            if self.nchw:
+                blob = blob.transpose(2, 0, 1)
+            return {self.input_name: blob[np.newaxis, ...]}
+        return None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4:
+        print("usage: quantize_onnx.py <model.onnx> <calibration_frames_dir> <out_int8.onnx>")
+        sys.exit(1)
+
+    src, frames_dir, dst = sys.argv[1:]
+    quantize_static(src, dst, FrameReader(src, frames_dir),
+                    quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8,
+                    weight_type=QuantType.QInt8,
+                    per_channel=True)
+    print(f"Wrote {dst} ({os.path.getsize(dst) / 1e6:.1f} MB, was {os.path.getsize(src) / 1e6:.1f} MB)")
@@ -0,0 +1,548 @@
+# Virtual feeder Arduino on a pseudo-terminal
+#
+# Emulates src/slave/arduino-slave-cat.ino closely enough to run the feeder
+# controller end to end without hardware:
+#
+#   python arduino_emulator.py --link /tmp/snackloader/tty-cat --time-scale 60
+#   SNACKLOADER_CAT_PORT=/tmp/snackloader/tty-cat SNACKLOADER_TIME_SCALE=60 \
+#       python cat_feeder_controller.py
+#
+# The firmware's timing is kept: the steppers follow AccelStepper's
+# trapezoidal ramps while loop() keeps weighing and reading commands, and
+# reaching a target is reported as its own event (a lid command FINs then).
+# The HX711 converts on its own sample grid; loop() picks up the latest
+# conversion when one is ready and feeds the firmware's ring-buffer filter:
+# LIVE / WEIGHT are the moving average, the dispensing cutoff the median of
+# the newest 3 samples.
+# Sequenced commands ("#<seq> CMD") get the firmware's ACK / FIN / NAK
+# replies, including re-answering resends of a recent seq, and "BIN <baud>"
+# switches to the COBS/CRC binary frames of serial_frames.py (and back to
+# text after MAX_BAD_FRAMES corrupt frames in a row, or on a text line, like
+# the firmware).
+# Food flows while the dispenser is open and lands after a short fall time
+# (so the bowl overshoots like the real one); each reading gets load-cell noise.
+# All of it runs on a virtual clock (sim_clock) that can be scaled up.
+#
+# --detections optionally plays a presence script on the local detection bus
+# in place of camera.py, e.g. "5:cat=1,40:cat=0,60:dog=1" (virtual seconds).
+#
+# kill -USR1 <pid> presses the reset button: the sketch restarts from
+# setup() and counts the lid as closed again, while the lid itself stays
+# where it was (FORCE_CLOSE_LID drives it home, like on the feeder).
+import argparse
+import math
+import os
+import pty
+import random
+import select
+import signal
+import tty
+
+from serial_frames import FIN_STOPPED, decode_command, encode_event, looks_like_text
+from sim_clock import ScaledClock, default_clock
+
+MAX_BAD_FRAMES = 8      # the firmware's fallback to text at 9600
+
+
+class Motor:
+    """AccelStepper moveTo()/run(): ramp up, cruise, brake onto the target."""
+
+    def __init__(self, max_speed, accel):
+        self.max_speed = max_speed      # steps/s
+        self.accel = accel              # steps/s^2
+        self.pos = 0.0
+        self.target = 0.0
+        self.speed = 0.0                # signed steps/s
+
+    def move_to(self, target):
+        self.target = float(target)
+
+    def distance_to_go(self):
+        return self.target - self.pos
+
+    def run(self, dt):
+        dist = self.target - self.pos
+        if dist == 0:
+            self.speed = 0.0
+            return
+        direction = 1.0 if dist > 0 else -1.0
+        dv = self.accel * dt
+        if self.speed * direction < 0:
+            # Retargeted while moving the other way: brake first
+            self.speed += direction * dv
+        elif abs(dist) <= self.speed ** 2 / (2 * self.accel):
+            self.speed = direction * max(abs(self.speed) - dv, dv)
+        else:
+            self.speed = direction * min(abs(self.speed) + dv, self.max_speed)
+        step = self.speed * dt
+        if step * dist > 0 and abs(step) >= abs(dist):
+            self.pos, self.speed = self.target, 0.0
+        else:
+            self.pos += step
+
+
+class FirmwareModel:
+    """State and timing of arduino-slave-cat.ino; out(data) receives Serial output bytes."""
+
+    def __init__(self, clock, out, max_speed=512.0, accel=4000.0, disp_steps=350,
+                 lid_steps=500, hx711_sps=10.0, live_period=0.3, flow_gps=8.0,
+                 flow_jitter=0.2, fall_s=0.4, noise_g=0.4, boot_s=1.5, filter_len=8,
+                 loop_s=0.002, seed=None):
+        self.clock = clock
+        self.out = out
+        self.max_speed = max_speed
+        self.accel = accel
+        self.disp_steps = disp_steps
+        self.lid_steps = lid_steps
+        self.loop_s = loop_s            # one pass of loop(), virtual seconds
+        self.sample_s = 1.0 / hx711_sps
+        self.filter_len = filter_len
+        self.live_period = live_period
+        self.flow_gps = flow_gps
+        self.flow_jitter = flow_jitter
+        self.fall_s = fall_s
+        self.noise_g = noise_g
+        self.boot_s = boot_s
+        self.rng = random.Random(seed)
+        self.last_run = None
+        self.bowl_g = 0.0               # food that has landed and settled
+        self.flows = []                 # [open_ts, close_ts or None, grams/s]
+        self.lid_offset = 0.0           # real lid position minus the sketch's step count
+        self.commands = 0
+        self.resets = 0
+        self._init_sketch()
+
+    def _init_sketch(self):
+        # The sketch's RAM, as it is after power-on or a reset
+        self.disp = Motor(self.max_speed, self.accel)
+        self.lid = Motor(self.max_speed, self.accel)
+        self.rx = []                    # complete command lines not read yet
+        self._rx_buf = b""
+        self.binary = False
+        self.baud = 9600
+        self.bad_frames = 0
+        self.bad_run = 0                # corrupt frames in a row
+        self.dispensing = False
+        self.target = 0.0
+        self.lid_open = False
+        self.lid_motion = None          # "open" / "close" while the lid moves
+        self.disp_motion = None
+        self.lid_seq = 0
+        self.dispense_after_lid = False
+        self.last_live = 0.0
+        self.ring = []                  # newest filter_len samples, grams
+        self.samples_taken = 0
+        self.last_conversion = None
+        self.settling = False           # dispenser closed, waiting for a settled WEIGHT
+        self.settle_from = 0
+        self.seen = {}                  # seq -> 0 running, 1 done, 2 stopped (last 4)
+        self.dispense_seq = 0
+
+    # ----------------- SERIAL -----------------
+    def println(self, line):
+        self.out((line + "\r\n").encode())
+
+    def report(self, kind, *values, text=None):
+        # One event: a text line, or a binary frame in BIN mode
+        if self.binary:
+            self.out(encode_event(kind, *values))
+        else:
+            self.println(text or kind)
+
+    def receive(self, chunk):
+        # Bytes from the host -> complete commands in rx (frames decoded to text)
+        self._rx_buf += chunk
+        while self.binary:
+            end = self._rx_buf.find(b"\0")
+            newline = self._rx_buf.find(b"\n")
+            if 0 <= newline and (end < 0 or newline < end) and looks_like_text(self._rx_buf[:newline]):
+                # A text line: the host is not talking frames; it resends
+                self.text_mode()
+                self._rx_buf = self._rx_buf[newline + 1:]
+                break
+            if end < 0:
+                return
+            item, self._rx_buf = self._rx_buf[:end], self._rx_buf[end + 1:]
+            if not item:
+                continue
+            cmd = decode_command(item)
+            if cmd is None:
+                self.bad_frames += 1
+                self.bad_run += 1
+                if self.bad_run >= MAX_BAD_FRAMES:
+                    self.text_mode()
+                    self._rx_buf = b""
+                    return
+            else:
+                self.bad_run = 0
+                self.rx.append(cmd)
+
+        *lines, self._rx_buf = self._rx_buf.split(b"\n")
+        self.rx.extend(line.decode(errors="ignore") for line in lines)
+
+    def text_mode(self):
+        # Serial.flush(); Serial.begin(TEXT_BAUD)
+        self.binary = False
+        self.baud = 9600
+        self.bad_run = 0
+
+    # ----------------- PHYSICS -----------------
+    def _landed(self, now):
+        # Food in the bowl at `now`, folding finished pours into bowl_g
+        total = self.bowl_g
+        still_falling = []
+        for start, end, rate in self.flows:
+            lo = start + self.fall_s
+            hi = (end if end is not None else now) + self.fall_s
+            grams = rate * max(0.0, min(now, hi) - lo)
+            if end is not None and now >= hi:
+                self.bowl_g += grams
+            else:
+                still_falling.append([start, end, rate])
+            total += grams
+        self.flows = still_falling
+        return total
+
+    def poll_scale(self):
+        # scale.is_ready(): read the newest conversion if it hasn't been read yet
+        conversion = math.floor(self.clock.time() / self.sample_s) * self.sample_s
+        if conversion == self.last_conversion:
+            return False
+        self.last_conversion = conversion
+        self.ring.append(self._landed(conversion) + self.rng.gauss(0.0, self.noise_g))
+        del self.ring[:-self.filter_len]
+        self.samples_taken += 1
+        return True
+
+    def live_weight(self):
+        return max(sum(self.ring) / len(self.ring), 0.0)
+
+    def cutoff_weight(self):
+        return max(sorted(self.ring[-3:])[len(self.ring[-3:]) // 2], 0.0)
+
+    # ----------------- ACTUATORS -----------------
+    def open_dispenser(self):
+        self.disp_motion = "open"
+        self.disp.move_to(self.disp_steps)
+
+    def close_dispenser(self):
+        self.disp_motion = "close"
+        self.disp.move_to(0)
+
+    def move_lid(self, seq, motion, pos):
+        # A lid move still running is superseded: its command finishes STOPPED
+        self.fin(self.lid_seq, FIN_STOPPED)
+        self.lid_seq = seq
+        self.lid_motion = motion
+        self.lid_open = False
+        self.lid.move_to(pos)
+
+    def open_lid(self, seq=0):
+        self.move_lid(seq, "open", self.lid_steps)
+        if not self.binary:
+            self.println("OPEN_LID")
+
+    @property
+    def lid_position(self):
+        # Where the lid really is, in steps from closed
+        return self.lid.pos + self.lid_offset
+
+    def close_lid(self, seq=0, force=False):
+        if force:
+            # lidStepper.setCurrentPosition(LID_OPEN_POS): assume fully open
+            self.lid_offset = self.lid_position - self.lid_steps
+            self.lid.pos, self.lid.speed = float(self.lid_steps), 0.0
+        self.move_lid(seq, "close", 0)
+        if not self.binary:
+            self.println("CLOSE_LID")
+        if self.dispense_after_lid:
+            # The dispense was still waiting for the lid; it won't open now
+            self.dispense_after_lid = False
+            self.dispensing = False
+            self.fin(self.dispense_seq, FIN_STOPPED)
+            self.dispense_seq = 0
+
+    def start_dispense(self, grams):
+        self.target = grams
+        self.dispensing = True
+        if self.lid_open:
+            self.open_dispenser()
+        else:
+            if self.lid_motion != "open":
+                self.open_lid()
+            self.dispense_after_lid = True
+        self.report("TARGET", grams, text=f"TARGET {grams:.2f}")
+
+    def run_motors(self):
+        now = self.clock.time()
+        dt = 0.0 if self.last_run is None else now - self.last_run
+        self.last_run = now
+        self.lid.run(dt)
+        self.disp.run(dt)
+        if self.lid_position < 0:
+            self.lid_offset = -self.lid.pos   # stalled against the closed stop
+
+        if self.lid_motion and self.lid.distance_to_go() == 0:
+            opened = self.lid_motion == "open"
+            self.lid_motion = None
+            self.lid_open = opened
+            self.report("LID_OPENED" if opened else "LID_CLOSED")
+            self.fin(self.lid_seq)
+            self.lid_seq = 0
+            if opened and self.dispense_after_lid:
+                self.dispense_after_lid = False
+                self.open_dispenser()
+
+        if self.disp_motion and self.disp.distance_to_go() == 0:
+            opened = self.disp_motion == "open"
+            self.disp_motion = None
+            if opened:
+                # Food pours while the gate is fully open, and while it swings shut
+                rate = self.flow_gps * (1.0 + self.rng.uniform(-self.flow_jitter, self.flow_jitter))
+                self.flows.append([now, None, rate])
+                self.report("OPEN_DISP")
+            else:
+                for flow in self.flows:
+                    if flow[1] is None:
+                        flow[1] = now
+                self.report("CLOSED_DISP")
+                self.settle_from = self.samples_taken
+
+    # ----------------- SEQUENCE IDS -----------------
+    def ack(self, seq):
+        if seq:
+            self.seen[seq] = 0
+            while len(self.seen) > 4:   # SEQ_HISTORY
+                del self.seen[next(iter(self.seen))]
+            self.report("ACK", seq, text=f"ACK {seq}")
+
+    def fin(self, seq, state=1):
+        if seq:
+            if seq in self.seen:
+                self.seen[seq] = state
+            self.report("FIN", seq, state,
+                        text=f"FIN {seq}" + (" STOPPED" if state == FIN_STOPPED else ""))
+
+    def nak(self, seq):
+        if seq:
+            self.report("NAK", seq, text=f"NAK {seq}")
+
+    # ----------------- FIRMWARE -----------------
+    def setup(self):
+        self.clock.sleep(self.boot_s)
+        self.report("READY")
+        self.last_live = self.last_run = self.clock.time()
+
+    def reset(self):
+        # Reset button / DTR: the sketch starts over, the mechanics stay put
+        self.resets += 1
+        self.lid_offset = self.lid_position
+        print(f"[EMU] Reset with the lid {self.lid_offset:.0f}/{self.lid_steps} steps open")
+        self._init_sketch()
+        self.setup()
+
+    def handle(self, cmd):
+        self.commands += 1
+        seq = 0
+        if cmd.startswith("#"):
+            head, _, cmd = cmd.partition(" ")
+            try:
+                seq = int(head[1:])
+            except ValueError:
+                seq = 0                 # toInt() returns 0 on garbage
+
+        if seq and seq in self.seen:
+            self.report("ACK", seq, text=f"ACK {seq}")
+            if self.seen[seq]:
+                self.fin(seq, self.seen[seq])
+        elif cmd.startswith("BIN") and not self.binary:
+            try:
+                baud = int(cmd[3:])
+            except ValueError:
+                baud = 0
+            if seq and 9600 < baud <= 250000:
+                self.ack(seq)
+                self.fin(seq)
+                self.binary = True      # Serial.flush(); Serial.begin(baud)
+                self.baud = baud
+            else:
+                self.nak(seq)
+        elif cmd == "OPEN_LID":
+            self.ack(seq)
+            self.open_lid(seq)          # FIN when the lid gets there
+        elif cmd == "CLOSE_LID" or cmd == "FORCE_CLOSE_LID":
+            self.ack(seq)
+            self.close_lid(seq, force=cmd == "FORCE_CLOSE_LID")
+        elif cmd.startswith("DISPENSE"):
+            try:
+                grams = float(cmd[8:])
+            except ValueError:
+                grams = 0.0             # toFloat() returns 0 on garbage
+            if grams > 0:
+                self.ack(seq)
+                self.fin(self.dispense_seq, 2)
+                self.settling = False
+                self.dispense_seq = seq
+                self.start_dispense(grams)
+            else:
+                self.nak(seq)
+        elif cmd == "STOP":
+            self.ack(seq)
+            self.dispensing = False
+            self.settling = False
+            self.dispense_after_lid = False
+            self.close_dispenser()
+            self.report("STOPPED")
+            self.fin(self.dispense_seq, 2)
+            self.dispense_seq = 0
+            self.fin(seq)
+        else:
+            self.nak(seq)
+
+    def loop(self):
+        self.run_motors()
+        fresh = self.poll_scale()
+
+        if self.dispensing and fresh and self.cutoff_weight() >= self.target:
+            self.close_dispenser()
+            self.dispensing = False
+            self.dispense_after_lid = False
+            self.settling = True
+
+        # final stable reading: a full window of samples taken after the close
+        if (self.settling and self.disp_motion is None
+                and self.samples_taken - self.settle_from >= self.filter_len):
+            self.settling = False
+            final_w = self.live_weight()
+            self.report("DONE")
+            self.report("WEIGHT", final_w, text=f"WEIGHT {final_w:.1f}")
+            self.fin(self.dispense_seq)
+            self.dispense_seq = 0
+
+        if self.clock.time() - self.last_live > self.live_period and self.ring:
+            live_w = self.live_weight()
+            self.report("LIVE", live_w, text=f"LIVE {live_w:.1f}")
+            self.last_live = self.clock.time()
+
+        while self.rx:
+            self.handle(self.rx.pop(0).strip())
+
+        self.clock.sleep(self.loop_s)
+
+
+# ----------------- PTY -----------------
+class PtyEmulator:
+    def __init__(self, link, clock, **model_args):
+        self.link = link
+        self.clock = clock
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.dropped = 0
+        self.reset_pending = False      # set from the SIGUSR1 handler
+        self.model = FirmwareModel(clock, self.write, **model_args)
+
+        os.makedirs(os.path.dirname(link) or ".", exist_ok=True)
+        if os.path.lexists(link):
+            os.unlink(link)
+        os.symlink(os.ttyname(self.slave), link)
+
+    def write(self, data):
+        # Serial output; like the Uno, it is lost when nobody reads it
+        try:
+            os.write(self.master, data)
+        except BlockingIOError:
+            self.dropped += 1
+
+    def poll_input(self):
+        # Serial.available(): pick up whatever the controller has written
+        while select.select([self.master], [], [], 0)[0]:
+            try:
+                chunk = os.read(self.master, 1024)
+            except BlockingIOError:
+                break
+            except OSError:
+                return
+            if not chunk:
+                return
+            self.model.receive(chunk)
+
+    def run(self, on_tick=None):
+        print(f"Emulated feeder Arduino on {self.link} -> {os.ttyname(self.slave)}")
+        self.model.setup()
+        while True:
+            if self.reset_pending:
+                self.reset_pending = False
+                self.model.reset()
+            self.poll_input()
+            self.model.loop()
+            if on_tick:
+                on_tick(self.clock.time())
+
+    def close(self):
+        for fd in (self.master, self.slave):
+            os.close(fd)
+        try:
+            os.unlink(self.link)
+        except OSError:
+            pass
+
+
+# ----------------- DETECTION SCRIPT -----------------
+def parse_detections(script):
+    # "5:cat=1,40:cat=0" -> [(5.0, "cat", True), (40.0, "cat", False)]
+    events = []
+    for item in filter(None, (part.strip() for part in script.split(","))):
+        at, _, change = item.partition(":")
+        animal, _, value = change.partition("=")
+        events.append((float(at), animal, value not in ("0", "false", "")))
+    return sorted(events)
+
+class DetectionScript:
+    def __init__(self, events, start):
+        from detection_bus import DetectionBusServer
+        self.events = list(events)
+        self.start = start
+        self.bus = DetectionBusServer()
+        self.bus.start()
+
+    def __call__(self, now):
+        while self.events and now - self.start >= self.events[0][0]:
+            _, animal, detected = self.events.pop(0)
+            print(f"[SCRIPT] {animal} {'arrives' if detected else 'leaves'}")
+            self.bus.update(animal, detected, 0.9 if detected else 0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emulate the feeder Arduino on a pty")
+    parser.add_argument("--link", default="/tmp/snackloader/tty-cat",
+                        help="symlink to create for the controller to open")
+    parser.add_argument("--time-scale", type=float, default=None,
+                        help="virtual seconds per real second (default: $SNACKLOADER_TIME_SCALE or 1)")
+    parser.add_argument("--flow", type=float, default=8.0, help="grams per second while the dispenser is open")
+    parser.add_argument("--noise", type=float, default=0.4, help="load-cell noise (grams, 1 sigma)")
+    parser.add_argument("--max-speed", type=float, default=512.0, help="stepper cruise speed (steps/s)")
+    parser.add_argument("--accel", type=float, default=4000.0, help="stepper acceleration (steps/s^2)")
+    parser.add_argument("--hx711-sps", type=float, default=10.0, help="HX711 samples per second (10 or 80)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--detections", default="", help='presence script, e.g. "5:cat=1,40:cat=0"')
+    args = parser.parse_args()
+
+    clock = ScaledClock(args.time_scale) if args.time_scale else default_clock()
+    emulator = PtyEmulator(args.link, clock, flow_gps=args.flow, noise_g=args.noise,
+                           max_speed=args.max_speed, accel=args.accel,
+                           hx711_sps=args.hx711_sps, seed=args.seed)
+    script = DetectionScript(parse_detections(args.detections), clock.time()) if args.detections else None
+    signal.signal(signal.SIGUSR1, lambda signum, frame: setattr(emulator, "reset_pending", True))
+    try:
+        emulator.run(on_tick=script)
+    except KeyboardInterrupt:
+        print("Exiting.")
+    finally:
+        emulator.close()
+        if script:
+            script.bus.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+# Offline benchmark for the camera.py detection loop
+#
+#   python bench_vision.py --video clips/evening.mp4
+#   python bench_vision.py --frames captures/ --backend onnx --no-gate --json
+#
+# Replays recorded footage through the same gate -> scheduler -> detector /
+# tracker -> transition code camera.py runs live, with detectionStatus
+# swapped for an in-memory stand-in that counts every RTDB call. Frames are
+# fed as fast as the pipeline takes them, so fps is the loop's throughput.
+# The gate keep-alive, the scheduler and the publisher's heartbeat run on a
+# virtual clock that follows the footage (video timestamps, or --fps for a
+# frame directory), so they fire as often as they would have live.
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+
+import camera
+from detection_publisher import DetectionPublisher
+from sim_clock import ManualClock
+
+DEFAULT_FPS = 15.0     # frame directories, and videos that report no fps
+
+
+# ----------------- FIREBASE STAND-IN -----------------
+class StandInDb:
+    """Nested-dict RTDB replacement that counts reads and writes per path."""
+
+    def __init__(self):
+        self.data = {}
+        self.calls = {}
+
+    def count(self, op, path):
+        key = (op, path)
+        self.calls[key] = self.calls.get(key, 0) + 1
+
+    def total(self, *ops):
+        return sum(n for (op, _), n in self.calls.items() if op in ops)
+
+    def _node(self, path, create=False):
+        node = self.data
+        parts = [p for p in path.split("/") if p]
+        for part in parts[:-1]:
+            if not isinstance(node.get(part), dict):
+                if not create:
+                    return None, None
+                node[part] = {}
+            node = node[part]
+        return node, parts[-1]
+
+    def get(self, path):
+        parent, key = self._node(path)
+        return parent.get(key) if parent is not None else None
+
+    def set(self, path, value):
+        parent, key = self._node(path, create=True)
+        parent[key] = value
+
+
+class StandInRef:
+    def __init__(self, store, path):
+        self.store = store
+        self.path = path
+
+    def child(self, key):
+        return StandInRef(self.store, f"{self.path}/{key}")
+
+    def get(self):
+        self.store.count("get", self.path)
+        return self.store.get(self.path)
+
+    def set(self, value):
+        self.store.count("set", self.path)
+        self.store.set(self.path, value)
+
+    def update(self, values):
+        self.store.count("update", self.path)
+        for key, value in values.items():
+            self.store.set(f"{self.path}/{key}", value)
+
+
+# ----------------- TIMING -----------------
+class TimedDetector:
+    """Wraps the loaded backend so SSD time is measured separately."""
+
+    def __init__(self, net):
+        self.net = net
+        self.samples = []
+
+    def prepare(self, img):
+        return self.net.prepare(img)
+
+    def detect(self, img, confThreshold=0.5, nmsThreshold=0.0, blob=None):
+        t0 = time.perf_counter()
+        result = self.net.detect(img, confThreshold=confThreshold, nmsThreshold=nmsThreshold, blob=blob)
+        self.samples.append(time.perf_counter() - t0)
+        return result
+
+
+def percentiles(samples):
+    if not samples:
+        return {"n": 0}
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {
+        "n": len(ordered),
+        "p50_ms": round(pick(0.50) * 1000, 2),
+        "p90_ms": round(pick(0.90) * 1000, 2),
+        "p99_ms": round(pick(0.99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+# ----------------- FRAME SOURCES -----------------
+# Both yield (seconds into the footage, frame)
+def video_frames(path):
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+    index = 0
+    try:
+        while True:
+            ok, img = cap.read()
+            if not ok:
+                break
+            msec = cap.get(cv2.CAP_PROP_POS_MSEC)
+            yield (msec / 1000.0 if msec > 0 else index / fps), img
+            index += 1
+    finally:
+        cap.release()
+
+def dir_frames(path, fps=DEFAULT_FPS):
+    index = 0
+    for name in sorted(os.listdir(path)):
+        if name.lower().endswith((".jpg", ".jpeg", ".png", ".bmp")):
+            img = cv2.imread(os.path.join(path, name))
+            if img is not None:
+                yield index / fps, img
+                index += 1
+
+
+# ----------------- RUN -----------------
+def run(frames, clock, max_frames=0):
+    # clock: the ManualClock the camera components were built on
+    stages = {"gate": [], "inference": [], "publish": [], "frame": []}
+    frame_count = detector_runs = detections = 0
+    origin = clock.time()
+    footage_s = 0.0
+
+    start = time.perf_counter()
+    for footage_s, img in frames:
+        clock.advance(origin + footage_s - clock.time())
+        camera.publisher.wake()
+        t0 = time.perf_counter()
+        moving = camera.gate_allows(img)
+        t1 = time.perf_counter()
+        result = camera.run_inference(img, moving)
+        t2 = time.perf_counter()
+
+        if result:
+            camera.last_hits, seen = result
+            if seen is not None:
+                detector_runs += 1
+                detections += len(seen)
+                camera.handle_transitions(camera.publish_hits(camera.last_hits, seen))
+        t3 = time.perf_counter()
+
+        stages["gate"].append(t1 - t0)
+        stages["inference"].append(t2 - t1)
+        stages["publish"].append(t3 - t2)
+        stages["frame"].append(t3 - t0)
+
+        frame_count += 1
+        if max_frames and frame_count >= max_frames:
+            break
+    elapsed = max(time.perf_counter() - start, 1e-9)
+
+    return {
+        "frames": frame_count,
+        "seconds": round(elapsed, 2),
+        "fps": round(frame_count / elapsed, 2),
+        "footage_s": round(footage_s, 2),
+        "detector_runs": detector_runs,
+        "detections_per_s": round(detections / elapsed, 2),
+        "stages": {name: percentiles(samples) for name, samples in stages.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay footage through the camera.py detection loop")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--video", help="video file to replay")
+    source.add_argument("--frames", help="directory of still frames, replayed in name order")
+    parser.add_argument("--fps", type=float, default=DEFAULT_FPS,
+                        help="capture rate of the --frames directory")
+    parser.add_argument("--model-dir", default=camera.MODEL_DIR)
+    parser.add_argument("--backend", default=camera.DETECTOR_BACKEND, choices=["opencv", "onnx", "tflite"])
+    parser.add_argument("--pruned", action="store_true", help="use the cat/dog-only head")
+    parser.add_argument("--onnx-model", default=camera.ONNX_MODEL,
+                        help="model file for --backend onnx (float32 or int8 export)")
+    parser.add_argument("--thres", type=float, default=camera.CONF_THRESHOLD)
+    parser.add_argument("--nms", type=float, default=camera.NMS_THRESHOLD)
+    parser.add_argument("--no-gate", action="store_true", help="disable the motion gate")
+    parser.add_argument("--no-track", action="store_true", help="disable the IoU tracker")
+    parser.add_argument("--no-rois", action="store_true", help="scan the full frame")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="keep the demand/load scheduler on (off by default: it reads live Pi state)")
+    parser.add_argument("--max-frames", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    camera.ONNX_MODEL = args.onnx_model
+    camera.CONF_THRESHOLD = args.thres
+    camera.NMS_THRESHOLD = args.nms
+    camera.MOTION_GATE = not args.no_gate
+    camera.TRACKING = not args.no_track
+    camera.ADAPTIVE_RATE = args.adaptive
+    if args.no_rois:
+        camera.BOWL_ROIS = None
+    clock = ManualClock(time.time())
+    # Fresh last-seen cache so the live camera's state file is never touched;
+    # no preview server and no detection bus
+    camera.init_runtime(os.path.join(tempfile.mkdtemp(), "detection_state.json"), clock,
+                        preview_port=None, local_bus=False)
+
+    store = StandInDb()
+    camera.detRef = StandInRef(store, "detectionStatus")
+    camera.publisher = DetectionPublisher(camera.detRef, clock=clock)
+    camera.load_model(args.model_dir, args.backend, args.pruned)
+    timed = TimedDetector(camera.net)
+    camera.net = timed
+
+    # The per-detection prints would dominate the timings
+    stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+    try:
+        frames = video_frames(args.video) if args.video else dir_frames(args.frames, args.fps)
+        report = run(frames, clock, args.max_frames)
+        camera.publisher.close()
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    report["stages"]["ssd"] = percentiles(timed.samples)
+    report["rtdb"] = {
+        "writes": store.total("set", "update"),
+        "reads": store.total("get"),
+        "by_path": {f"{op} {path}": n for (op, path), n in sorted(store.calls.items())},
+    }
+    report["config"] = {
+        "backend": args.backend, "pruned": args.pruned, "onnx_model": args.onnx_model,
+        "thres": args.thres, "nms": args.nms,
+        "gate": camera.gate is not None, "tracking": camera.tracker is not None,
+        "rois": bool(camera.BOWL_ROIS), "adaptive": camera.scheduler is not None,
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{report['frames']} frames ({report['footage_s']}s of footage) in "
+          f"{report['seconds']}s -> {report['fps']} fps "
+          f"({report['detector_runs']} detector runs, {report['detections_per_s']} detections/s)")
+    for name, stats in report["stages"].items():
+        if stats["n"]:
+            print(f"  {name:<10} n={stats['n']:<6} p50={stats['p50_ms']}ms "
+                  f"p90={stats['p90_ms']}ms p99={stats['p99_ms']}ms max={stats['max_ms']}ms")
+    print(f"RTDB: {report['rtdb']['writes']} writes, {report['rtdb']['reads']} reads")
+    for key, n in report["rtdb"]["by_path"].items():
+        print(f"  {key}: {n}")
+
+
+if __name__ == "__main__":
+    main()
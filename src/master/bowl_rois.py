@@ -0,0 +1,56 @@
+# Region-of-interest inference around the bowls for camera.py
+#
+# Instead of squeezing the whole 640x480 room into the network's 320x320
+# input, each bowl zone is cropped and fed to the detector on its own. The
+# crop is scaled to the network input by the detector itself, so a pet near
+# a bowl covers far more input pixels than it would in the full frame.
+# Boxes are shifted back to full-frame coordinates and merged with
+# per-class NMS where zones overlap, so the result keeps the usual
+# (classIds, confs, bbox) contract. prepare_rois() builds every crop's blob
+# up front so camera.py can do it in the pipeline's preprocess stage.
+import numpy as np
+
+from detector_backends import empty_result, nms_per_class
+
+
+def clip_roi(roi, frame_shape):
+    x, y, w, h = roi
+    fh, fw = frame_shape[:2]
+    x0, y0 = max(0, int(x)), max(0, int(y))
+    x1, y1 = min(fw, int(x + w)), min(fh, int(y + h))
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return x0, y0, x1 - x0, y1 - y0
+
+def prepare_rois(net, img, rois):
+    # -> [(clipped roi, blob)] for the zones that overlap the frame
+    prepared = []
+    for roi in rois:
+        roi = clip_roi(roi, img.shape)
+        if roi is not None:
+            x, y, w, h = roi
+            prepared.append((roi, net.prepare(img[y:y + h, x:x + w])))
+    return prepared
+
+def detect_in_rois(net, img, rois, confThreshold, nmsThreshold, prepared=None):
+    all_ids, all_confs, all_boxes = [], [], []
+
+    if prepared is None:
+        prepared = prepare_rois(net, img, rois)
+    for (x, y, w, h), blob in prepared:
+        classIds, confs, bbox = net.detect(img[y:y + h, x:x + w], confThreshold=confThreshold,
+                                           nmsThreshold=nmsThreshold, blob=blob)
+        if len(classIds) == 0:
+            continue
+
+        boxes = np.array(bbox, np.int32).reshape(-1, 4)
+        boxes[:, 0] += x
+        boxes[:, 1] += y
+        all_ids.append(np.asarray(classIds).reshape(-1))
+        all_confs.append(np.asarray(confs).reshape(-1))
+        all_boxes.append(boxes)
+
+    if not all_ids:
+        return empty_result()
+    return nms_per_class(np.concatenate(all_ids), np.concatenate(all_confs),
+                         np.concatenate(all_boxes), confThreshold, nmsThreshold)
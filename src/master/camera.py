@@ -1,112 +1,233 @@
 # -------------------- Import OpenCV & Firebase --------------------
 import cv2
+import os
 import time
 import numpy as np
-import firebase_admin
-from firebase_admin import credentials, db
+from firebase_admin import db
 
-# --------------------- FIREBASE SETUP -----------------------------
-cred = credentials.Certificate("/home/eutech/serviceAccountKey.json")
-firebase_admin.initialize_app(cred, {
-    "databaseURL": "https://snackloader-default-rtdb.asia-southeast1.firebasedatabase.app/"
-})
+from bowl_rois import detect_in_rois, prepare_rois
+from detection_bus import DetectionBusServer
+from detection_publisher import DetectionPublisher
+from firebase_setup import init_app
+from rtdb_outbox import RtdbOutbox
+from detection_state import DetectionStateCache
+from detector_backends import load_detector
+from inference_scheduler import InferenceScheduler
+from motion_gate import MotionGate
+from pet_tracker import IouTracker
+from preview_server import PreviewServer
+from vision_pipeline import VisionPipeline
 
-detRef = db.reference("detectionStatus")
+# --------------------------- CONFIG -------------------------------
+PIPELINE_MODE = True         # capture / preprocess / inference / publish on separate threads
+PIPELINE_QUEUE_SIZE = 2      # bounded queues between stages (newest frame wins)
+CONF_THRESHOLD = 0.45
+NMS_THRESHOLD = 0.2
 
-# Track last detection state (to avoid spamming Firebase)
-last_detect = {"cat": False, "dog": False}
+DETECTOR_BACKEND = "opencv"  # "opencv" (frozen graph), "onnx" or "tflite" (int8)
+PRUNED_MODEL = False         # cat/dog-only head built by Object_Detection_Files/prune_classes.py
+# "onnx" backend model in MODEL_DIR: the float32 export from export_onnx.py,
+# or the calibrated copy from quantize_onnx.py ("..._coco_int8.onnx")
+ONNX_MODEL = "ssd_mobilenet_v3_large_coco.onnx"
 
-# --------------------- LOAD COCO MODEL ----------------------------
+# Bowl zones (x, y, w, h) in the 640x480 frame. Inference then only runs on
+# these crops, so a pet outside them is never seen: measure them on the
+# installed camera before enabling, e.g.
+#   BOWL_ROIS = {"cat": (20, 200, 280, 280), "dog": (340, 200, 280, 280)}
+BOWL_ROIS = None             # None scans the whole frame
+
+MOTION_GATE = True           # skip net.detect() on frames with no motion
+MOTION_MIN_RATIO = 0.01      # fraction of changed pixels that wakes the detector
+MOTION_KEEPALIVE = 5.0       # seconds between forced inferences on a static scene
+
+HEADLESS = True              # no cv2.imshow window and no drawing unless someone watches
+PREVIEW_PORT = None          # e.g. 8080 for an MJPEG preview (no authentication)
+PREVIEW_HOST = "127.0.0.1"   # "0.0.0.0" to let other machines on the LAN watch
+
+LOCAL_BUS = True             # push detections to the controllers over a Unix socket
+
+ADAPTIVE_RATE = True         # inference interval follows controller demand, CPU load and temperature
+
+TRACKING = True              # carry boxes between detector runs with an IoU tracker
+DETECT_EVERY_N = 5           # while pets are tracked, run the SSD on every Nth frame
+
+SERVICE_ACCOUNT = "/home/eutech/serviceAccountKey.json"
+RTDB_URL = "https://snackloader-default-rtdb.asia-southeast1.firebasedatabase.app/"
+MODEL_DIR = "/home/eutech/Desktop/SnackLoader-Robot/Object_Detection_Files"
+DETECTION_STATE_FILE = "/home/eutech/.snackloader/detection_state.json"
+OUTBOX_DB = "/home/eutech/.snackloader/outbox-camera.db"
+
+# ------------------------ STATE -----------------------------------
+# Firebase, the model and the runtime pieces below are set up in main() (or
+# by bench_vision.py with its own paths), so importing this module has no
+# side effects.
+outbox = None                # RtdbOutbox, every RTDB write is queued here first
+detRef = None
+publisher = None             # DetectionPublisher wrapping detRef
 classNames = []
-classFile = "/home/eutech/Desktop/SnackLoader-Robot/Object_Detection_Files/coco.names"
+net = None
 
-with open(classFile, "rt") as f:
-    classNames = f.read().rstrip("\n").split("\n")
+state_cache = None           # DetectionStateCache: last-seen, persisted across restarts
+last_detect = {"cat": False, "dog": False}   # last published presence (avoid spamming Firebase)
+last_hits = []               # boxes from the last real inference, reused on gated frames
 
-configPath = "/home/eutech/Desktop/SnackLoader-Robot/Object_Detection_Files/ssd_mobilenet_v3_large_coco_2020_01_14.pbtxt"
-weightsPath = "/home/eutech/Desktop/SnackLoader-Robot/Object_Detection_Files/frozen_inference_graph.pb"
+gate = None                  # MotionGate
+tracker = None               # IouTracker
+scheduler = None             # InferenceScheduler
+preview = None               # PreviewServer
+bus = None                   # DetectionBusServer
+frames_since_detect = 0
 
-net = cv2.dnn_DetectionModel(weightsPath, configPath)
-net.setInputSize(320, 320)
-net.setInputScale(1.0 / 127.5)
-net.setInputMean((127.5, 127.5, 127.5))
-net.setInputSwapRB(True)
+# ---------------------- RUNTIME SETUP -----------------------------
+def init_runtime(state_file=DETECTION_STATE_FILE, clock=time,
+                 preview_port=PREVIEW_PORT, local_bus=LOCAL_BUS):
+    # clock: anything with .time() for the gate and scheduler (bench_vision
+    # passes its replay clock). Nothing is started or bound until main().
+    global state_cache, last_detect, gate, tracker, scheduler, preview, bus, frames_since_detect
+    state_cache = DetectionStateCache(state_file)
+    # Seeded from the cache so a pet that left while the camera was down still gets cleared
+    last_detect = {animal: state_cache.detected(animal) for animal in ["cat", "dog"]}
 
-# ---------------------- FIREBASE HELPERS --------------------------
-def send_detected(animal, confidence):
-    timestamp = int(time.time())
-    conf = float(round(float(confidence) * 100, 2))
+    gate = MotionGate(min_motion_ratio=MOTION_MIN_RATIO, keepalive_s=MOTION_KEEPALIVE,
+                      clock=clock) if MOTION_GATE else None
+    tracker = IouTracker() if TRACKING else None
+    scheduler = InferenceScheduler(clock=clock) if ADAPTIVE_RATE else None
+    preview = PreviewServer(host=PREVIEW_HOST, port=preview_port) if preview_port else None
+    bus = DetectionBusServer() if local_bus else None
+    frames_since_detect = 0
 
-    detRef.child(animal).set({
-        "confidence": conf,
-        "detected": True,
-        "timestamp": timestamp
-    })
+# --------------------- FIREBASE SETUP -----------------------------
+def init_firebase():
+    global outbox, detRef, publisher
+    init_app(SERVICE_ACCOUNT, RTDB_URL)
+    outbox = RtdbOutbox(OUTBOX_DB, db.reference("/"))
+    detRef = outbox.reference("detectionStatus")
+    publisher = DetectionPublisher(detRef)
 
-    print(f"✔ {animal.upper()} detected — {conf}%")
+# --------------------- LOAD COCO MODEL ----------------------------
+def load_model(model_dir=MODEL_DIR, backend=DETECTOR_BACKEND, pruned=PRUNED_MODEL):
+    global classNames, net
 
-def send_not_detected(animal):
-    lastSeen = detRef.child(animal).child("timestamp").get()
+    classFile = os.path.join(model_dir, "coco.names")
+    configPath = os.path.join(model_dir, "ssd_mobilenet_v3_large_coco_2020_01_14.pbtxt")
+    weightsPath = os.path.join(model_dir, "frozen_inference_graph.pb")
+    onnxPath = os.path.join(model_dir, ONNX_MODEL)
+    tflitePath = os.path.join(model_dir, "ssd_mobilenet_v3_large_coco_int8.tflite")
 
-    detRef.child(animal).set({
-        "confidence": 0,
-        "detected": False,
-        "timestamp": lastSeen or int(time.time())
-    })
+    if pruned and backend == "opencv":
+        # Head only scores background/cat/dog: ids 1..2 index straight into pruned.names
+        classFile = os.path.join(model_dir, "pruned.names")
+        configPath = os.path.join(model_dir, "ssd_mobilenet_v3_large_pruned.pbtxt")
+        weightsPath = os.path.join(model_dir, "frozen_inference_graph_pruned.pb")
 
-    print(f"✘ {animal.upper()} not detected")
+    with open(classFile, "rt") as f:
+        classNames = f.read().rstrip("\n").split("\n")
+
+    # Every backend returns the same (classIds, confs, bbox) as cv2.dnn_DetectionModel
+    if backend == "opencv":
+        net = load_detector("opencv", weightsPath=weightsPath, configPath=configPath)
+    elif backend == "onnx":
+        net = load_detector("onnx", modelPath=onnxPath)
+    else:
+        net = load_detector(backend, modelPath=tflitePath)
+
+# ---------------------- FIREBASE HELPERS --------------------------
+# The controllers get presence changes straight away over the local bus;
+# Firebase only gets what the publisher decides to mirror (state change,
+# confidence jump or heartbeat).
+def send_detected(animal, confidence):
+    state_cache.seen(animal, confidence)
+    if bus:
+        bus.update(animal, True, confidence)
+    publisher.observe(animal, True, confidence)
+
+def send_not_detected(animal):
+    # Last-seen comes from the local cache: no RTDB read on the capture path
+    lastSeen = state_cache.last_seen(animal)
+    state_cache.gone(animal)
+    if bus:
+        bus.update(animal, False, timestamp=lastSeen)
+    publisher.observe(animal, False, timestamp=lastSeen or int(time.time()))
 
 # ---------------------- DETECTION FUNCTION ------------------------
-def getObjects(img, thres, nms, draw=True):
-    classIds, confs, bbox = net.detect(img, confThreshold=thres, nmsThreshold=nms)
-    detected_now = {"cat": False, "dog": False}
+def prepare_frame(img):
+    # Resize + blob for the detector: one for the frame, or one per bowl zone
+    if BOWL_ROIS:
+        return prepare_rois(net, img, BOWL_ROIS.values())
+    return net.prepare(img)
+
+def detect_pets(img, thres, nms, prepared=None):
+    # Run the detector and keep only cat/dog boxes as (className, confidence, box).
+    # prepared is prepare_frame(img) when the pipeline already built it.
+    if BOWL_ROIS:
+        classIds, confs, bbox = detect_in_rois(net, img, BOWL_ROIS.values(), thres, nms, prepared)
+    else:
+        classIds, confs, bbox = net.detect(img, confThreshold=thres, nmsThreshold=nms, blob=prepared)
+    hits = []
 
     if len(classIds) != 0:
         for classId, confidence, box in zip(classIds.flatten(), confs.flatten(), bbox):
-
             className = classNames[classId - 1]
-
             if className in ["cat", "dog"]:
-                detected_now[className] = True
+                hits.append((className, float(confidence), box))
 
-                if draw:
-                    # Bounding box
-                    cv2.rectangle(img, box, (0, 255, 0), 2)
+    return hits
 
-                    # Label
-                    cv2.putText(img, className.upper(), (box[0]+10, box[1]+30),
-                                cv2.FONT_HERSHEY_SIMPLEX, 1, (0,255,0), 2)
+def draw_rois(img):
+    for animal, (x, y, w, h) in (BOWL_ROIS or {}).items():
+        cv2.rectangle(img, (x, y), (x + w, y + h), (255, 255, 0), 1)
+        cv2.putText(img, f"{animal} bowl", (x + 5, y + 15),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0), 1)
 
-                    # Confidence
-                    cv2.putText(img, str(round(float(confidence)*100, 2)) + "%",
-                                (box[0]+200, box[1]+30),
-                                cv2.FONT_HERSHEY_SIMPLEX, 1, (0,255,0), 2)
+def draw_pets(img, hits):
+    for className, confidence, box in hits:
+        # Bounding box
+        cv2.rectangle(img, box, (0, 255, 0), 2)
 
-                    # Center point
-                    cx = box[0] + box[2]//2
-                    cy = box[1] + box[3]//2
-                    cv2.circle(img, (cx,cy), 5, (0,255,0), -1)
+        # Label
+        cv2.putText(img, className.upper(), (box[0]+10, box[1]+30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0,255,0), 2)
 
-                # Send detection to Firebase
-                send_detected(className, confidence)
+        # Confidence
+        cv2.putText(img, str(round(float(confidence)*100, 2)) + "%",
+                    (box[0]+200, box[1]+30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0,255,0), 2)
 
-    return img, detected_now
+        # Center point
+        cx = box[0] + box[2]//2
+        cy = box[1] + box[3]//2
+        cv2.circle(img, (cx,cy), 5, (0,255,0), -1)
 
-# --------------------------- MAIN LOOP ----------------------------
-cap = cv2.VideoCapture(0)
-cap.set(3, 640)
-cap.set(4, 480)
+def publish_hits(hits, seen=None):
+    # hits decide presence; only seen (the boxes the detector matched on
+    # this run, default all of hits) update last-seen and confidence, so a
+    # coasting track only holds presence and the overlay
+    detected_now = {"cat": False, "dog": False}
+    best = {}
 
-print("🐈🐕 Cat & Dog Detector Started (Press Q to Quit)")
+    for className, confidence, box in hits:
+        detected_now[className] = True
+    for className, confidence, box in hits if seen is None else seen:
+        best[className] = max(confidence, best.get(className, 0.0))
 
-while True:
-    success, img = cap.read()
-    if not success:
-        print("Camera not found!")
-        break
+    # Send detection to Firebase (one update per animal, best box wins)
+    for className, confidence in best.items():
+        send_detected(className, confidence)
 
-    img, detected = getObjects(img, 0.45, 0.2, draw=True)
+    return detected_now
 
+def getObjects(img, thres, nms, draw=True):
+    global last_hits
+    hits = detect_pets(img, thres, nms)
+    last_hits = hits
+    detected_now = publish_hits(hits)
+
+    if draw:
+        draw_pets(img, hits)
+
+    return img, detected_now
+
+def handle_transitions(detected):
     # --- Handle NOT detected transitions ---
     for animal in ["cat", "dog"]:
         if detected[animal]:
@@ -116,9 +237,148 @@ while True:
                 send_not_detected(animal)
             last_detect[animal] = False
 
+    if gate:
+        # Re-check more often while a pet is in view so departures are noticed
+        gate.pets_present = any(last_detect.values())
+
+def gate_allows(img):
+    # Motion or the keep-alive wakes the detector; so does high demand from a
+    # controller (confirming a pet, lid open), even on a static scene
+    moving = gate is None or gate.should_infer(img)
+    return moving or (scheduler is not None and scheduler.level == "high")
+
+def run_inference(img, moving, prepared=None):
+    # Returns (hits, seen), or None when the frame can be skipped entirely.
+    # seen is the hits the SSD matched on this frame, None when it did not run.
+    global frames_since_detect
+
+    if tracker and tracker.tracks:
+        # Pets in view: coast on the tracker between detector runs, but
+        # re-detect right away if a track missed its last run
+        if frames_since_detect < DETECT_EVERY_N - 1 and not tracker.uncertain():
+            frames_since_detect += 1
+            return tracker.predict(), None
+    elif not moving:
+        return None
+
+    if scheduler and not scheduler.ready():
+        # Too soon for another SSD run at the current demand / load
+        if tracker and tracker.tracks:
+            return tracker.predict(), None
+        return None
+
+    frames_since_detect = 0
+    if gate:
+        gate.ran()
+    hits = detect_pets(img, CONF_THRESHOLD, NMS_THRESHOLD, prepared)
+    if not tracker:
+        return hits, hits
+    return tracker.update(hits), tracker.matched()
+
+def show(img):
+    # Overlays are only drawn for a window or a connected preview client.
+    # Returns False once Q is pressed.
+    streaming = preview is not None and preview.wants_frame()
+    if HEADLESS and not streaming:
+        return True
+
+    draw_rois(img)
+    draw_pets(img, last_hits)
+    if streaming:
+        preview.submit(img)
+    if HEADLESS:
+        return True
+
     cv2.imshow("Cat & Dog Detector", img)
-    if cv2.waitKey(1) & 0xFF == ord("q"):
-        break
+    return not (cv2.waitKey(1) & 0xFF == ord("q"))
+
+# --------------------------- MAIN LOOPS ---------------------------
+def run_sequential(cap):
+    global last_hits
+    while True:
+        success, img = cap.read()
+        if not success:
+            print("Camera not found!")
+            break
+
+        result = run_inference(img, gate_allows(img))
+        if result:
+            last_hits, seen = result
+            if seen is not None:
+                handle_transitions(publish_hits(last_hits, seen))
+        # Static or tracked frame: keep the last decision, nothing to publish
+
+        if not show(img):
+            break
+
+def run_pipeline(cap):
+    # Inference runs off the capture thread; Firebase writes and the preview
+    # happen in the publish stage on the main thread
+    def preprocess(item):
+        if gate_allows(item.img):
+            item.data = prepare_frame(item.img)   # resize + blob off the inference thread
+        else:
+            item.data = None  # static scene: skip the DNN, keep the last result
+        return True
+
+    def infer(item):
+        # Tracker state is only touched from this stage's thread. A tracker
+        # re-check on a static frame prepares its own blob.
+        return run_inference(item.img, item.data is not None, item.data)
+
+    def publish(item):
+        global last_hits
+        if item.result:
+            last_hits, seen = item.result
+            if seen is not None:
+                handle_transitions(publish_hits(last_hits, seen))
+        return show(item.img)
+
+    pipeline = VisionPipeline(cap.read, infer, publish, preprocess=preprocess,
+                              queue_size=PIPELINE_QUEUE_SIZE)
+    pipeline.run()
+    print("Pipeline stats:", pipeline.stats())
+    if gate:
+        print(f"Motion gate: {gate.passed}/{gate.checked} frames sent to the detector")
+
+def main():
+    init_runtime()
+    init_firebase()
+    load_model()
+
+    cap = cv2.VideoCapture(0)
+    cap.set(3, 640)
+    cap.set(4, 480)
+
+    if preview:
+        preview.start()
+    if bus:
+        bus.start()
+
+    if HEADLESS:
+        print("🐈🐕 Cat & Dog Detector Started headless (Ctrl+C to Quit)")
+    else:
+        print("🐈🐕 Cat & Dog Detector Started (Press Q to Quit)")
+
+    try:
+        if PIPELINE_MODE:
+            run_pipeline(cap)
+        else:
+            run_sequential(cap)
+    except KeyboardInterrupt:
+        print("Exiting.")
+    finally:
+        cap.release()
+        publisher.close()
+        outbox.close()
+        state_cache.save(force=True)
+        if bus:
+            bus.close()
+        if preview:
+            preview.stop()
+        if not HEADLESS:
+            cv2.destroyAllWindows()
+
 
-cap.release()
-cv2.destroyAllWindows()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+# Local publish/subscribe channel from camera.py to the feeder controllers
+#
+# The camera and both controllers run on the same Pi, so detections are
+# pushed straight over a Unix domain socket as JSON lines instead of making a
+# round trip through Firebase RTDB. Firebase stays as the (asynchronous)
+# mirror for the web app. Messages:
+#   {"type": "detection", "animal": "cat", "detected": true, "confidence": 87.5, "timestamp": 1700000000}
+#   {"type": "heartbeat", "ts": 1700000000.0}
+# Every new subscriber first gets the current state of every animal.
+import json
+import os
+import socket
+import threading
+import time
+
+BUS_PATH = "/tmp/snackloader/detections.sock"
+HEARTBEAT_S = 2.0
+STALE_AFTER_S = 3 * HEARTBEAT_S   # subscriber falls back to RTDB after this much silence
+
+
+def encode(msg):
+    return (json.dumps(msg, separators=(",", ":")) + "\n").encode()
+
+
+# ----------------- CAMERA SIDE -----------------
+class DetectionBusServer:
+    def __init__(self, path=BUS_PATH, animals=("cat", "dog")):
+        self.path = path
+        self.state = {a: {"type": "detection", "animal": a, "detected": False,
+                          "confidence": 0, "timestamp": 0} for a in animals}
+        self.clients = []
+        self.sent = 0
+        self._lock = threading.Lock()
+        self._sock = None
+        self._closed = False
+
+    def start(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)   # left behind by a previous run
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.path)
+        self._sock.listen(8)
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        threading.Thread(target=self._heartbeat_loop, daemon=True).start()
+
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                break
+            conn.settimeout(0.5)   # a stuck controller must not stall the camera
+            with self._lock:
+                snapshot = b"".join(encode(msg) for msg in self.state.values())
+                if self._send(conn, snapshot):
+                    self.clients.append(conn)
+
+    def _heartbeat_loop(self):
+        while not self._closed:
+            time.sleep(HEARTBEAT_S)
+            self._broadcast({"type": "heartbeat", "ts": time.time()})
+
+    def _send(self, conn, data):
+        try:
+            conn.sendall(data)
+            return True
+        except OSError:
+            conn.close()
+            return False
+
+    def _broadcast(self, msg):
+        data = encode(msg)
+        with self._lock:
+            self.clients = [c for c in self.clients if self._send(c, data)]
+            self.sent += 1
+
+    def update(self, animal, detected, confidence=0.0, timestamp=None):
+        # Only presence changes are pushed; heartbeats cover liveness
+        msg = {
+            "type": "detection",
+            "animal": animal,
+            "detected": bool(detected),
+            "confidence": float(round(float(confidence) * 100, 2)) if detected else 0,
+            "timestamp": int(timestamp or time.time()),
+        }
+        changed = self.state[animal]["detected"] != msg["detected"]
+        self.state[animal] = msg
+        if changed:
+            self._broadcast(msg)
+
+    def close(self):
+        self._closed = True
+        with self._lock:
+            for conn in self.clients:
+                conn.close()
+            self.clients = []
+        if self._sock:
+            self._sock.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+# ----------------- CONTROLLER SIDE -----------------
+class DetectionBusClient:
+    def __init__(self, path=BUS_PATH, wake=None):
+        self.path = path
+        self.state = {}            # animal -> last detection message
+        self.last_msg_ts = 0.0
+        self._changed = wake or threading.Event()   # may be shared with other sources
+        threading.Thread(target=self._run, daemon=True).start()
+
+    @property
+    def connected(self):
+        return (time.time() - self.last_msg_ts) < STALE_AFTER_S
+
+    def detection(self):
+        # Same shape as detectionStatus in RTDB, or None while the bus is down
+        if not self.connected:
+            return None
+        return {animal: dict(msg) for animal, msg in self.state.items()}
+
+    def wait(self, timeout):
+        # Sleep until a detection changes (or timeout); returns True on change
+        changed = self._changed.wait(timeout)
+        self._changed.clear()
+        return changed
+
+    def _run(self):
+        backoff = 0.5
+        while True:
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                    sock.connect(self.path)
+                    print("Detection bus connected")
+                    backoff = 0.5
+                    self._read(sock)
+            except OSError:
+                pass
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 5.0)
+
+    def _read(self, sock):
+        sock.settimeout(STALE_AFTER_S)
+        buf = b""
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                return
+            buf += chunk
+            *lines, buf = buf.split(b"\n")
+            for line in lines:
+                try:
+                    msg = json.loads(line)
+                except ValueError:
+                    continue
+                self.last_msg_ts = time.time()
+                if msg.get("type") == "detection":
+                    self.state[msg["animal"]] = msg
+                    self._changed.set()
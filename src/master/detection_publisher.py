@@ -0,0 +1,122 @@
+# Coalescing, rate-limited publisher for detectionStatus
+#
+# camera.py reports what it sees on every detector run; this keeps the latest
+# state per animal locally and a background thread sends it to Firebase only
+# when something meaningful changed:
+#   - detected flipped (sent straight away)
+#   - confidence moved by more than conf_delta percentage points
+#   - heartbeat_s passed since the last write (refreshes the timestamp)
+# All pending animals go out together as one multi-path update on
+# detectionStatus, so the network never sits on the inference path.
+import threading
+import time
+
+
+class DetectionPublisher:
+    def __init__(self, ref, animals=("cat", "dog"), heartbeat_s=30.0,
+                 conf_delta=10.0, min_interval=0.5, clock=time):
+        self.ref = ref
+        self.clock = clock                # anything with .time(); bench_vision replays footage time
+        self.heartbeat_s = heartbeat_s
+        self.conf_delta = conf_delta      # percentage points
+        self.min_interval = min_interval  # floor between writes for confidence-only changes
+
+        self.state = {a: {"confidence": 0, "detected": False, "timestamp": 0} for a in animals}
+        self.sent = {a: None for a in animals}
+        self.dirty = set()
+        self.urgent = False
+        self.writes = 0
+        self.errors = 0
+        self._last_write_ts = 0.0
+
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # ----------------- PRODUCER SIDE (never blocks on the network) -----------------
+    def observe(self, animal, detected, confidence=0.0, timestamp=None):
+        conf = float(round(float(confidence) * 100, 2)) if detected else 0
+        entry = {
+            "confidence": conf,
+            "detected": bool(detected),
+            "timestamp": int(timestamp or self.clock.time()),
+        }
+
+        with self._cond:
+            self.state[animal] = entry
+            last = self.sent[animal]
+            if last is None or last["detected"] != entry["detected"]:
+                self.dirty.add(animal)
+                self.urgent = True
+                self._cond.notify()
+            elif abs(last["confidence"] - entry["confidence"]) >= self.conf_delta:
+                self.dirty.add(animal)
+                self._cond.notify()
+
+    # ----------------- WORKER -----------------
+    def _seen(self):
+        # Heartbeats only repeat what was already published, never the defaults
+        return [a for a, entry in self.sent.items() if entry is not None]
+
+    def _due(self, now):
+        if self.urgent:
+            return True
+        if self.dirty and now - self._last_write_ts >= self.min_interval:
+            return True
+        return bool(self._seen()) and now - self._last_write_ts >= self.heartbeat_s
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and not self._due(self.clock.time()):
+                    if self.dirty:
+                        wait = self.min_interval - (self.clock.time() - self._last_write_ts)
+                    else:
+                        wait = self.heartbeat_s - (self.clock.time() - self._last_write_ts)
+                    self._cond.wait(max(wait, 0.01))
+                if self._closed and not self.dirty:
+                    return
+
+                # Heartbeats resend everything; otherwise only what changed
+                animals = set(self.dirty) if self.dirty else set(self._seen())
+                payload = {a: dict(self.state[a]) for a in animals}
+                # Count the write as sent while it is in flight so observe()
+                # compares against it and doesn't re-queue the same change
+                previous = {a: self.sent[a] for a in animals}
+                self.sent.update(payload)
+                self.dirty.clear()
+                self.urgent = False
+                self._last_write_ts = self.clock.time()
+
+            try:
+                self.ref.update(payload)
+            except Exception as e:
+                print("Detection publish error:", e)
+                self.errors += 1
+                with self._cond:
+                    self.sent.update(previous)
+                    self.dirty.update(animals)
+                    self.urgent = True
+                time.sleep(1.0)
+                continue
+
+            self.writes += 1
+            for animal, entry in payload.items():
+                last = previous[animal]
+                if last is None or last["detected"] != entry["detected"]:
+                    mark = "✔" if entry["detected"] else "✘"
+                    word = f"detected — {entry['confidence']}%" if entry["detected"] else "not detected"
+                    print(f"{mark} {animal.upper()} {word}")
+
+    def wake(self):
+        # The clock moved without wall time passing (a replay): re-check
+        # heartbeat and min_interval now instead of after the real wait
+        with self._cond:
+            self._cond.notify()
+
+    def close(self, timeout=5.0):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
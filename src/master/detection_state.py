@@ -0,0 +1,75 @@
+# Local last-seen cache for camera.py
+#
+# Keeps, per animal, when it was last seen, with what confidence and whether
+# it is currently reported as present. send_not_detected() takes the
+# last-seen timestamp from here instead of reading it back from RTDB, and the
+# file on disk lets a restarted camera pick up where it left off (including
+# clearing a "detected" flag left behind by a crash).
+import json
+import os
+import time
+
+
+class DetectionStateCache:
+    def __init__(self, path, animals=("cat", "dog"), save_interval=30.0):
+        self.path = path
+        self.save_interval = save_interval   # floor between routine saves (SD card wear)
+        self.state = {a: {"detected": False, "confidence": 0.0, "last_seen": None} for a in animals}
+        self._dirty = False
+        self._last_save_ts = 0.0
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "rt") as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print("Detection state load error:", e)
+            return
+
+        for animal, entry in saved.items():
+            if animal in self.state and isinstance(entry, dict):
+                self.state[animal].update(entry)
+
+    def save(self, force=False):
+        now = time.time()
+        if not self._dirty or (not force and now - self._last_save_ts < self.save_interval):
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "wt") as f:
+                json.dump(self.state, f)
+            os.replace(tmp, self.path)
+            self._dirty = False
+            self._last_save_ts = now
+        except OSError as e:
+            print("Detection state save error:", e)
+
+    def seen(self, animal, confidence, timestamp=None):
+        entry = self.state[animal]
+        entry["confidence"] = float(confidence)
+        entry["last_seen"] = int(timestamp or time.time())
+        if not entry["detected"]:
+            entry["detected"] = True
+            self._dirty = True
+            self.save(force=True)
+        else:
+            self._dirty = True
+            self.save()
+
+    def gone(self, animal):
+        entry = self.state[animal]
+        if entry["detected"]:
+            entry["detected"] = False
+            entry["confidence"] = 0.0
+            self._dirty = True
+            self.save(force=True)
+
+    def last_seen(self, animal):
+        return self.state[animal]["last_seen"]
+
+    def detected(self, animal):
+        return bool(self.state[animal]["detected"])
@@ -0,0 +1,243 @@
+# Swappable detector backends for camera.py
+#
+# Every backend exposes detect(img, confThreshold, nmsThreshold) and returns
+# the same (classIds, confs, bbox) triple as cv2.dnn_DetectionModel.detect(),
+# so getObjects() does not care which one is loaded. prepare(img) does the
+# resize / blob step on its own, so camera.py's preprocess stage can run it
+# off the inference thread and hand the result to detect(..., blob=blob):
+#   classIds  Nx1 int32    1-based ids, so classNames[classId - 1] still works
+#   confs     Nx1 float32
+#   bbox      Nx4 int32    (x, y, w, h) in pixels of the image passed in
+#
+# onnxruntime and tflite_runtime are optional; they are only imported when
+# their backend is selected.
+import cv2
+import numpy as np
+
+
+# ----------------- SHARED HELPERS -----------------
+def empty_result():
+    return (np.zeros((0, 1), np.int32), np.zeros((0, 1), np.float32),
+            np.zeros((0, 4), np.int32))
+
+def prepare_input(img, size, dtype, quant=None, nchw=False):
+    # Resize + BGR->RGB, then match whatever the model's input tensor expects:
+    # raw uint8 pixels, [-1, 1] floats, or int8/uint8 quantized [-1, 1] floats.
+    rgb = cv2.cvtColor(cv2.resize(img, size), cv2.COLOR_BGR2RGB)
+
+    if dtype == np.uint8 and not quant:
+        blob = rgb
+    else:
+        blob = (rgb.astype(np.float32) - 127.5) / 127.5
+        if quant:
+            scale, zero_point = quant
+            info = np.iinfo(dtype)
+            blob = np.clip(np.round(blob / scale + zero_point), info.min, info.max)
+        blob = blob.astype(dtype)
+
+    if nchw:
+        blob = blob.transpose(2, 0, 1)
+    return blob[np.newaxis, ...]
+
+def decode_ssd(img_shape, boxes, classes, scores, confThreshold, nmsThreshold, class_offset=0):
+    # boxes are normalized [ymin, xmin, ymax, xmax] as produced by TF SSD exports
+    boxes = np.asarray(boxes, np.float32).reshape(-1, 4)
+    classes = np.asarray(classes).reshape(-1).astype(np.int32) + class_offset
+    scores = np.asarray(scores, np.float32).reshape(-1)
+
+    keep = scores >= confThreshold
+    if not np.any(keep):
+        return empty_result()
+    boxes, classes, scores = boxes[keep], classes[keep], scores[keep]
+
+    h, w = img_shape[:2]
+    x1 = np.clip(boxes[:, 1] * w, 0, w - 1)
+    y1 = np.clip(boxes[:, 0] * h, 0, h - 1)
+    x2 = np.clip(boxes[:, 3] * w, 0, w - 1)
+    y2 = np.clip(boxes[:, 2] * h, 0, h - 1)
+    rects = np.stack([x1, y1, x2 - x1, y2 - y1], axis=1).astype(np.int32)
+
+    return nms_per_class(classes, scores, rects, confThreshold, nmsThreshold)
+
+def nms_per_class(classes, scores, rects, confThreshold, nmsThreshold):
+    # Per-class NMS, same as cv2.dnn_DetectionModel's default
+    classes = np.asarray(classes, np.int32).reshape(-1)
+    scores = np.asarray(scores, np.float32).reshape(-1)
+    rects = np.asarray(rects, np.int32).reshape(-1, 4)
+
+    if nmsThreshold > 0 and len(classes):
+        picked = []
+        for cls in np.unique(classes):
+            idx = np.flatnonzero(classes == cls)
+            kept = cv2.dnn.NMSBoxes(rects[idx].tolist(), scores[idx].tolist(),
+                                    confThreshold, nmsThreshold)
+            picked.extend(idx[np.array(kept, np.int32).reshape(-1)])
+        picked = np.array(sorted(picked), np.int32)
+        rects, classes, scores = rects[picked], classes[picked], scores[picked]
+
+    return classes.reshape(-1, 1), scores.reshape(-1, 1), rects
+
+
+# ----------------- OPENCV DNN (default) -----------------
+class OpenCVDnnDetector:
+    """
+    The original frozen_inference_graph.pb + .pbtxt pair run through cv2.dnn.
+    Same input scaling as the old dnn_DetectionModel setup; the raw net is
+    used so the blob can be built in a separate stage.
+    """
+
+    def __init__(self, weightsPath, configPath, input_size=(320, 320)):
+        self.net = cv2.dnn.readNetFromTensorflow(weightsPath, configPath)
+        self.input_size = input_size
+
+    def prepare(self, img):
+        return cv2.dnn.blobFromImage(img, 1.0 / 127.5, self.input_size,
+                                     (127.5, 127.5, 127.5), swapRB=True)
+
+    def detect(self, img, confThreshold=0.5, nmsThreshold=0.0, blob=None):
+        self.net.setInput(self.prepare(img) if blob is None else blob)
+        # DetectionOutput rows: [image, classId, score, x1, y1, x2, y2], normalized
+        out = self.net.forward().reshape(-1, 7)
+        return decode_ssd(img.shape, out[:, [4, 3, 6, 5]], out[:, 1], out[:, 2],
+                          confThreshold, nmsThreshold)
+
+
+# ----------------- ONNX RUNTIME (CPU) -----------------
+class OnnxRuntimeDetector:
+    """
+    SSD exported to ONNX (e.g. with tf2onnx), float32 or int8-quantized.
+    Expects TF-style outputs: detection_boxes / detection_classes / detection_scores.
+    TF exports use 1-based class ids already, hence class_offset=0.
+    """
+
+    def __init__(self, modelPath, input_size=(320, 320), threads=4, class_offset=0):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("onnx backend needs onnxruntime (pip install onnxruntime)")
+
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = threads
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(modelPath, opts, providers=["CPUExecutionProvider"])
+
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        self.input_dtype = np.uint8 if inp.type == "tensor(uint8)" else np.float32
+        self.nchw = len(inp.shape) == 4 and inp.shape[1] == 3
+        self.input_size = input_size
+        self.class_offset = class_offset
+
+        names = [o.name for o in self.session.get_outputs()]
+        self.outputs = [self._find(names, key) for key in ("boxes", "classes", "scores")]
+
+    @staticmethod
+    def _find(names, key):
+        for name in names:
+            if key in name:
+                return name
+        raise ValueError(f"ONNX model has no '{key}' output (outputs: {names})")
+
+    def prepare(self, img):
+        return prepare_input(img, self.input_size, self.input_dtype, nchw=self.nchw)
+
+    def detect(self, img, confThreshold=0.5, nmsThreshold=0.0, blob=None):
+        if blob is None:
+            blob = self.prepare(img)
+        boxes, classes, scores = self.session.run(self.outputs, {self.input_name: blob})
+        return decode_ssd(img.shape, boxes, classes, scores,
+                          confThreshold, nmsThreshold, self.class_offset)
+
+
+# ----------------- TFLITE (int8 quantized) -----------------
+class TFLiteDetector:
+    """
+    SSD .tflite with the TFLite_Detection_PostProcess head (outputs boxes,
+    classes, scores, count, in whatever order the export chose). Quantized
+    uint8/int8 inputs are handled from the tensor's own scale/zero-point.
+    Class ids come out 0-based, hence class_offset=1.
+    """
+
+    def __init__(self, modelPath, threads=4, class_offset=1):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            try:
+                from tensorflow.lite import Interpreter
+            except ImportError:
+                raise ImportError("tflite backend needs tflite-runtime (pip install tflite-runtime)")
+
+        self.interpreter = Interpreter(model_path=modelPath, num_threads=threads)
+        self.interpreter.allocate_tensors()
+
+        inp = self.interpreter.get_input_details()[0]
+        self.input_index = inp["index"]
+        self.input_dtype = inp["dtype"]
+        self.input_size = (int(inp["shape"][2]), int(inp["shape"][1]))
+        scale, zero_point = inp.get("quantization", (0.0, 0))
+        # uint8 SSD exports expect raw pixels; only requantize int8 inputs
+        self.quant = (scale, zero_point) if scale and self.input_dtype == np.int8 else None
+
+        self.output_index = self._map_outputs(self.interpreter.get_output_details())
+        self.class_offset = class_offset
+
+    @staticmethod
+    def _map_outputs(details):
+        # TF1 exports list boxes/classes/scores/count, TF2 exports shuffle them
+        # (and name them StatefulPartitionedCall:N). Boxes are the [1, N, 4]
+        # tensor; classes vs scores come from the name when it says so,
+        # otherwise from the values on the first run (see _resolve).
+        boxes = [o for o in details if len(o["shape"]) == 3 and o["shape"][-1] == 4]
+        per_box = [o for o in details if len(o["shape"]) == 2]
+        if len(boxes) != 1 or len(per_box) != 2:
+            raise ValueError("tflite model is not an SSD postprocess head "
+                             f"(outputs: {[(o['name'], list(o['shape'])) for o in details]})")
+        named = {}
+        for o in per_box:
+            for key in ("class", "score"):
+                if key in o["name"].lower():
+                    named[key] = o["index"]
+        if len(named) == 2:
+            return [boxes[0]["index"], named["class"], named["score"]]
+        return [boxes[0]["index"], None, [o["index"] for o in per_box]]
+
+    def _resolve(self, a, b):
+        # Scores are fractions, class ids whole numbers; decide once
+        if not np.all(np.mod(a, 1) == 0):
+            a, b = b, a
+            self.output_index[1:] = [self.output_index[2][1], self.output_index[2][0]]
+        elif np.all(np.mod(b, 1) == 0):
+            return a, b             # both whole (nothing detected yet), ask again next run
+        else:
+            self.output_index[1:] = list(self.output_index[2])
+        return a, b
+
+    def prepare(self, img):
+        return prepare_input(img, self.input_size, self.input_dtype, self.quant)
+
+    def detect(self, img, confThreshold=0.5, nmsThreshold=0.0, blob=None):
+        if blob is None:
+            blob = self.prepare(img)
+        self.interpreter.set_tensor(self.input_index, blob)
+        self.interpreter.invoke()
+        if self.output_index[1] is None:
+            boxes = self.interpreter.get_tensor(self.output_index[0])
+            classes, scores = self._resolve(*[self.interpreter.get_tensor(i)
+                                              for i in self.output_index[2]])
+        else:
+            boxes, classes, scores = [self.interpreter.get_tensor(i) for i in self.output_index]
+        return decode_ssd(img.shape, boxes, classes, scores,
+                          confThreshold, nmsThreshold, self.class_offset)
+
+
+# ----------------- FACTORY -----------------
+BACKENDS = {
+    "opencv": OpenCVDnnDetector,
+    "onnx": OnnxRuntimeDetector,
+    "tflite": TFLiteDetector,
+}
+
+def load_detector(backend, **kwargs):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown detector backend '{backend}' (choose from {sorted(BACKENDS)})")
+    return BACKENDS[backend](**kwargs)
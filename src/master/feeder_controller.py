@@ -0,0 +1,438 @@
+# feeder_controller.py
+# One process for every feeder: each entry in FEEDERS gets its own serial
+# port, RTDB paths and lid FSM, while the Firebase app, the detection
+# subscription and the dispenser streams are shared between them.
+import os
+import queue
+import threading
+from firebase_admin import db
+
+from detection_bus import DetectionBusClient
+from firebase_setup import init_app
+from fsm_engine import StateMachine, TimerHeap
+from inference_scheduler import publish_demand
+from rtdb_outbox import RtdbOutbox
+from rtdb_watch import RtdbWatch
+from serial_link import SerialLink
+from sim_clock import default_clock
+from telemetry import TelemetryUploader
+from timeseries_store import TimeSeriesStore, rtdb_rollup_publisher
+
+# ----------------- CONFIG -----------------
+SERVICE_ACCOUNT = "/home/eutech/serviceAccountKey.json"
+RTDB_URL = "https://snackloader-default-rtdb.asia-southeast1.firebasedatabase.app/"
+TIMESERIES_DB = "/home/eutech/.snackloader/timeseries.db"   # shared with temperature.py
+# One outbox per process: the cat and dog wrappers must not share a queue
+OUTBOX_DB = "/home/eutech/.snackloader/outbox-{}.db"   # "feeders" when one process runs them all
+
+BAUD = 9600
+FAST_BAUD = 115200   # binary frames once the Arduino is up; None keeps the text protocol
+POLL_INTERVAL = 0.2  # seconds; RTDB poll rate while a stream is down
+IDLE_TICK = 1.0      # seconds; re-check which detection source is live when no event arrives
+
+CONFIRM_SECONDS = 5          # owner must be seen this long before the lid opens
+FEED_WINDOW = 600            # 10 minute feeding window, extended while the owner is seen
+INTRUDER_GRACE = 5           # owner missing this long while an intruder is present -> close
+INTRUDER_CLOSE_DELAY = 2     # warning time before the lid closes on an intruder
+LID_TIMEOUT = 10             # seconds for a lid move to report FIN
+DISPENSE_TIMEOUT = 180       # seconds for a dispense to reach its target
+
+WEIGHT_DEADBAND = 1.0        # grams; smaller LIVE changes are not uploaded
+WEIGHT_MIN_INTERVAL = 1.0    # seconds between bowl-weight uploads
+WEIGHT_MAX_INTERVAL = 30.0   # refresh the bowl weight at least this often
+
+# Scaled by SNACKLOADER_TIME_SCALE when running against arduino_emulator.py
+clock = default_clock()
+
+# Add a dict here to drive another feeder from the same process.
+# SNACKLOADER_<PET>_PORT overrides the port (e.g. an emulator pty).
+FEEDERS = [
+    {
+        "pet": "cat",
+        "port": "/dev/ttyUSB0",
+        "dispenser_path": "dispenser/cat",
+        "weight_path": "petfeeder/cat/bowlWeight",
+        "owner": "cat",
+        "intruders": ["dog"],
+    },
+    {
+        "pet": "dog",
+        "port": "/dev/ttyACM0",
+        "dispenser_path": "dispenser/dog",
+        "weight_path": "petfeeder/dog/bowlWeight",
+        "owner": "dog",
+        "intruders": ["cat"],
+    },
+]
+
+
+# Lid FSM: (state, event) -> Feeder handler name. Timers started on entering
+# a state are cancelled when it is left, so there is nothing to poll.
+LID_FSM = {
+    ("IDLE", "owner_seen"): "start_confirming",
+    ("CONFIRMING", "owner_gone"): "cancel_confirming",
+    ("CONFIRMING", "confirmed"): "open_for_owner",
+    ("OPEN", "owner_seen"): "hold_window",
+    ("OPEN", "owner_gone"): "start_window",
+    ("OPEN", "intruder_seen"): "check_intruder",
+    ("OPEN", "intruder_check"): "check_intruder",
+    ("OPEN", "dispense_done"): "check_intruder",
+    ("OPEN", "window_expired"): "close_window",
+    ("OPEN", "intruder_close"): "close_on_intruder",
+    ("OPEN", "arduino_reset"): "reopen_after_reset",
+    ("*", "feed_request"): "start_feed",
+}
+LID_FSM_ENTER = {"CONFIRMING": "enter_confirming", "OPEN": "enter_open"}
+LID_FSM_EXIT = {"OPEN": "exit_open"}
+
+
+# ----------------- FEEDER -----------------
+class Feeder:
+    def __init__(self, config, outbox, timers, wake=None, history=None):
+        self.pet = config["pet"]
+        self.port = os.environ.get(f"SNACKLOADER_{self.pet.upper()}_PORT", config["port"])
+        self.dispenser_path = config["dispenser_path"]
+        self.owner = config["owner"]
+        self.intruders = config["intruders"]
+        self.tag = self.pet.upper()
+
+        # Writes go through the outbox so the FSM never waits on the network
+        self.dispenser_ref = outbox.reference(config["dispenser_path"])
+        self.wake = wake or threading.Event()   # tells the main loop a message arrived
+        self.history = history                  # TimeSeriesStore, keeps every weight sample
+        self.weight_series = config["weight_path"].partition("/")[2]   # "cat/bowlWeight"
+        self.telemetry = TelemetryUploader(outbox.reference(config["weight_path"]), self.tag,
+                                           WEIGHT_DEADBAND, WEIGHT_MIN_INTERVAL,
+                                           WEIGHT_MAX_INTERVAL)
+        self.link = SerialLink(self.port, BAUD, self.tag, fast_baud=FAST_BAUD)
+        self.link.on("LIVE", self.on_live)
+        self.link.on("WEIGHT", self.on_weight)
+        self.link.on("READY", self.on_ready)
+        self.link.on_reopen(self.on_reopen)
+        self.inbox = queue.SimpleQueue()        # command results for the main loop
+
+        # ----- STATE -----
+        self.last_run_state = False
+        self.feed_request = None        # the {run, amount} being served, guards the run reset
+        self.is_dispensing = False
+        self.lid_open = None            # None: unknown (startup, port reopened) until forced closed
+
+        # FSM & presence state
+        self.fsm = StateMachine(
+            self.tag,
+            {key: getattr(self, name) for key, name in LID_FSM.items()},
+            "IDLE",                     # IDLE, CONFIRMING, OPEN
+            timers,
+            on_enter={state: getattr(self, name) for state, name in LID_FSM_ENTER.items()},
+            on_exit={state: getattr(self, name) for state, name in LID_FSM_EXIT.items()},
+        )
+        self.owner_present = False
+        self.intruder_present = False
+        self.last_owner_seen_ts = 0     # Tracks exactly when the owner was last seen
+        self.closing_on_intruder = False
+
+    @property
+    def fsm_state(self):
+        return self.fsm.state
+
+    # ----------------- SERIAL -----------------
+    def open_serial(self):
+        self.link.open()
+
+    def send_serial(self, cmd: str, then=None, timeout=LID_TIMEOUT):
+        # Acknowledged command; then(command) runs on the main loop once the
+        # Arduino reports FIN (or the command failed)
+        on_done = (lambda command: self.post(lambda: then(command))) if then else None
+        command = self.link.request(cmd, on_done, timeout)
+        print(f"[{self.tag}][SEND]", f"#{command.seq}", cmd)
+        return command
+
+    def post(self, action):
+        # From the reader thread: run action on the main loop
+        self.inbox.put(action)
+        self.wake.set()
+
+    def run_posted(self):
+        while True:
+            try:
+                action = self.inbox.get_nowait()
+            except queue.Empty:
+                return
+            action()
+
+    # ----------------- FIREBASE HELPERS -----------------
+    def set_status(self, status: str):
+        self.dispenser_ref.update({"status": status})
+
+    # ----------------- ARDUINO MESSAGES -----------------
+    # Called from the SerialLink reader thread, one framed line at a time.
+    # Nothing here waits on Firebase: weights go to the telemetry queue and
+    # command results are handed to the main loop.
+    def on_live(self, msg):
+        live_weight = msg.number()
+        if live_weight is not None:
+            self.telemetry.push(live_weight, msg.ts)
+            if self.history:
+                self.history.record(self.weight_series, live_weight, msg.ts)
+
+    def on_weight(self, msg):
+        final_w = msg.number()
+        if final_w is not None:
+            self.telemetry.push(final_w, msg.ts, final=True)
+            if self.history:
+                self.history.record(self.weight_series, final_w, msg.ts)
+
+    def on_ready(self, msg):
+        self.post(self.recover_lid)
+
+    def on_reopen(self):
+        # Reopening the port resets the Uno; the lid is wherever it was left
+        self.post(self.forget_lid)
+
+    def forget_lid(self):
+        self.lid_open = None
+
+    def recover_lid(self):
+        # READY means the Uno rebooted and now counts the lid as closed,
+        # wherever it really is; only a forced close puts the two back in step
+        if self.lid_open is False:
+            return
+        state = "open" if self.lid_open else "in an unknown state"
+        print(f"[{self.tag}] Arduino reset with the lid {state}, forcing it closed")
+        self.send_serial("FORCE_CLOSE_LID")
+        self.lid_open = False
+        self.fsm.dispatch("arduino_reset")
+
+    # ----------------- PRESENCE EVENTS -----------------
+    def on_detection(self, det):
+        # Turn the latest detection snapshot into owner/intruder edge events
+        now = self.fsm.now()
+        owner = bool((det.get(self.owner, {}) or {}).get("detected", False))
+        intruder = any(bool((det.get(pet, {}) or {}).get("detected", False))
+                       for pet in self.intruders)
+
+        if owner or self.owner_present:
+            self.last_owner_seen_ts = now
+        if owner != self.owner_present:
+            self.owner_present = owner
+            self.fsm.dispatch("owner_seen" if owner else "owner_gone")
+        if intruder != self.intruder_present:
+            self.intruder_present = intruder
+            self.fsm.dispatch("intruder_seen" if intruder else "intruder_gone")
+
+    # ----------------- LID FSM -----------------
+    def open_lid(self, then=None):
+        self.send_serial("OPEN_LID", then)
+        self.lid_open = True
+
+    def close_lid(self):
+        self.send_serial("CLOSE_LID")
+        self.lid_open = False
+
+    def start_confirming(self, fsm):
+        print(f"[{self.tag}] {self.owner.capitalize()} spotted... checking {CONFIRM_SECONDS}s confirmation.")
+        return "CONFIRMING"
+
+    def enter_confirming(self, fsm):
+        fsm.start_timer("confirm", CONFIRM_SECONDS, "confirmed")
+
+    def cancel_confirming(self, fsm):
+        return "IDLE"
+
+    def open_for_owner(self, fsm):
+        print(f"[{self.tag}] {self.owner.capitalize()} confirmed ({CONFIRM_SECONDS}s) -> open lid")
+        self.open_lid()
+        return "OPEN"
+
+    def enter_open(self, fsm):
+        # The feeding window only runs down while the owner is away
+        if not self.owner_present:
+            fsm.start_timer("window", FEED_WINDOW, "window_expired")
+        self.check_intruder(fsm)
+
+    def exit_open(self, fsm):
+        self.closing_on_intruder = False
+
+    def hold_window(self, fsm):
+        fsm.cancel_timer("window")
+
+    def start_window(self, fsm):
+        fsm.start_timer("window", FEED_WINDOW, "window_expired")
+        self.check_intruder(fsm)
+
+    def close_window(self, fsm):
+        print(f"[{self.tag}] Feeding window expired. Closing lid.")
+        self.close_lid()
+        return "IDLE"
+
+    # --- SMART OVERRIDE LOGIC ---
+    # If an intruder is here and the lid is open, but the owner hasn't been seen for 5 seconds
+    def check_intruder(self, fsm):
+        if not self.intruder_present or self.owner_present:
+            return
+        if self.is_dispensing or self.closing_on_intruder:
+            return
+        missing = fsm.now() - self.last_owner_seen_ts
+        if missing >= INTRUDER_GRACE:
+            print(f"[{self.tag}] !!! Intruder detected AND {self.owner} is missing > {INTRUDER_GRACE}s. "
+                  f"Closing in {INTRUDER_CLOSE_DELAY}s...")
+            self.closing_on_intruder = True
+            fsm.start_timer("intruder_close", INTRUDER_CLOSE_DELAY, "intruder_close")
+        else:
+            fsm.start_timer("intruder_grace", INTRUDER_GRACE - missing, "intruder_check")
+
+    def reopen_after_reset(self, fsm):
+        # The lid was forced shut; confirm the owner again before reopening
+        return "CONFIRMING" if self.owner_present else "IDLE"
+
+    def close_on_intruder(self, fsm):
+        self.closing_on_intruder = False
+        if not self.is_dispensing:
+            self.close_lid()
+            return "IDLE"
+
+    # ----------------- MANUAL FEED REQUEST -----------------
+    def handle_feed_request(self, node):
+        run = bool(node.get("run", False))
+        amount = float(node.get("amount", 0) or 0)
+
+        if run and not self.last_run_state:
+            self.feed_request = {"run": True, "amount": node.get("amount")}
+            self.fsm.dispatch("feed_request", amount=amount)
+
+        self.last_run_state = run
+
+    def start_feed(self, fsm, amount):
+        print(f"[{self.tag}] FEED REQUEST RECEIVED: {amount}g")
+        self.set_status("starting")
+        self.is_dispensing = True
+        if self.lid_open:
+            self.dispense(amount)
+            return None
+        # Dispense as soon as the Arduino reports the lid open
+        self.open_lid(lambda command: self.dispense(amount) if command.ok
+                      else self.finish_dispense(command))
+        return "OPEN"
+
+    def dispense(self, amount):
+        self.send_serial(f"DISPENSE {amount}", self.finish_dispense, DISPENSE_TIMEOUT)
+
+    def finish_dispense(self, command):
+        self.is_dispensing = False
+        if command.ok:
+            print(f"[{self.tag}] {command.cmd} finished in {command.duration:.1f}s "
+                  f"(ACK {command.ack_rtt * 1000:.0f} ms)")
+            status = "completed"
+        else:
+            # STOPPED, or the Arduino never confirmed the command
+            status = "stopped" if command.result == "STOPPED" else "error"
+        # Only reset run if it still holds the request just served: if the
+        # write sits in the outbox through an outage, a newer request wins
+        self.dispenser_ref.update({"status": status, "run": False}, expect=self.feed_request)
+        self.feed_request = None
+        self.fsm.dispatch("dispense_done")
+
+    # ----------------- CAMERA DEMAND -----------------
+    def publish_demand(self):
+        # Full-rate detection while confirming or while the bowl is exposed
+        if self.fsm_state == "CONFIRMING" or self.lid_open or self.is_dispensing:
+            publish_demand(self.pet, "high")
+        else:
+            publish_demand(self.pet, "low")
+
+
+# ----------------- SHARED RTDB STREAMS -----------------
+def watch_dispensers(feeders, wake):
+    # One stream per parent node ("dispenser") instead of one per feeder
+    watches = {}
+    for f in feeders:
+        parent = f.dispenser_path.rpartition("/")[0]
+        if parent not in watches:
+            watches[parent] = RtdbWatch(db.reference(parent), wake, POLL_INTERVAL)
+    return watches
+
+def read_dispensers(feeders, watches):
+    nodes = {}
+    for f in feeders:
+        parent, _, key = f.dispenser_path.rpartition("/")
+        data = watches[parent].get() or {}
+        nodes[f.pet] = data.get(key, {}) or {}
+    return nodes
+
+
+# ----------------- MAIN LOOP -----------------
+def rtdb_loop(feeders, bus, det_watch, dispenser_watches, wake, timers):
+    # No network reads in here: every input is a local mirror that the bus or
+    # an RTDB stream keeps current, and they set `wake` when something changes.
+    # Between those wake-ups the loop sleeps until the next FSM timer is due.
+    while True:
+        # read detection states (local bus first, RTDB stream if the camera is unreachable)
+        det = bus.detection()
+        if det is None:
+            det = det_watch.get() or {}
+
+        for f in feeders:
+            f.on_detection(det)
+            f.run_posted()
+
+        nodes = read_dispensers(feeders, dispenser_watches)
+        for f in feeders:
+            f.handle_feed_request(nodes.get(f.pet, {}))
+
+        timers.run_due()
+        for f in feeders:
+            f.publish_demand()
+
+        wake.wait(clock.to_real(timers.timeout(IDLE_TICK)))
+        wake.clear()
+
+
+def main(pets=None):
+    init_app(SERVICE_ACCOUNT, RTDB_URL)
+
+    # One wake-up for everything the main loop reacts to: bus, RTDB streams
+    # and Arduino messages
+    wake = threading.Event()
+    timers = TimerHeap(clock)           # every feeder's FSM timers, one heap
+
+    configs = [c for c in FEEDERS if pets is None or c["pet"] in pets]
+    # Weight history stays on the Pi; only closed hour/day rollups go to RTDB
+    outbox = RtdbOutbox(OUTBOX_DB.format("feeders" if pets is None else "-".join(sorted(pets))),
+                        db.reference("/"))
+    history = TimeSeriesStore(TIMESERIES_DB, rtdb_rollup_publisher(outbox.reference("history")),
+                              series=[c["weight_path"].partition("/")[2] for c in configs])
+    feeders = [Feeder(c, outbox, timers, wake, history) for c in configs]
+
+    for f in feeders:
+        f.open_serial()
+    clock.sleep(2)  # allow the Arduinos to reset
+
+    print("RTDB DISPENSER + LID CONTROLLER STARTED:", ", ".join(f.tag for f in feeders))
+
+    # Detections pushed by camera.py over the local socket; the RTDB stream
+    # is the fallback. Dispenser requests arrive over RTDB streams too.
+    bus = DetectionBusClient(wake=wake)
+    det_watch = RtdbWatch(db.reference("detectionStatus"), wake, POLL_INTERVAL)
+    dispenser_watches = watch_dispensers(feeders, wake)
+    for watch in [det_watch, *dispenser_watches.values()]:
+        watch.start()
+
+    for f in feeders:
+        f.link.start()
+
+    try:
+        rtdb_loop(feeders, bus, det_watch, dispenser_watches, wake, timers)
+    except KeyboardInterrupt:
+        print("Exiting.")
+        for f in feeders:
+            if f.lid_open:
+                f.send_serial("CLOSE_LID")
+            f.link.close()
+            f.telemetry.close()
+            print(f"[{f.tag}] Command latency:", f.link.latency())
+        history.close()
+        outbox.close()
+
+
+if __name__ == "__main__":
+    main()
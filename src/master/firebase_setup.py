@@ -0,0 +1,23 @@
+# Firebase app setup shared by camera.py, the feeder controller and temperature.py
+#
+# With FIREBASE_DATABASE_EMULATOR_HOST set (e.g. "localhost:9000" for
+# rtdb_standin.py) firebase_admin.db talks to that server instead of the
+# cloud project; the service account is then neither needed nor read, so
+# everything runs offline on any machine.
+import os
+
+import firebase_admin
+from firebase_admin import credentials
+
+EMULATOR_ENV = "FIREBASE_DATABASE_EMULATOR_HOST"
+
+
+def init_app(service_account, database_url):
+    host = os.environ.get(EMULATOR_ENV)
+    if host:
+        print(f"RTDB: using the local stand-in at {host}")
+        # db uses its own emulator credentials; this one is never loaded
+        return firebase_admin.initialize_app(options={"databaseURL": database_url})
+
+    cred = credentials.Certificate(service_account)
+    return firebase_admin.initialize_app(cred, {"databaseURL": database_url})
@@ -0,0 +1,148 @@
+# Table-driven state machines on a shared timer heap
+#
+# The feeder FSMs used to re-check "has 5 s passed?" / "has the window
+# expired?" on every loop tick and kept a list of delayed actions. Here every
+# delay, confirmation window and timeout is a scheduled event instead: the
+# TimerHeap knows the next due time, the main loop sleeps exactly until then
+# (or until an outside event wakes it), and due timers fire as events into
+# their machine. Any number of machines share one heap and one thread.
+#
+#   TABLE = {
+#       ("IDLE", "owner_seen"): on_owner_seen,   # handler(machine, **data) -> new state or None
+#       ("*", "feed_request"): on_feed_request,  # "*" matches every state
+#   }
+#
+# Timers started with machine.start_timer() belong to the current state and
+# are cancelled when the state changes; machine.after() timers are not.
+# The clock is pluggable (anything with .time()) so emulators and tests can
+# run the machines on virtual time.
+import heapq
+import itertools
+import time
+
+
+class Timer:
+    """Handle for a scheduled callback; cancel() is O(1)."""
+
+    __slots__ = ("due", "callback", "cancelled")
+
+    def __init__(self, due, callback):
+        self.due = due
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerHeap:
+    def __init__(self, clock=time):
+        self.clock = clock
+        self._heap = []                 # (due, seq, Timer)
+        self._seq = itertools.count()
+        self.fired = 0
+
+    def now(self):
+        return self.clock.time()
+
+    def call_at(self, due, callback):
+        timer = Timer(due, callback)
+        heapq.heappush(self._heap, (due, next(self._seq), timer))
+        return timer
+
+    def call_later(self, delay, callback):
+        return self.call_at(self.now() + delay, callback)
+
+    def _prune(self):
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+
+    def next_due(self):
+        self._prune()
+        return self._heap[0][0] if self._heap else None
+
+    def timeout(self, idle=None):
+        # Seconds until the next timer (idle if there is none)
+        due = self.next_due()
+        if due is None:
+            return idle
+        wait = max(due - self.now(), 0.0)
+        return wait if idle is None else min(wait, idle)
+
+    def run_due(self):
+        # Fire every timer that is due, including ones scheduled by callbacks
+        fired = 0
+        while True:
+            due = self.next_due()
+            if due is None or due > self.now():
+                return fired
+            _, _, timer = heapq.heappop(self._heap)
+            timer.cancelled = True
+            timer.callback()
+            fired += 1
+            self.fired += 1
+
+    def __len__(self):
+        return sum(1 for _, _, t in self._heap if not t.cancelled)
+
+
+class StateMachine:
+    def __init__(self, name, table, initial, timers, on_enter=None, on_exit=None):
+        self.name = name
+        self.table = table
+        self.state = initial
+        self.timers = timers
+        self.on_enter = on_enter or {}  # state -> handler(machine)
+        self.on_exit = on_exit or {}    # state -> handler(machine)
+        self._state_timers = {}         # name -> Timer, cancelled on state change
+        self.transitions = 0
+
+    def now(self):
+        return self.timers.now()
+
+    # ----------------- EVENTS -----------------
+    def dispatch(self, event, **data):
+        handler = self.table.get((self.state, event)) or self.table.get(("*", event))
+        if handler is None:
+            return False
+        new_state = handler(self, **data)
+        if new_state is not None and new_state != self.state:
+            self.transition(new_state)
+        return True
+
+    def transition(self, new_state):
+        exit_handler = self.on_exit.get(self.state)
+        if exit_handler:
+            exit_handler(self)
+        for timer in self._state_timers.values():
+            timer.cancel()
+        self._state_timers.clear()
+
+        self.state = new_state
+        self.transitions += 1
+        enter_handler = self.on_enter.get(new_state)
+        if enter_handler:
+            enter_handler(self)
+
+    # ----------------- TIMERS -----------------
+    def start_timer(self, name, delay, event, **data):
+        # State-scoped: restarting a name replaces it, leaving the state cancels it
+        self.cancel_timer(name)
+        self._state_timers[name] = self.timers.call_later(
+            delay, lambda: self._fire(name, event, data))
+
+    def cancel_timer(self, name):
+        timer = self._state_timers.pop(name, None)
+        if timer:
+            timer.cancel()
+
+    def timer_running(self, name):
+        return name in self._state_timers
+
+    def _fire(self, name, event, data):
+        self._state_timers.pop(name, None)
+        self.dispatch(event, **data)
+
+    def after(self, delay, action):
+        # One-off action that survives state changes
+        return self.timers.call_later(delay, action)
@@ -0,0 +1,111 @@
+# Demand- and load-adaptive inference rate for camera.py
+#
+# The feeder controllers drop a tiny demand file whenever their FSM changes
+# (CONFIRMING or lid open -> "high", IDLE with the lid shut -> "low").
+# The camera reads those and picks the interval between SSD runs from the
+# highest demand, then stretches it when the Pi is overloaded or hot.
+import json
+import os
+import time
+
+DEMAND_DIR = "/tmp/snackloader"
+DEMAND_TTL = 60.0          # seconds; a controller that stops refreshing counts as "normal"
+DEMAND_REFRESH = 20.0      # controllers rewrite an unchanged level this often
+
+# Minimum seconds between detector runs for each demand level
+INTERVALS = {"high": 0.0, "normal": 0.25, "low": 1.5}
+LEVEL_ORDER = ["low", "normal", "high"]
+
+THERMAL_ZONE = "/sys/class/thermal/thermal_zone0/temp"
+
+_last_published = {}
+
+
+# ----------------- CONTROLLER SIDE -----------------
+def publish_demand(pet, level):
+    # Cheap enough to call every loop: only touches disk on change or refresh
+    now = time.time()
+    last_level, last_ts = _last_published.get(pet, (None, 0.0))
+    if level == last_level and now - last_ts < DEMAND_REFRESH:
+        return
+
+    try:
+        os.makedirs(DEMAND_DIR, exist_ok=True)
+        path = os.path.join(DEMAND_DIR, f"demand_{pet}.json")
+        tmp = path + ".tmp"
+        with open(tmp, "wt") as f:
+            json.dump({"level": level, "ts": now}, f)
+        os.replace(tmp, path)
+        _last_published[pet] = (level, now)
+    except OSError as e:
+        print("Demand publish error:", e)
+
+
+# ----------------- CAMERA SIDE -----------------
+def read_cpu_temp():
+    try:
+        with open(THERMAL_ZONE, "rt") as f:
+            return int(f.read().strip()) / 1000.0
+    except (OSError, ValueError):
+        return None
+
+
+class InferenceScheduler:
+    def __init__(self, pets=("cat", "dog"), refresh_s=2.0,
+                 busy_load=0.9, warm_temp=70.0, hot_temp=78.0, clock=time):
+        self.pets = pets
+        self.refresh_s = refresh_s      # how often demand/load/temp are re-read
+        self.busy_load = busy_load      # 1-min load average per core that counts as busy
+        self.warm_temp = warm_temp
+        self.hot_temp = hot_temp
+        self.clock = clock              # anything with .time(); bench_vision replays footage time
+
+        self.level = "normal"
+        self.interval = INTERVALS["normal"]
+        self.load = 0.0
+        self.temp = None
+        self._cores = os.cpu_count() or 1
+        self._last_refresh = 0.0
+        self._last_run = 0.0
+
+    def read_demand(self, now):
+        level = "low"
+        for pet in self.pets:
+            try:
+                with open(os.path.join(DEMAND_DIR, f"demand_{pet}.json"), "rt") as f:
+                    entry = json.load(f)
+                pet_level = entry["level"] if now - entry["ts"] < DEMAND_TTL else "normal"
+            except (OSError, ValueError, KeyError):
+                pet_level = "normal"   # controller not running yet: don't starve it
+            if LEVEL_ORDER.index(pet_level) > LEVEL_ORDER.index(level):
+                level = pet_level
+        return level
+
+    def refresh(self, now):
+        self.level = self.read_demand(now)
+        self.load = os.getloadavg()[0] / self._cores
+        self.temp = read_cpu_temp()
+
+        interval = INTERVALS[self.level]
+        if self.load > self.busy_load and self.level != "high":
+            interval *= 2
+        if self.temp is not None and self.temp >= self.hot_temp:
+            # Thermal throttling is about to kick in: back off even under high demand
+            interval = max(interval * 4, 0.5)
+        elif self.temp is not None and self.temp >= self.warm_temp:
+            interval *= 2
+
+        if interval != self.interval:
+            print(f"Inference interval -> {interval:.2f}s "
+                  f"(demand={self.level}, load={self.load:.2f}, temp={self.temp})")
+        self.interval = interval
+        self._last_refresh = now
+
+    def ready(self, now=None):
+        now = now or self.clock.time()
+        if now - self._last_refresh >= self.refresh_s:
+            self.refresh(now)
+        if now - self._last_run < self.interval:
+            return False
+        self._last_run = now
+        return True
@@ -0,0 +1,57 @@
+# Cheap motion gate in front of the DNN for camera.py
+#
+# Each frame is shrunk to a small blurred grayscale copy and compared against
+# a running-average background. The full net.detect() only has to run when
+# enough pixels changed, plus a periodic keep-alive so a pet that walks in
+# very slowly (or lies still in front of the bowl) is still re-checked.
+# should_infer() only answers; the caller reports actual detector runs with
+# ran(), so a pass that something else vetoes does not restart the keep-alive.
+import time
+
+import cv2
+
+
+class MotionGate:
+    def __init__(self, size=(160, 120), diff_threshold=25, min_motion_ratio=0.01,
+                 keepalive_s=5.0, active_keepalive_s=1.0, learn_rate=0.05, clock=time):
+        self.size = size                          # downscaled (w, h) used for differencing
+        self.diff_threshold = diff_threshold      # per-pixel gray level change that counts
+        self.min_motion_ratio = min_motion_ratio  # fraction of changed pixels that wakes the DNN
+        self.keepalive_s = keepalive_s            # forced inference interval on a static scene
+        self.active_keepalive_s = active_keepalive_s  # same, while a pet is known to be in view
+        self.learn_rate = learn_rate              # how fast the background absorbs changes
+        self.clock = clock                        # anything with .time(); bench_vision replays footage time
+
+        self.pets_present = False
+        self.background = None
+        self.last_infer_ts = 0.0
+        self.last_ratio = 0.0
+        self.checked = 0
+        self.passed = 0                           # detector runs reported through ran()
+
+    def motion_ratio(self, img):
+        small = cv2.resize(img, self.size, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        gray = cv2.GaussianBlur(gray, (5, 5), 0)
+
+        if self.background is None:
+            self.background = gray.astype("float32")
+            return 1.0
+
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self.background))
+        cv2.accumulateWeighted(gray, self.background, self.learn_rate)
+        _, mask = cv2.threshold(diff, self.diff_threshold, 255, cv2.THRESH_BINARY)
+        return cv2.countNonZero(mask) / float(mask.size)
+
+    def should_infer(self, img, now=None):
+        now = now or self.clock.time()
+        self.checked += 1
+        self.last_ratio = self.motion_ratio(img)
+
+        keepalive = self.active_keepalive_s if self.pets_present else self.keepalive_s
+        return self.last_ratio >= self.min_motion_ratio or (now - self.last_infer_ts) >= keepalive
+
+    def ran(self, now=None):
+        # The detector actually ran: the keep-alive starts over from here
+        self.last_infer_ts = now or self.clock.time()
+        self.passed += 1
@@ -0,0 +1,111 @@
+# Lightweight IoU tracker that carries cat/dog boxes between detector runs
+#
+# The SSD only runs every few frames; in between, each track coasts on a
+# constant-velocity estimate from its last two detections. On a detector run,
+# boxes are matched to tracks of the same class by IoU. A track survives a
+# few missed detector runs before it is dropped, which also smooths out
+# single-frame misses so presence does not flicker.
+
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0.0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0.0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+class Track:
+    def __init__(self, track_id, className, confidence, box):
+        self.id = track_id
+        self.className = className
+        self.confidence = confidence
+        self.box = [float(v) for v in box]
+        self.velocity = (0.0, 0.0)   # pixels per frame
+        self.frames_since_seen = 0
+        self.misses = 0              # consecutive detector runs without a match
+
+    def predict(self):
+        self.frames_since_seen += 1
+        self.box[0] += self.velocity[0]
+        self.box[1] += self.velocity[1]
+
+    def correct(self, confidence, box):
+        frames = max(self.frames_since_seen, 1)
+        # velocity from where the box was last *measured*, not where it coasted to
+        last_x = self.box[0] - self.velocity[0] * self.frames_since_seen
+        last_y = self.box[1] - self.velocity[1] * self.frames_since_seen
+        self.velocity = ((box[0] - last_x) / frames, (box[1] - last_y) / frames)
+        self.box = [float(v) for v in box]
+        self.confidence = confidence
+        self.frames_since_seen = 0
+        self.misses = 0
+
+    def hit(self):
+        return (self.className, self.confidence, [int(round(v)) for v in self.box])
+
+
+class IouTracker:
+    def __init__(self, iou_threshold=0.3, max_misses=2):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.tracks = []
+        self.lost = False     # a track was dropped on the last update
+        self._next_id = 1
+
+    def predict(self):
+        # Between detector runs: advance every track and return its boxes
+        for track in self.tracks:
+            track.predict()
+        return self.hits()
+
+    def update(self, detections):
+        # detections: [(className, confidence, box), ...] from a detector run
+        pairs = []
+        for ti, track in enumerate(self.tracks):
+            for di, (className, _, box) in enumerate(detections):
+                if className == track.className:
+                    score = iou(track.box, box)
+                    if score >= self.iou_threshold:
+                        pairs.append((score, ti, di))
+
+        matched_tracks, matched_dets = set(), set()
+        for _, ti, di in sorted(pairs, reverse=True):
+            if ti in matched_tracks or di in matched_dets:
+                continue
+            _, confidence, box = detections[di]
+            self.tracks[ti].correct(confidence, box)
+            matched_tracks.add(ti)
+            matched_dets.add(di)
+
+        survivors = []
+        self.lost = False
+        for ti, track in enumerate(self.tracks):
+            if ti not in matched_tracks:
+                track.misses += 1
+                if track.misses > self.max_misses:
+                    self.lost = True
+                    continue
+            survivors.append(track)
+        self.tracks = survivors
+
+        for di, (className, confidence, box) in enumerate(detections):
+            if di not in matched_dets:
+                self.tracks.append(Track(self._next_id, className, confidence, box))
+                self._next_id += 1
+
+        return self.hits()
+
+    def hits(self):
+        return [track.hit() for track in self.tracks]
+
+    def matched(self):
+        # Only the tracks the last detector run actually saw; coasting ones
+        # still show up in hits() for the overlay and presence
+        return [track.hit() for track in self.tracks if track.misses == 0]
+
+    def uncertain(self):
+        # A track missed its last detector run (or just vanished): re-detect next frame
+        return self.lost or any(track.misses for track in self.tracks)
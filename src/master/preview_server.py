@@ -0,0 +1,117 @@
+# On-demand MJPEG preview for a headless camera.py
+#
+# Open http://<pi>:8080/ in a browser to watch the detector. The stream has
+# no authentication, so it only listens on localhost unless a host such as
+# "0.0.0.0" is passed in (camera.py's PREVIEW_HOST). Frames are only
+# drawn and JPEG-encoded while at least one client is connected; with more
+# viewers the stream drops frame rate and quality so the Pi keeps its CPU
+# for inference.
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+
+PAGE = b"""<html><head><title>SnackLoader camera</title></head>
+<body style="margin:0;background:#111"><img src="/stream" style="width:100%"></body></html>"""
+
+
+class PreviewServer:
+    def __init__(self, host="127.0.0.1", port=8080, max_fps=15.0, min_fps=2.0,
+                 max_quality=80, min_quality=40):
+        self.address = (host, port)
+        self.max_fps = max_fps
+        self.min_fps = min_fps
+        self.max_quality = max_quality
+        self.min_quality = min_quality
+
+        self.clients = 0
+        self.frames_sent = 0
+        self._jpeg = None
+        self._seq = 0
+        self._last_encode_ts = 0.0
+        self._cond = threading.Condition()
+        self._httpd = None
+
+    # ----------------- ADAPTIVE RATE -----------------
+    def fps(self):
+        # Budget shared between viewers: each extra client lowers the rate
+        return max(self.min_fps, self.max_fps / max(self.clients, 1))
+
+    def quality(self):
+        return max(self.min_quality, self.max_quality - 10 * (max(self.clients, 1) - 1))
+
+    def wants_frame(self, now=None):
+        if self.clients == 0:
+            return False
+        now = now or time.time()
+        return (now - self._last_encode_ts) >= 1.0 / self.fps()
+
+    def submit(self, img):
+        ok, jpeg = cv2.imencode(".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), self.quality()])
+        if not ok:
+            return
+        with self._cond:
+            self._jpeg = jpeg.tobytes()
+            self._seq += 1
+            self._last_encode_ts = time.time()
+            self._cond.notify_all()
+
+    # ----------------- HTTP -----------------
+    def _next_jpeg(self, last_seq, timeout=2.0):
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq != last_seq, timeout)
+            return self._seq, self._jpeg
+
+    def _client_delta(self, delta):
+        with self._cond:
+            self.clients += delta
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == "/":
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/html")
+                    self.end_headers()
+                    self.wfile.write(PAGE)
+                    return
+                if self.path != "/stream":
+                    self.send_error(404)
+                    return
+
+                self.send_response(200)
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
+                self.end_headers()
+
+                server._client_delta(+1)
+                seq = 0
+                try:
+                    while True:
+                        new_seq, jpeg = server._next_jpeg(seq)
+                        if jpeg is None or new_seq == seq:
+                            continue
+                        seq = new_seq
+                        self.wfile.write(b"--frame\r\nContent-Type: image/jpeg\r\n")
+                        self.wfile.write(f"Content-Length: {len(jpeg)}\r\n\r\n".encode())
+                        self.wfile.write(jpeg + b"\r\n")
+                        server.frames_sent += 1
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    server._client_delta(-1)
+
+        self._httpd = ThreadingHTTPServer(self.address, Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        print(f"Preview at http://{self.address[0]}:{self.address[1]}/")
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
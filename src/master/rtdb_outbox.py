@@ -0,0 +1,258 @@
+# Durable outbox for Firebase RTDB writes
+#
+# Every write from camera.py, the feeder controller and temperature.py goes
+# into a small SQLite queue on the Pi first and returns immediately, so the
+# detection, feeding and lid loops never wait on (or crash with) the network.
+# A worker thread drains the queue with one multi-location update() at the
+# database root per batch; while Wi-Fi is down it backs off and retries, and
+# whatever was queued survives a restart. Each process needs its own file:
+# seq is counted in memory, so two writers on one file would collide.
+#
+#   - coalescing: one row per RTDB path, a newer write to the same path
+#     replaces the queued one (only the latest state matters)
+#   - ordering: rows are sent in the order of their latest write
+#   - no overlapping paths: writing a node drops its queued children, and a
+#     write below a queued node is merged into that node's value, so every
+#     batch is a valid multi-path update
+#   - backpressure: new paths are refused once max_pending rows are queued;
+#     writes to paths already queued always coalesce and are never refused
+#   - guarded writes: update(values, expect={...}) is only sent if the node
+#     still holds the expected child values on the server; otherwise it is
+#     dropped. The feeder uses it for run=False, so a reset queued during an
+#     outage cannot clear a newer feed request made while it was queued.
+#     The check is a GET right before the batch, not a transaction, so it
+#     covers the outage, not a write landing in the same few milliseconds.
+#
+# outbox.reference(path) returns a drop-in for db.reference(path) with
+# update(), set() and child(), for the existing publishers.
+import json
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    path TEXT PRIMARY KEY,
+    value TEXT,
+    seq INTEGER NOT NULL,
+    guard TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_seq ON outbox (seq);
+"""
+
+
+def split_path(path):
+    return [p for p in path.split("/") if p]
+
+def join_path(*parts):
+    return "/".join(p for part in parts for p in split_path(part))
+
+
+class OutboxRef:
+    """Write-only stand-in for a firebase_admin Reference."""
+
+    def __init__(self, outbox, path):
+        self.outbox = outbox
+        self.path = join_path(path)
+
+    def child(self, key):
+        return OutboxRef(self.outbox, join_path(self.path, key))
+
+    def set(self, value):
+        return self.outbox.put(self.path, value)
+
+    def update(self, values, expect=None):
+        # expect: {child: value} this node must still hold when the write goes out
+        guard = {"path": self.path, "expect": expect} if expect else None
+        return self.outbox.put_many({join_path(self.path, key): value for key, value in values.items()},
+                                    guard)
+
+
+class RtdbOutbox:
+    def __init__(self, path, root_ref, max_pending=5000, batch_size=200,
+                 flush_delay=0.05, max_backoff=30.0):
+        self.path = path
+        self.root_ref = root_ref          # db.reference("/")
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_delay = flush_delay    # collect writes made together into one batch
+        self.max_backoff = max_backoff
+
+        self.online = True
+        self.queued = 0
+        self.sent = 0
+        self.batches = 0
+        self.rejected = 0
+        self.errors = 0
+        self.stale = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(outbox)")]
+        if "guard" not in columns:      # queue file from before guarded writes
+            self._db.execute("ALTER TABLE outbox ADD COLUMN guard TEXT")
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._seq = self._db.execute("SELECT COALESCE(MAX(seq), 0) FROM outbox").fetchone()[0]
+        self.pending = self._db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+        if self.pending:
+            print(f"[OUTBOX] {self.pending} writes left from the last run")
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def reference(self, path="/"):
+        return OutboxRef(self, path)
+
+    # ----------------- PRODUCER SIDE (local disk only) -----------------
+    def put(self, path, value):
+        return self.put_many({path: value})
+
+    def put_many(self, values, guard=None):
+        # Queue several path -> value writes atomically; False if refused
+        guard_json = json.dumps(guard) if guard else None
+        with self._cond:
+            try:
+                self._db.execute("BEGIN")
+                for path, value in values.items():
+                    if not self._queue_one(join_path(path), value, guard_json):
+                        self._db.execute("ROLLBACK")
+                        self.pending = self._db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+                        self.rejected += 1
+                        if self.rejected == 1 or self.rejected % 100 == 0:
+                            print(f"[OUTBOX] Full ({self.pending} queued), "
+                                  f"dropped {self.rejected} writes so far")
+                        return False
+                self._db.execute("COMMIT")
+            except sqlite3.Error as e:
+                print("[OUTBOX] Queue error:", e)
+                if self._db.in_transaction:
+                    self._db.execute("ROLLBACK")
+                return False
+            self.pending = self._db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+            self.queued += len(values)
+            self._cond.notify()
+        return True
+
+    def _queue_one(self, path, value, guard=None):
+        parts = split_path(path)
+        self._seq += 1
+
+        # Below a queued node: fold the write into that node's value. The
+        # merged row keeps a guard only if both writes carried the same one,
+        # so an unguarded write is never dropped along with a stale one.
+        ancestors = ["/".join(parts[:i]) for i in range(1, len(parts))]
+        if ancestors:
+            row = self._db.execute(
+                f"SELECT path, value, guard FROM outbox WHERE path IN ({','.join('?' * len(ancestors))}) "
+                "ORDER BY length(path) LIMIT 1", ancestors).fetchone()
+            if row:
+                node_path, node_json, node_guard = row
+                node = json.loads(node_json)
+                if not isinstance(node, dict):
+                    node = {}
+                target = node
+                rel = parts[len(split_path(node_path)):]
+                for key in rel[:-1]:
+                    if not isinstance(target.get(key), dict):
+                        target[key] = {}
+                    target = target[key]
+                if value is None:
+                    target.pop(rel[-1], None)
+                else:
+                    target[rel[-1]] = value
+                self._db.execute("UPDATE outbox SET value = ?, seq = ?, guard = ? WHERE path = ?",
+                                 (json.dumps(node), self._seq,
+                                  guard if guard == node_guard else None, node_path))
+                return True
+
+        # Replacing a node supersedes anything queued below it
+        prefix = path + "/"
+        self._db.execute("DELETE FROM outbox WHERE substr(path, 1, ?) = ?", (len(prefix), prefix))
+
+        exists = self._db.execute("SELECT 1 FROM outbox WHERE path = ?", (path,)).fetchone()
+        if not exists and self.pending >= self.max_pending:
+            return False
+        self._db.execute("INSERT OR REPLACE INTO outbox (path, value, seq, guard) VALUES (?, ?, ?, ?)",
+                         (path, json.dumps(value), self._seq, guard))
+        if not exists:
+            self.pending += 1
+        return True
+
+    # ----------------- WORKER -----------------
+    def _run(self):
+        backoff = 1.0
+        while True:
+            with self._cond:
+                while not self._closed and self.pending == 0:
+                    self._cond.wait()
+                if self._closed and (self.pending == 0 or not self.online):
+                    return
+            time.sleep(self.flush_delay)
+
+            with self._lock:
+                rows = self._db.execute("SELECT path, value, seq, guard FROM outbox ORDER BY seq LIMIT ?",
+                                        (self.batch_size,)).fetchall()
+            if not rows:
+                continue
+
+            try:
+                stale = self._stale_rows(rows)
+                send = {path: json.loads(value) for path, value, seq, _ in rows
+                        if (path, seq) not in stale}
+                if send:
+                    self.root_ref.update(send)
+            except Exception as e:
+                self.errors += 1
+                if self.online:
+                    print(f"[OUTBOX] RTDB unreachable, keeping {self.pending} writes queued:", e)
+                self.online = False
+                with self._cond:
+                    self._cond.wait(backoff)     # close() cuts the wait short
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+
+            if not self.online:
+                print("[OUTBOX] RTDB reachable again, flushing queue")
+            self.online = True
+            backoff = 1.0
+            with self._cond:
+                # Rows rewritten while the batch was in flight keep their newer seq
+                self._db.executemany("DELETE FROM outbox WHERE path = ? AND seq = ?",
+                                     [(path, seq) for path, _, seq, _ in rows])
+                self.pending = self._db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+            for path, _ in stale:
+                print(f"[OUTBOX] Dropped stale write to {path}: the node changed while it was queued")
+            self.stale += len(stale)
+            self.sent += len(rows) - len(stale)
+            self.batches += 1
+
+    def _stale_rows(self, rows):
+        # (path, seq) of guarded rows whose node no longer holds the expected
+        # values; one GET per guarded node, raises like update() when offline
+        nodes, stale = {}, set()
+        for path, _, seq, guard_json in rows:
+            if not guard_json:
+                continue
+            guard = json.loads(guard_json)
+            if guard["path"] not in nodes:
+                nodes[guard["path"]] = self.root_ref.child(guard["path"]).get()
+            node = nodes[guard["path"]]
+            if not isinstance(node, dict):
+                node = {}
+            if any(node.get(key) != value for key, value in guard["expect"].items()):
+                stale.add((path, seq))
+        return stale
+
+    def close(self, timeout=5.0):
+        # Best-effort final flush; anything left stays on disk for next start
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            self._db.close()
@@ -0,0 +1,322 @@
+# Local stand-in for the Firebase Realtime Database
+#
+#   python rtdb_standin.py --port 9000 --latency 0.08 --jitter 0.04
+#   FIREBASE_DATABASE_EMULATOR_HOST=localhost:9000 python cat_feeder_controller.py
+#
+# Speaks the REST + server-sent-events subset firebase_admin.db uses
+# (GET / PUT / PATCH / POST / DELETE on <path>.json, multi-path PATCH,
+# shallow=true, print=silent, and Reference.listen() streams of put
+# events), so camera.py, the feeder controller and temperature.py run
+# unmodified against it with no cloud project and no service account (see
+# firebase_setup.py). Every request is counted per method and path and
+# timed, with optional injected latency, and reported on:
+#   GET  /.stats              counters, bytes and latency percentiles
+#   GET  /.stats?reset=1      same, then start counting again
+# The ?ns= namespace firebase_admin adds is accepted and ignored.
+import argparse
+import copy
+import json
+import queue
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+KEEPALIVE_S = 30.0
+
+
+def split_path(path):
+    return [p for p in path.split("/") if p]
+
+
+# ----------------- DATA TREE -----------------
+class Tree:
+    """Nested-dict database with the RTDB's null/empty-node semantics."""
+
+    def __init__(self, data=None):
+        self.data = data
+
+    def get(self, parts):
+        node = self.data
+        for part in parts:
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return node
+
+    def set(self, parts, value):
+        if value == {} or value == []:
+            value = None                 # empty nodes don't exist in RTDB
+        if not parts:
+            self.data = value
+            return
+        if not isinstance(self.data, dict):
+            self.data = {}
+        node, trail = self.data, []
+        for part in parts[:-1]:
+            if not isinstance(node.get(part), dict):
+                node[part] = {}
+            trail.append((node, part))
+            node = node[part]
+        if value is None:
+            node.pop(parts[-1], None)
+            # Drop parents that became empty
+            while not node and trail:
+                parent, key = trail.pop()
+                parent.pop(key, None)
+                node = parent
+            if not self.data:
+                self.data = None
+        else:
+            node[parts[-1]] = value
+
+
+# ----------------- SERVER STATE -----------------
+class StandIn:
+    def __init__(self, data=None, latency=0.0, jitter=0.0):
+        self.tree = Tree(data)
+        self.latency = latency
+        self.jitter = jitter
+        self.lock = threading.Lock()
+        self.listeners = []              # (parts, queue)
+        self.reset_stats()
+
+    # ----------------- STATS -----------------
+    def reset_stats(self):
+        self.started = time.time()
+        self.counts = {}                 # "METHOD /path" -> n
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.durations = {}              # method -> [seconds]
+        self.events = 0
+
+    def record(self, method, path, seconds, n_in, n_out):
+        with self.lock:
+            key = f"{method} /{'/'.join(path)}"
+            self.counts[key] = self.counts.get(key, 0) + 1
+            if seconds is not None:      # streams have no request latency
+                self.durations.setdefault(method, []).append(seconds)
+            self.bytes_in += n_in
+            self.bytes_out += n_out
+
+    def stats(self):
+        def pct(samples):
+            ordered = sorted(samples)
+            pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+            return {"n": len(ordered), "p50_ms": round(pick(0.5) * 1000, 2),
+                    "p99_ms": round(pick(0.99) * 1000, 2), "max_ms": round(ordered[-1] * 1000, 2)}
+        with self.lock:
+            return {
+                "seconds": round(time.time() - self.started, 1),
+                "requests": sum(self.counts.values()),
+                "by_path": dict(sorted(self.counts.items())),
+                "latency": {m: pct(s) for m, s in self.durations.items() if s},
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "stream_events": self.events,
+                "listeners": len(self.listeners),
+            }
+
+    def delay(self):
+        if self.latency or self.jitter:
+            time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+    # ----------------- WRITES -----------------
+    def write(self, parts, value, patch=False):
+        # Apply a PUT (or a PATCH's children) and notify listeners
+        with self.lock:
+            if patch:
+                changes = [(parts + split_path(key), child) for key, child in value.items()]
+            else:
+                changes = [(parts, value)]
+            for change_parts, change_value in changes:
+                self.tree.set(change_parts, copy.deepcopy(change_value))
+            for listen_parts, q in self.listeners:
+                self._notify(listen_parts, q, changes)
+
+    def _notify(self, listen_parts, q, changes):
+        # One put event per changed location, relative to the listened node
+        n = len(listen_parts)
+        for change_parts, change_value in changes:
+            if change_parts[:n] == listen_parts:
+                rel = "/" + "/".join(change_parts[n:])
+                q.put(("put", {"path": rel, "data": change_value}))
+                self.events += 1
+            elif listen_parts[:len(change_parts)] == change_parts:
+                # Listened node replaced from above
+                q.put(("put", {"path": "/", "data": copy.deepcopy(self.tree.get(listen_parts))}))
+                self.events += 1
+
+    def subscribe(self, parts):
+        q = queue.Queue()
+        with self.lock:
+            q.put(("put", {"path": "/", "data": copy.deepcopy(self.tree.get(parts))}))
+            self.listeners.append((parts, q))
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.listeners = [(p, lq) for p, lq in self.listeners if lq is not q]
+
+
+# ----------------- HTTP -----------------
+class Handler(BaseHTTPRequestHandler):
+    standin = None                       # set by serve()
+
+    def log_message(self, *args):
+        pass
+
+    def _parse(self):
+        url = urlsplit(self.path)
+        path = unquote(url.path)
+        if path.endswith(".json"):
+            path = path[:-5]
+        return split_path(path), parse_qs(url.query)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        return (json.loads(raw) if raw else None), len(raw)
+
+    def _reply(self, value, query, status=200):
+        if "silent" in query.get("print", []):
+            self.send_response(204)
+            self.end_headers()
+            return 0
+        data = json.dumps(value).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        return len(data)
+
+    def _error(self, status, message):
+        data = json.dumps({"error": message}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self, method):
+        standin = self.standin
+        parts, query = self._parse()
+        if parts == [".stats"]:
+            stats = standin.stats()
+            if "1" in query.get("reset", []):
+                standin.reset_stats()
+            return self._reply(stats, {})
+
+        t0 = time.perf_counter()
+        standin.delay()
+        try:
+            body, n_in = self._body() if method in ("PUT", "PATCH", "POST") else (None, 0)
+        except ValueError:
+            return self._error(400, "Invalid data; couldn't parse JSON object")
+
+        if method == "GET":
+            if "text/event-stream" in (self.headers.get("Accept") or ""):
+                return self._stream(parts)
+            with standin.lock:
+                value = copy.deepcopy(standin.tree.get(parts))
+            if "true" in query.get("shallow", []) and isinstance(value, dict):
+                value = {key: True for key in value}
+        elif method == "PUT":
+            standin.write(parts, body)
+            value = body
+        elif method == "PATCH":
+            if not isinstance(body, dict):
+                return self._error(400, "Invalid data; PATCH needs an object")
+            standin.write(parts, body, patch=True)
+            value = body
+        elif method == "POST":
+            key = "-" + uuid.uuid4().hex[:19]
+            standin.write(parts + [key], body)
+            value = {"name": key}
+        else:   # DELETE
+            standin.write(parts, None)
+            value = None
+
+        n_out = self._reply(value, query)
+        standin.record(method, parts, time.perf_counter() - t0, n_in, n_out)
+
+    def _stream(self, parts):
+        standin = self.standin
+        standin.record("LISTEN", parts, None, 0, 0)
+        q = standin.subscribe(parts)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        try:
+            while True:
+                try:
+                    event, payload = q.get(timeout=KEEPALIVE_S)
+                    frame = f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+                except queue.Empty:
+                    frame = "event: keep-alive\ndata: null\n\n"
+                self.wfile.write(frame.encode())
+                self.wfile.flush()
+        except OSError:
+            pass                         # client went away
+        finally:
+            standin.unsubscribe(q)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_PATCH(self):
+        self._handle("PATCH")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+
+def serve(host="127.0.0.1", port=9000, data=None, latency=0.0, jitter=0.0):
+    standin = StandIn(data, latency, jitter)
+    handler = type("StandInHandler", (Handler,), {"standin": standin})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server, standin
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Firebase RTDB stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- seconds of random extra latency")
+    parser.add_argument("--load", help="JSON file with the initial database contents")
+    parser.add_argument("--save", help="write the database here on exit")
+    args = parser.parse_args()
+
+    data = None
+    if args.load:
+        with open(args.load, "rt") as f:
+            data = json.load(f)
+    server, standin = serve(args.host, args.port, data, args.latency, args.jitter)
+    print(f"RTDB stand-in on http://{args.host}:{args.port} "
+          f"(export FIREBASE_DATABASE_EMULATOR_HOST={args.host}:{args.port})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Exiting.")
+    finally:
+        server.server_close()
+        print(json.dumps(standin.stats(), indent=2))
+        if args.save:
+            with open(args.save, "wt") as f:
+                json.dump(standin.tree.data, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# Streaming mirror of an RTDB node for the feeder controllers
+#
+# Reference.listen() keeps one server-sent-events stream open and delivers
+# put/patch events only when the node changes; they are applied to a local
+# copy so readers never touch the network. If the stream dies (Wi-Fi drop,
+# token refresh failure) the watch falls back to polling get() until a new
+# stream can be opened, so the controllers keep working either way.
+import copy
+import threading
+import time
+
+RELISTEN_INTERVAL = 30.0   # seconds between attempts to re-open a dead stream
+STREAM_CHECK_INTERVAL = 60.0   # seconds without events before the stream is cross-checked
+
+
+class RtdbWatch:
+    def __init__(self, ref, wake=None, poll_interval=0.2):
+        self.ref = ref
+        self.wake = wake or threading.Event()   # set on every change
+        self.poll_interval = poll_interval      # only used while the stream is down
+
+        self.data = None
+        self.streaming = False
+        self.events = 0
+        self.polls = 0
+        self.checks = 0
+        self._last_event_ts = 0.0
+        self._lock = threading.Lock()
+        self._registration = None
+        self._ready = threading.Event()
+
+    # ----------------- READ SIDE -----------------
+    def get(self):
+        with self._lock:
+            return copy.deepcopy(self.data)
+
+    def wait_ready(self, timeout=10.0):
+        return self._ready.wait(timeout)
+
+    # ----------------- STREAM -----------------
+    def start(self):
+        threading.Thread(target=self._supervise, daemon=True).start()
+
+    def _on_event(self, event):
+        self.events += 1
+        self._last_event_ts = time.time()
+        self._apply(event.event_type, event.path, event.data)
+
+    def _apply(self, event_type, path, data):
+        with self._lock:
+            parts = [p for p in path.split("/") if p]
+            if event_type == "patch":
+                # Patch keys may themselves be paths ("cat/run": {...})
+                for key, value in (data or {}).items():
+                    self._set(parts + [p for p in key.split("/") if p], value)
+            else:
+                self._set(parts, data)
+        self._ready.set()
+        self.wake.set()
+
+    def _set(self, parts, value):
+        # Same rules as the server: None deletes, missing parents are created
+        if not parts:
+            self.data = value
+            return
+        if not isinstance(self.data, dict):
+            if value is None:
+                return
+            self.data = {}
+        node = self.data
+        for part in parts[:-1]:
+            if not isinstance(node.get(part), dict):
+                if value is None:
+                    return
+                node[part] = {}
+            node = node[part]
+        if value is None:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = value
+
+    def _stream_alive(self):
+        # The SDK exposes no health flag and swallows the server's keep-alives,
+        # so a stream that has been quiet for a while is checked against one
+        # get(): a node that changed without an event means the stream is stale
+        if time.time() - self._last_event_ts < STREAM_CHECK_INTERVAL:
+            return True
+        try:
+            data = self.ref.get()
+        except Exception as e:
+            print(f"[RTDB] check failed on {self.ref.path}:", e)
+            return False
+        self.checks += 1
+        self._last_event_ts = time.time()
+        with self._lock:
+            return data == self.data
+
+    def _listen(self):
+        try:
+            self._registration = self.ref.listen(self._on_event)
+            self._last_event_ts = time.time()
+            self.streaming = True
+            print(f"[RTDB] streaming {self.ref.path}")
+        except Exception as e:
+            print(f"[RTDB] listen failed on {self.ref.path}:", e)
+            self._registration = None
+            self.streaming = False
+
+    def _poll_once(self):
+        try:
+            data = self.ref.get()
+        except Exception as e:
+            print(f"[RTDB] poll failed on {self.ref.path}:", e)
+            return
+        self.polls += 1
+        with self._lock:
+            changed = data != self.data
+            self.data = data
+        self._ready.set()
+        if changed:
+            self.wake.set()
+
+    def _supervise(self):
+        self._listen()
+        last_attempt = time.time()
+        while True:
+            if self.streaming and self._stream_alive():
+                time.sleep(1.0)
+                continue
+
+            if self.streaming:
+                print(f"[RTDB] stream on {self.ref.path} dropped, polling")
+                self.streaming = False
+                try:
+                    self._registration.close()
+                except Exception:
+                    pass
+
+            self._poll_once()
+            if time.time() - last_attempt >= RELISTEN_INTERVAL:
+                last_attempt = time.time()
+                self._listen()
+            else:
+                time.sleep(self.poll_interval)
+
+    def close(self):
+        if self._registration:
+            try:
+                self._registration.close()
+            except Exception:
+                pass
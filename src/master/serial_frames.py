@@ -0,0 +1,146 @@
+# Binary serial frames shared by serial_link.py and arduino_emulator.py
+#
+# After "BIN <baud>" the feeder Arduino and the controller stop exchanging
+# text lines and send fixed-layout messages instead:
+#
+#   frame   = COBS(type, fields..., crc16) 0x00
+#   fields  = little-endian struct per type (seq uint16, grams float32)
+#   crc16   = CRC-16/CCITT-FALSE (poly 0x1021, init 0xFFFF) over type + fields
+#
+# COBS removes every zero byte from the payload, so 0x00 always ends a frame
+# and a receiver that lost bytes resyncs on the next one. A LIVE report is
+# 9 bytes on the wire instead of ~11 characters of text, and it is decoded
+# with one struct unpack instead of split() + float(). Frames with a bad CRC
+# are dropped (decode_event / decode_command return None).
+import struct
+from binascii import crc_hqx
+
+MAX_FRAME = 32          # bytes; longer runs without a 0x00 are noise
+
+# type -> (kind, struct of the fields after the type byte)
+EVENTS = {
+    0x01: ("READY", ""),
+    0x02: ("LIVE", "f"),
+    0x03: ("WEIGHT", "f"),
+    0x04: ("DONE", ""),
+    0x05: ("STOPPED", ""),
+    0x06: ("LID_OPENED", ""),
+    0x07: ("LID_CLOSED", ""),
+    0x08: ("OPEN_DISP", ""),
+    0x09: ("CLOSED_DISP", ""),
+    0x0A: ("TARGET", "f"),
+    0x10: ("ACK", "H"),
+    0x11: ("FIN", "HB"),        # seq, state (1 done, 2 stopped)
+    0x12: ("NAK", "H"),
+}
+
+# Host -> Arduino; every command carries its seq
+COMMANDS = {
+    0x81: ("OPEN_LID", "H"),
+    0x82: ("CLOSE_LID", "H"),
+    0x83: ("DISPENSE", "Hf"),
+    0x84: ("STOP", "H"),
+    0x85: ("FORCE_CLOSE_LID", "H"),
+}
+
+FIN_STOPPED = 2
+
+_EVENT_STRUCTS = {t: (kind, struct.Struct("<" + fmt)) for t, (kind, fmt) in EVENTS.items()}
+_EVENT_TYPES = {kind: t for t, (kind, _) in EVENTS.items()}
+_COMMAND_STRUCTS = {t: (kind, struct.Struct("<" + fmt)) for t, (kind, fmt) in COMMANDS.items()}
+_COMMAND_TYPES = {kind: t for t, (kind, _) in COMMANDS.items()}
+
+
+# ----------------- COBS -----------------
+def cobs_encode(data):
+    out = bytearray(b"\x00")
+    code_at, code = 0, 1
+    for byte in data:
+        if byte:
+            out.append(byte)
+            code += 1
+        if not byte or code == 0xFF:
+            out[code_at] = code
+            code_at, code = len(out), 1
+            out.append(0)
+    out[code_at] = code
+    return bytes(out)
+
+def cobs_decode(frame):
+    # Encoded bytes (no trailing 0x00) -> payload, None if malformed
+    out = bytearray()
+    i, n = 0, len(frame)
+    while i < n:
+        code = frame[i]
+        end = i + code
+        if code == 0 or end > n:
+            return None
+        out += frame[i + 1:end]
+        i = end
+        if code < 0xFF and i < n:
+            out.append(0)
+    return out
+
+
+# ----------------- FRAMES -----------------
+def _frame(type_, packer, values):
+    payload = bytes((type_,)) + packer.pack(*values)
+    crc = crc_hqx(payload, 0xFFFF)
+    return cobs_encode(payload + crc.to_bytes(2, "little")) + b"\x00"
+
+def _payload(frame):
+    # Decoded, CRC-checked memoryview of type + fields, or None
+    data = cobs_decode(frame)
+    if data is None or len(data) < 3:
+        return None
+    view = memoryview(data)
+    if crc_hqx(view[:-2], 0xFFFF) != int.from_bytes(view[-2:], "little"):
+        return None
+    return view[:-2]
+
+def encode_event(kind, *values):
+    type_ = _EVENT_TYPES[kind]
+    return _frame(type_, _EVENT_STRUCTS[type_][1], values)
+
+def decode_event(frame):
+    # -> (kind, args) with args as numbers, like Message.args from a text line
+    payload = _payload(frame)
+    if payload is None or payload[0] not in _EVENT_STRUCTS:
+        return None
+    kind, fields = _EVENT_STRUCTS[payload[0]]
+    if len(payload) - 1 != fields.size:
+        return None
+    args = tuple(round(v, 2) if isinstance(v, float) else v
+                 for v in fields.unpack_from(payload, 1))
+    if kind == "FIN":
+        # Same args as the text "FIN 12" / "FIN 12 STOPPED"
+        args = (args[0], "STOPPED") if args[1] == FIN_STOPPED else (args[0],)
+    return kind, args
+
+def looks_like_text(line):
+    # A newline-terminated run of bytes read in binary mode that cannot be a
+    # frame: no COBS frame of MAX_FRAME bytes starts with a code byte this
+    # large, while every text line starts with a printable character
+    return len(line) > 0 and line[0] > MAX_FRAME
+
+def encode_command(seq, cmd):
+    # "DISPENSE 30" -> frame; ValueError if it has no binary form
+    name, *params = cmd.split()
+    if name not in _COMMAND_TYPES:
+        raise ValueError(f"no binary form for {name!r}")
+    type_ = _COMMAND_TYPES[name]
+    try:
+        return _frame(type_, _COMMAND_STRUCTS[type_][1], (seq, *map(float, params)))
+    except struct.error as e:
+        raise ValueError(f"bad arguments for {name}: {e}") from e
+
+def decode_command(frame):
+    # -> "#<seq> CMD [grams]", the text the firmware would have read
+    payload = _payload(frame)
+    if payload is None or payload[0] not in _COMMAND_STRUCTS:
+        return None
+    name, fields = _COMMAND_STRUCTS[payload[0]]
+    if len(payload) - 1 != fields.size:
+        return None
+    seq, *params = fields.unpack_from(payload, 1)
+    return " ".join([f"#{seq}", name, *(f"{p:g}" for p in params)])
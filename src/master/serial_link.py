@@ -0,0 +1,592 @@
+# Event-driven serial link to the Arduinos
+#
+# One reader thread per port blocks in poll() on the tty file descriptor, so
+# an idle link costs no wake-ups at all. Whatever bytes are available are read
+# in one go, split into complete lines (a partial line stays in the buffer
+# until its newline arrives), and each line is parsed into a Message and
+# handed to the handlers registered for its keyword:
+#   LIVE 12.3 / WEIGHT 45.6 / DONE / READY / STOPPED / LID_OPENED ...
+# Lines without a keyword (temperature.py's "23.5,60.1") go to on_line()
+# handlers only. A failing handler is logged, never silently dropped, and an
+# unplugged Arduino is reopened with backoff.
+#
+# request() sends an acknowledged command: "#<seq> OPEN_LID". The firmware
+# answers "ACK <seq>" when it reads the line and "FIN <seq> [status]" when
+# the action has completed ("NAK <seq>" if it doesn't know the command).
+# Several commands can be in flight; a command that is not ACKed in time is
+# resent with the same seq (the firmware ignores repeats it has already
+# seen), and one that is ACKed but never finishes fails after done_timeout.
+# on_done(command) is called from the reader thread either way.
+#
+# With fast_baud set the link upgrades itself: on the first text line from
+# the board it sends "BIN <fast_baud>", and once that is FINished both ends
+# switch baud and exchange COBS/CRC frames (serial_frames.py) decoded with
+# struct straight into Messages, so handlers see the same kinds and args in
+# either mode. Reopening the port resets the Uno, so both ends drop back to
+# text at the base baud and the next line renegotiates; a run of corrupt
+# frames reopens the port on purpose, since the board may still be sending
+# frames at a baud where a text line would only arrive as noise. A text line
+# that does arrive intact in binary mode (the board reset on its own) drops
+# the link back to text without a reopen. Without fast_baud the link stays
+# in text mode for debugging.
+#
+# A reset loses whatever the board was doing: commands in flight when the
+# port is reopened, or when the board reports READY, fail at once with
+# "reset" instead of waiting out their timeouts, and on_reopen() handlers
+# are told, since the board's idea of where its motors are starts over too.
+#
+# Commands are held back while the board cannot take them: from opening the
+# port until it first speaks (bootloader, setup()'s delay(1500) and tare
+# take longer than the ACK retries), and while BIN is being negotiated.
+# Their ACK timeouts start when they are actually sent. One still held after
+# RESET_GRACE is sent anyway if the port is open, or fails "not connected".
+#
+#   python serial_link.py /dev/ttyUSB0     # monitor a port and type commands
+import os
+import select
+import sys
+import threading
+import time
+
+import serial
+
+from serial_frames import MAX_FRAME, decode_event, encode_command, looks_like_text
+
+MAX_LINE = 256          # bytes; longer runs without a newline are line noise
+REOPEN_BACKOFF_MAX = 10.0
+
+ACK_TIMEOUT = 1.0       # seconds; loop() never blocks (HX711 and steppers are polled), ACK is ~ms
+RETRIES = 2             # resends of a command that was not ACKed
+RESET_GRACE = 5.0       # seconds; Uno reset (bootloader, delay(1500), tare) with margin
+LATENCY_SAMPLES = 200   # round trips kept per command for latency()
+MAX_BAD_FRAMES = 8      # corrupt frames in a row -> reopen the port (resets the board)
+
+
+class Message:
+    """One framed line (or binary frame) from an Arduino."""
+
+    __slots__ = ("kind", "args", "_line", "ts")
+
+    def __init__(self, line, ts=None):
+        self._line = line
+        self.ts = ts or time.time()
+        head, _, rest = line.partition(" ")
+        if head.replace("_", "").isalpha() and head.isupper():
+            self.kind = head
+            self.args = rest.split()
+        else:
+            self.kind = None
+            self.args = []
+
+    @classmethod
+    def event(cls, kind, args, ts):
+        # From a decoded binary frame; the text line is only built if asked for
+        msg = cls.__new__(cls)
+        msg.kind = kind
+        msg.args = args
+        msg._line = None
+        msg.ts = ts
+        return msg
+
+    @property
+    def line(self):
+        if self._line is None:
+            self._line = " ".join([self.kind, *(f"{a:g}" if isinstance(a, float) else str(a)
+                                                 for a in self.args)])
+        return self._line
+
+    def number(self, index=0):
+        # Numeric argument, or None if missing / corrupted
+        try:
+            return float(self.args[index])
+        except (IndexError, ValueError):
+            return None
+
+    def __repr__(self):
+        return f"Message({self.line!r})"
+
+
+class Command:
+    """One acknowledged command and its progress."""
+
+    __slots__ = ("seq", "cmd", "on_done", "ack_timeout", "done_timeout", "retries",
+                 "attempts", "requested_ts", "sent_ts", "acked_ts", "done_ts", "status", "result")
+
+    def __init__(self, seq, cmd, on_done, ack_timeout, done_timeout, retries):
+        self.seq = seq
+        self.cmd = cmd
+        self.on_done = on_done
+        self.ack_timeout = ack_timeout
+        self.done_timeout = done_timeout
+        self.retries = retries
+        self.attempts = 0            # 0 while held back
+        self.requested_ts = 0.0      # request() (monotonic)
+        self.sent_ts = 0.0           # first send (monotonic)
+        self.acked_ts = None
+        self.done_ts = None
+        self.status = "pending"      # pending, acked, done, failed
+        self.result = ""             # FIN status word, or why it failed
+
+    @property
+    def name(self):
+        return self.cmd.split()[0] if self.cmd else ""
+
+    @property
+    def ok(self):
+        return self.status == "done" and not self.result
+
+    @property
+    def ack_rtt(self):
+        return None if self.acked_ts is None else self.acked_ts - self.sent_ts
+
+    @property
+    def duration(self):
+        return None if self.done_ts is None else self.done_ts - self.sent_ts
+
+    def __repr__(self):
+        return f"Command(#{self.seq} {self.cmd!r} {self.status} {self.result!r})"
+
+
+class SerialLink:
+    def __init__(self, port, baud=9600, name=None, echo=True, fast_baud=None):
+        self.port = port
+        self.baud = baud
+        self.fast_baud = fast_baud       # negotiate binary frames at this baud
+        self.binary = False
+        self._negotiating = False
+        self._up = False                 # the board has spoken since the port was opened
+        self._opened_ts = 0.0
+        self.name = name or os.path.basename(port)
+        self.echo = echo                 # print every received line
+
+        self.ser = None
+        self.handlers = {}               # kind -> [handler(msg)]
+        self.line_handlers = []          # handler(msg) for every line
+        self.reopen_handlers = []        # handler() after the port was reopened
+        self.lines = 0
+        self.dropped_bytes = 0
+        self.bad_frames = 0
+        self._bad_run = 0
+        self._reopen = False             # set by a corrupt-frame run, handled by the reader
+        self._buf = bytearray()
+        self._write_lock = threading.Lock()
+        self._closed = False
+        self._wake_r, self._wake_w = os.pipe()   # lets close()/request() interrupt poll()
+
+        self._seq = 0
+        self._inflight = {}              # seq -> Command
+        self._inflight_lock = threading.Lock()
+        self.rtts = {}                   # command name -> [(ack_rtt, duration)]
+        self.on("ACK", self._on_ack)
+        self.on("FIN", self._on_fin)
+        self.on("NAK", self._on_nak)
+        self.on("READY", self._on_ready)
+
+    # ----------------- HANDLERS -----------------
+    def on(self, kind, handler):
+        self.handlers.setdefault(kind, []).append(handler)
+        return handler
+
+    def on_line(self, handler):
+        self.line_handlers.append(handler)
+        return handler
+
+    def on_reopen(self, handler):
+        self.reopen_handlers.append(handler)
+        return handler
+
+    # ----------------- PORT -----------------
+    @property
+    def is_open(self):
+        return self.ser is not None and self.ser.is_open
+
+    def open(self):
+        try:
+            # timeout=0: reads return what is buffered; waiting happens in poll()
+            self.ser = serial.Serial(self.port, self.baud, timeout=0)
+            self._buf.clear()
+            self.binary = False
+            self._up = False             # opening resets the Uno; hold commands until it speaks
+            self._opened_ts = time.monotonic()
+            return True
+        except (serial.SerialException, OSError) as e:
+            print(f"[{self.name}] Serial open error:", e)
+            self.ser = None
+            return False
+
+    def write(self, cmd: str):
+        with self._write_lock:
+            if not self.is_open:
+                return False
+            try:
+                self.ser.write((cmd + "\n").encode())
+                return True
+            except (serial.SerialException, OSError) as e:
+                print(f"[{self.name}] Serial write error:", e)
+                return False
+
+    def write_frame(self, frame: bytes):
+        with self._write_lock:
+            if not self.is_open:
+                return False
+            try:
+                self.ser.write(frame)
+                return True
+            except (serial.SerialException, OSError) as e:
+                print(f"[{self.name}] Serial write error:", e)
+                return False
+
+    # ----------------- BINARY MODE -----------------
+    def _negotiate(self):
+        self._negotiating = True
+        self.request(f"BIN {self.fast_baud}", self._on_binary, hold=False)
+
+    def _on_binary(self, command):
+        self._negotiating = False
+        if command.result == "rejected":
+            print(f"[{self.name}] Firmware has no binary mode, staying in text mode")
+            self.fast_baud = None
+        if command.ok:
+            self._set_mode(True, self.fast_baud)
+            print(f"[{self.name}] Binary frames at {self.fast_baud} baud")
+        self._release()
+
+    def _set_mode(self, binary, baud):
+        with self._write_lock:
+            if self.is_open:
+                try:
+                    self.ser.baudrate = baud
+                except (serial.SerialException, OSError, ValueError) as e:
+                    print(f"[{self.name}] Baud change error:", e)
+                    return
+            self.binary = binary
+            self._buf.clear()
+            self._bad_run = 0
+
+    # ----------------- ACKNOWLEDGED COMMANDS -----------------
+    def request(self, cmd, on_done=None, done_timeout=10.0, ack_timeout=ACK_TIMEOUT,
+                retries=RETRIES, hold=True):
+        with self._inflight_lock:
+            self._seq = self._seq % 65535 + 1        # 1..65535, 0 means "no seq"
+            command = Command(self._seq, cmd, on_done, ack_timeout, done_timeout, retries)
+            command.requested_ts = command.sent_ts = time.monotonic()
+            self._inflight[command.seq] = command
+        if not (hold and self._holding()):
+            self._send(command)
+        os.write(self._wake_w, b"r")     # reader re-arms its poll timeout
+        return command
+
+    def _holding(self):
+        return not self._up or self._negotiating
+
+    def _board_up(self):
+        if not self._up:
+            self._up = True
+            self._release()
+
+    def _release(self):
+        # Send what was held back, in request order, once the link has settled
+        if self._holding():
+            return
+        with self._inflight_lock:
+            held = sorted((c for c in self._inflight.values() if c.attempts == 0),
+                          key=lambda c: c.requested_ts)
+        for command in held:
+            self._send(command)
+
+    def _send(self, command):
+        if command.attempts == 0:
+            command.sent_ts = time.monotonic()   # ACK timeouts run from here, not from request()
+        command.attempts += 1
+        if not self.binary:
+            self.write(f"#{command.seq} {command.cmd}")
+            return
+        try:
+            frame = encode_command(command.seq, command.cmd)
+        except ValueError as e:
+            self._finish(command, "failed", str(e))
+            return
+        self.write_frame(frame)
+
+    def _lookup(self, msg):
+        try:
+            seq = int(msg.args[0])
+        except (IndexError, ValueError):
+            return None
+        with self._inflight_lock:
+            return self._inflight.get(seq)
+
+    def _on_ack(self, msg):
+        command = self._lookup(msg)
+        if command and command.acked_ts is None:
+            command.acked_ts = time.monotonic()
+            command.status = "acked"
+
+    def _on_fin(self, msg):
+        command = self._lookup(msg)
+        if command:
+            if command.acked_ts is None:             # ACK line lost, FIN implies it
+                command.acked_ts = time.monotonic()
+            self._finish(command, "done", " ".join(msg.args[1:]))
+
+    def _on_nak(self, msg):
+        command = self._lookup(msg)
+        if command:
+            self._finish(command, "failed", "rejected")
+
+    def _on_ready(self, msg):
+        # The board (re)started: nothing sent before this is still running
+        self._fail_inflight("reset")
+
+    def _fail_inflight(self, result):
+        # Commands still held back never reached the board; they go out later
+        with self._inflight_lock:
+            commands = [c for c in self._inflight.values() if c.attempts > 0]
+        for command in commands:
+            self._finish(command, "failed", result)
+
+    def _finish(self, command, status, result):
+        with self._inflight_lock:
+            if self._inflight.pop(command.seq, None) is None:
+                return                                 # already finished
+        command.status = status
+        command.result = result
+        command.done_ts = time.monotonic()
+        if status == "done":
+            samples = self.rtts.setdefault(command.name, [])
+            samples.append((command.ack_rtt, command.duration))
+            del samples[:-LATENCY_SAMPLES]
+        else:
+            print(f"[{self.name}] {command.cmd} failed: {result}")
+        if command.on_done:
+            try:
+                command.on_done(command)
+            except Exception as e:
+                print(f"[{self.name}] Command callback error on {command.cmd!r}:", e)
+
+    def _check_timeouts(self):
+        # Resend unACKed commands, fail the ones that ran out of time.
+        # Returns seconds until the next deadline (None if nothing is in flight).
+        now = time.monotonic()
+        next_deadline = None
+        with self._inflight_lock:
+            commands = list(self._inflight.values())
+        released = False
+        for command in commands:
+            if command.attempts == 0:
+                deadline = max(command.requested_ts, self._opened_ts) + RESET_GRACE
+                if now >= deadline:
+                    if not self.is_open:
+                        self._finish(command, "failed", "not connected")
+                        continue
+                    self._up = released = True   # the board never spoke; try it anyway
+                    self._send(command)
+                    deadline = command.sent_ts + command.ack_timeout
+            elif command.acked_ts is None:
+                deadline = command.sent_ts + command.ack_timeout * command.attempts
+                if now >= deadline:
+                    if command.attempts > command.retries:
+                        self._finish(command, "failed", "no ACK")
+                        continue
+                    print(f"[{self.name}] No ACK for #{command.seq} {command.cmd}, resending")
+                    self._send(command)
+                    deadline = command.sent_ts + command.ack_timeout * command.attempts
+            elif command.done_timeout is not None:
+                deadline = command.acked_ts + command.done_timeout
+                if now >= deadline:
+                    self._finish(command, "failed", "timed out")
+                    continue
+            else:
+                continue
+            wait = max(deadline - now, 0.0)
+            next_deadline = wait if next_deadline is None else min(next_deadline, wait)
+        if released:
+            self._release()
+            return 0.0                   # re-arm with the released commands' deadlines
+        return next_deadline
+
+    def latency(self):
+        # Per command: ACK round trip and time to FIN, p50 / max in ms
+        report = {}
+        for name, samples in self.rtts.items():
+            acks = sorted(a for a, _ in samples)
+            dones = sorted(d for _, d in samples)
+            report[name] = {
+                "n": len(samples),
+                "ack_p50_ms": round(acks[len(acks) // 2] * 1000, 1),
+                "ack_max_ms": round(acks[-1] * 1000, 1),
+                "done_p50_ms": round(dones[len(dones) // 2] * 1000, 1),
+                "done_max_ms": round(dones[-1] * 1000, 1),
+            }
+        return report
+
+    # ----------------- READER -----------------
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        backoff = 1.0
+        while not self._closed:
+            if not self.is_open and not self.open():
+                self._check_timeouts()
+                self._sleep(backoff)
+                backoff = min(backoff * 2, REOPEN_BACKOFF_MAX)
+                continue
+            backoff = 1.0
+            try:
+                self._read_loop()
+            except (serial.SerialException, OSError) as e:
+                if not self._closed:
+                    print(f"[{self.name}] Serial read error, reopening:", e)
+            self._close_port()
+            if not self._closed:
+                self._reopened()
+
+    def _reopened(self):
+        # Opening the port again resets the Uno: fail what it was doing now
+        self._fail_inflight("reset")
+        for handler in self.reopen_handlers:
+            try:
+                handler()
+            except Exception as e:
+                print(f"[{self.name}] Reopen handler error:", e)
+
+    def _read_loop(self):
+        fd = self.ser.fileno()
+        poller = select.poll()
+        poller.register(fd, select.POLLIN | select.POLLERR | select.POLLHUP)
+        poller.register(self._wake_r, select.POLLIN)
+
+        while not self._closed:
+            timeout = self._check_timeouts()
+            for ready_fd, events in poller.poll(None if timeout is None else timeout * 1000 + 1):
+                if ready_fd == self._wake_r:
+                    os.read(self._wake_r, 64)
+                    if self._closed:
+                        return
+                    continue
+                if events & (select.POLLERR | select.POLLHUP | select.POLLNVAL):
+                    raise OSError(f"port {self.port} hung up")
+                try:
+                    chunk = os.read(fd, 4096)
+                except BlockingIOError:
+                    continue
+                if not chunk:
+                    raise OSError(f"port {self.port} closed")   # USB unplugged
+                self.feed(chunk)
+                if self._reopen:
+                    self._reopen = False
+                    return          # run() closes and reopens the port
+
+    def feed(self, chunk, ts=None):
+        # Frame raw bytes into lines; public so tools can replay captures
+        self._buf += chunk
+        ts = ts or time.time()
+        if self.binary:
+            self._feed_frames(ts)
+            if self.binary:
+                return
+        while self._buf and not self.binary:
+            end = self._buf.find(b"\n")
+            if end < 0:
+                break
+            raw = bytes(self._buf[:end])
+            del self._buf[:end + 1]
+            line = raw.decode(errors="ignore").strip()
+            if line:
+                self._dispatch(Message(line, ts))
+                if self.fast_baud and not (self.binary or self._negotiating):
+                    self._negotiate()
+                self._board_up()
+
+        if len(self._buf) > MAX_LINE:
+            self.dropped_bytes += len(self._buf)
+            print(f"[{self.name}] Discarding {len(self._buf)} bytes without a newline")
+            self._buf.clear()
+
+    def _feed_frames(self, ts):
+        while True:
+            end = self._buf.find(0)
+            newline = self._buf.find(b"\n")
+            if 0 <= newline and (end < 0 or newline < end) and looks_like_text(self._buf[:newline]):
+                # The board is talking text: it reset without us reopening
+                print(f"[{self.name}] Text line in binary mode, back to text")
+                rest = bytes(self._buf)
+                self._set_mode(False, self.baud)
+                self._buf += rest           # feed() reads it as text
+                return
+            if end < 0:
+                break
+            frame = bytes(self._buf[:end])
+            del self._buf[:end + 1]
+            if not frame:
+                continue
+            decoded = decode_event(frame)
+            if decoded is None:
+                self.bad_frames += 1
+                self._bad_run += 1
+                if self._bad_run >= MAX_BAD_FRAMES:
+                    print(f"[{self.name}] {self._bad_run} corrupt frames, reopening the port")
+                    self._set_mode(False, self.baud)
+                    self._reopen = True
+                    return
+                continue
+            self._bad_run = 0
+            self._dispatch(Message.event(*decoded, ts))
+
+        if len(self._buf) > MAX_FRAME:
+            self.dropped_bytes += len(self._buf)
+            self._buf.clear()
+
+    def _dispatch(self, msg):
+        self.lines += 1
+        if self.echo:
+            print(f"[{self.name}][ARDUINO]", msg.line)
+        for handler in self.line_handlers + self.handlers.get(msg.kind, []):
+            try:
+                handler(msg)
+            except Exception as e:
+                print(f"[{self.name}] Handler error on {msg.line!r}:", e)
+
+    # ----------------- SHUTDOWN -----------------
+    def _sleep(self, seconds):
+        # Interruptible by close() (and cut short by request())
+        if select.select([self._wake_r], [], [], seconds)[0]:
+            os.read(self._wake_r, 64)
+
+    def _close_port(self):
+        with self._write_lock:
+            if self.ser:
+                try:
+                    self.ser.close()
+                except Exception:
+                    pass
+            self.ser = None
+
+    def close(self):
+        self._closed = True
+        os.write(self._wake_w, b"x")
+        self._close_port()
+
+
+# ----------------- MONITOR -----------------
+def main():
+    port = sys.argv[1] if len(sys.argv) > 1 else "/dev/ttyUSB0"
+    baud = int(sys.argv[2]) if len(sys.argv) > 2 else 9600
+    link = SerialLink(port, baud)
+    link.start()
+    print(f"Monitoring {port} @ {baud}. Type a command (e.g. OPEN_LID, DISPENSE 20), Ctrl+D to exit.")
+    try:
+        for line in sys.stdin:
+            if line.strip():
+                link.request(line.strip(), on_done=lambda c: print(
+                    f"#{c.seq} {c.cmd}: {c.status} {c.result} ack={c.ack_rtt} total={c.duration}"),
+                    done_timeout=None)
+    except KeyboardInterrupt:
+        pass
+    print(link.latency())
+    link.close()
+
+
+if __name__ == "__main__":
+    main()
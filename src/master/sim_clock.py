@@ -0,0 +1,60 @@
+# Clocks for the feeder controller and the Arduino emulator
+#
+# Everything time-based in the controller (confirmation, feeding window,
+# intruder grace, lid delays) runs on one of these instead of calling the
+# time module directly, so a bench run can compress time:
+#
+#   SNACKLOADER_TIME_SCALE=60 python cat_feeder_controller.py
+#   SNACKLOADER_TIME_SCALE=60 python arduino_emulator.py --link /tmp/snackloader/tty-cat
+#
+# With a scale of 60 the 10-minute feeding window closes after 10 real
+# seconds. Both processes must use the same scale; they only exchange
+# durations, never absolute clock readings, so their origins may differ.
+import os
+import time
+
+TIME_SCALE_ENV = "SNACKLOADER_TIME_SCALE"
+
+
+class ScaledClock:
+    """Wall clock that runs `scale` times faster than real time."""
+
+    def __init__(self, scale=1.0):
+        if scale <= 0:
+            raise ValueError("time scale must be positive")
+        self.scale = float(scale)
+        self._origin = time.time()
+
+    def time(self):
+        return self._origin + (time.time() - self._origin) * self.scale
+
+    def sleep(self, seconds):
+        time.sleep(max(seconds, 0.0) / self.scale)
+
+    def to_real(self, seconds):
+        # Virtual duration -> real seconds to wait (None stays None)
+        return None if seconds is None else seconds / self.scale
+
+
+class ManualClock:
+    """Virtual clock that only moves when told to; sleep() fast-forwards."""
+
+    def __init__(self, start=0.0):
+        self.now = float(start)
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+    def advance(self, seconds):
+        self.now += max(seconds, 0.0)
+
+    def to_real(self, seconds):
+        return None if seconds is None else 0.0
+
+
+def default_clock():
+    # Real time unless SNACKLOADER_TIME_SCALE is set
+    return ScaledClock(float(os.environ.get(TIME_SCALE_ENV, "1") or 1))
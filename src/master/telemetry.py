@@ -0,0 +1,134 @@
+# Bowl-weight (and environment) telemetry uploader
+#
+# The Arduino reports LIVE <grams> about every 300 ms. The serial reader only
+# pushes samples into a bounded queue here (never blocking, dropping the
+# oldest sample if the uploader falls behind) and a worker thread decides
+# what actually goes to Firebase:
+#   - deadband: nothing is sent while the weight stays within `deadband` grams
+#     of the last published value
+#   - min_interval: floor between uploads, however fast the weight moves
+#   - max_interval: heartbeat, refreshes the node while samples keep coming
+#     in even if the weight has not changed
+#   - final samples (WEIGHT after DONE) skip the deadband and go out at once
+# The samples folded into one upload are summarised (min / max / count) and
+# written together with the latest value in a single multi-path update:
+#   {"weight": 41.2, "unit": "g", "timestamp": ..., "window": {"min", "max", "samples", "since"}}
+# temperature.py reuses it per reading with field="temperature" / "humidity",
+# no unit and no window, so several uploaders can share one node.
+import queue
+import threading
+import time
+
+
+class TelemetryUploader:
+    def __init__(self, ref, name="telemetry", deadband=1.0, min_interval=1.0,
+                 max_interval=30.0, queue_size=256, field="weight", unit="g", window=True):
+        self.ref = ref
+        self.name = name
+        self.field = field                # key of the value in the node
+        self.unit = unit                  # written next to it; None leaves it out
+        self.window = window              # include the min / max / count summary
+        self.deadband = deadband          # in the value's unit (grams for weight)
+        self.min_interval = min_interval  # seconds
+        self.max_interval = max_interval  # seconds
+
+        self.samples = queue.Queue(maxsize=queue_size)
+        self.received = 0
+        self.dropped = 0
+        self.uploads = 0
+        self.errors = 0
+
+        self._window = None               # summary of samples not yet uploaded
+        self._latest = None               # (value, ts)
+        self._final = False
+        self._sent_value = None
+        self._last_upload_ts = 0.0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # ----------------- PRODUCER SIDE (serial thread) -----------------
+    def push(self, value, ts=None, final=False):
+        item = (float(value), ts or time.time(), final)
+        self.received += 1
+        while True:
+            try:
+                self.samples.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.samples.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    # ----------------- WORKER -----------------
+    def _absorb(self, value, ts, final):
+        w = self._window
+        if w is None:
+            self._window = {"min": value, "max": value, "samples": 1, "since": int(ts)}
+        else:
+            w["min"] = min(w["min"], value)
+            w["max"] = max(w["max"], value)
+            w["samples"] += 1
+        self._latest = (value, ts)
+        self._final = self._final or final
+
+    def _moved(self):
+        return (self._sent_value is None
+                or abs(self._latest[0] - self._sent_value) >= self.deadband)
+
+    def _next_due(self):
+        # When the pending samples become uploadable (None: nothing pending)
+        if self._window is None:
+            return None
+        if self._final:
+            return 0.0
+        interval = self.min_interval if self._moved() else self.max_interval
+        return self._last_upload_ts + interval
+
+    def _upload(self):
+        value, ts = self._latest
+        window = self._window
+        payload = {self.field: value, "timestamp": int(ts)}
+        if self.unit is not None:
+            payload["unit"] = self.unit
+        if self.window:
+            payload["window"] = window
+        self._window = None
+        self._final = False
+        self._last_upload_ts = time.time()
+        try:
+            self.ref.update(payload)
+        except Exception as e:
+            print(f"[{self.name}] Telemetry upload error:", e)
+            self.errors += 1
+            # Keep the samples and retry after min_interval
+            self._window = window
+            self._sent_value = None
+            return
+        self.uploads += 1
+        self._sent_value = value
+
+    def _run(self):
+        while not (self._closed and self.samples.empty()):
+            due = self._next_due()
+            timeout = 1.0 if due is None else min(max(due - time.time(), 0.0), 1.0)
+            try:
+                self._absorb(*self.samples.get(timeout=timeout or 0.001))
+                # Fold in everything else that is already queued
+                while True:
+                    self._absorb(*self.samples.get_nowait())
+            except queue.Empty:
+                pass
+
+            due = self._next_due()
+            if due is not None and time.time() >= due:
+                self._upload()
+
+        if self._window is not None:
+            self._upload()
+
+    def close(self, timeout=5.0):
+        self._closed = True
+        self._thread.join(timeout)
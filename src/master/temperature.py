@@ -1,49 +1,76 @@
-import serial
 import time
-import firebase_admin
-from firebase_admin import credentials, db
+from firebase_admin import db
 
-cred = credentials.Certificate("/home/eutech/serviceAccountKey.json")
+from firebase_setup import init_app
+from rtdb_outbox import RtdbOutbox
+from serial_link import SerialLink
+from telemetry import TelemetryUploader
+from timeseries_store import TimeSeriesStore, rtdb_rollup_publisher
 
-firebase_admin.initialize_app(cred, {
-    "databaseURL": "https://snackloader-default-rtdb.asia-southeast1.firebasedatabase.app/"
-})
+init_app("/home/eutech/serviceAccountKey.json",
+         "https://snackloader-default-rtdb.asia-southeast1.firebasedatabase.app/")
 
-temp_ref = db.reference("temperature")
+# Writes are queued on the Pi and sent when the network allows
+OUTBOX_DB = "/home/eutech/.snackloader/outbox-temperature.db"
+outbox = RtdbOutbox(OUTBOX_DB, db.reference("/"))
+
+# The live node only changes when a reading moves past its deadband, or as a
+# heartbeat; the Arduino reports once a second either way
+temp_ref = outbox.reference("temperature")
+TEMP_DEADBAND = 0.2          # °C
+HUMIDITY_DEADBAND = 1.0      # %
+MIN_INTERVAL = 5.0           # seconds between uploads of one reading
+MAX_INTERVAL = 300.0         # heartbeat while the reading holds steady
+uploaders = {
+    field: TelemetryUploader(temp_ref, "TEMP", deadband, MIN_INTERVAL, MAX_INTERVAL,
+                             field=field, unit=None, window=False)
+    for field, deadband in (("temperature", TEMP_DEADBAND), ("humidity", HUMIDITY_DEADBAND))
+}
+
+# Every reading is kept on the Pi; only closed hour/day rollups go to RTDB
+TIMESERIES_DB = "/home/eutech/.snackloader/timeseries.db"
+history = TimeSeriesStore(TIMESERIES_DB, rtdb_rollup_publisher(outbox.reference("history")),
+                          series=("temperature", "humidity"))
 
 def read_temperature_from_arduino(port="/dev/ttyACM1", baud=9600):
-    ser = serial.Serial(port, baud, timeout=1)
+    link = SerialLink(port, baud, "TEMP", echo=False)
+    link.on_line(handle_reading)
+    link.open()
     time.sleep(2)  # allow Arduino to reset
-    return ser
+    return link
 
-def main():
-    print("Starting temperature system...")
+def handle_reading(msg):
+    # "<temperature>,<humidity>", one line per second from the Arduino
+    if "," not in msg.line:
+        return
+    try:
+        t, h = (float(v) for v in msg.line.split(","))
+    except ValueError:
+        return  # ignore corrupted readings
 
-    ser = read_temperature_from_arduino()
+    print(f"Temp: {t} °C | Humidity: {h} %")
 
-    while True:
-        if ser.in_waiting > 0:
-            line = ser.readline().decode().strip()
+    history.record("temperature", t, msg.ts)
+    history.record("humidity", h, msg.ts)
 
-            if "," in line:
-                try:
-                    t, h = line.split(",")
-                    t = float(t)
-                    h = float(h)
+    # Upload to Firebase, deadbanded and rate-limited
+    uploaders["temperature"].push(t, msg.ts)
+    uploaders["humidity"].push(h, msg.ts)
 
-                    print(f"Temp: {t} °C | Humidity: {h} %")
-
-                    # Upload to Firebase
-                    temp_ref.set({
-                        "temperature": t,
-                        "humidity": h,
-                        "timestamp": int(time.time())
-                    })
+def main():
+    print("Starting temperature system...")
 
-                except:
-                    pass  # ignore corrupted readings
+    link = read_temperature_from_arduino()
 
-        time.sleep(1)
+    # Blocks on the port; each complete line is handled as it arrives
+    try:
+        link.run()
+    except KeyboardInterrupt:
+        link.close()
+        for uploader in uploaders.values():
+            uploader.close()
+        history.close()
+        outbox.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,244 @@
+# On-device time-series store for bowl weight and environment readings
+#
+# Raw samples (LIVE/WEIGHT grams, temperature, humidity) are kept in SQLite
+# on the Pi instead of overwriting a single RTDB node, so history survives
+# and can be queried by time range. Writers only append to an in-memory
+# buffer; a background thread flushes it every few seconds in one
+# transaction (WAL mode, synchronous=NORMAL) which keeps CPU and SD-card wear
+# low even with several multi-hertz series. The same flush folds the batch
+# into minute / hour / day rollups (count, sum, min, max, last).
+#
+# Only closed rollup buckets leave the device: `publish(rows)` is called
+# with every bucket in `publish_buckets` whose period has ended and that has
+# not been published yet (it is retried on the next flush if it raises).
+# Several processes share one file, so each store only publishes the
+# `series` it records; otherwise they would race to send each other's rows.
+# Raw samples and minute rollups are pruned after their retention period.
+import os
+import sqlite3
+import threading
+import time
+
+BUCKETS = {"minute": 60, "hour": 3600, "day": 86400}
+RAW_RETENTION = 7 * 86400        # seconds of raw samples kept on the device
+MINUTE_RETENTION = 30 * 86400    # seconds of minute rollups kept on the device
+PRUNE_INTERVAL = 3600.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    series TEXT NOT NULL,
+    ts REAL NOT NULL,
+    value REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS samples_series_ts ON samples (series, ts);
+CREATE TABLE IF NOT EXISTS rollups (
+    series TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    sum REAL NOT NULL,
+    min REAL NOT NULL,
+    max REAL NOT NULL,
+    last REAL NOT NULL,
+    last_ts REAL NOT NULL,
+    published INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (series, bucket, start)
+) WITHOUT ROWID;
+"""
+
+UPSERT_ROLLUP = """
+INSERT INTO rollups (series, bucket, start, count, sum, min, max, last, last_ts)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (series, bucket, start) DO UPDATE SET
+    count = count + excluded.count,
+    sum = sum + excluded.sum,
+    min = MIN(min, excluded.min),
+    max = MAX(max, excluded.max),
+    last = CASE WHEN excluded.last_ts >= last_ts THEN excluded.last ELSE last END,
+    last_ts = MAX(last_ts, excluded.last_ts),
+    published = 0
+"""
+
+
+def rollup_row(series, bucket, start, count, total, lo, hi, last):
+    return {
+        "series": series,
+        "bucket": bucket,
+        "start": start,
+        "count": count,
+        "avg": round(total / count, 3) if count else None,
+        "min": lo,
+        "max": hi,
+        "last": last,
+    }
+
+
+class TimeSeriesStore:
+    def __init__(self, path, publish=None, publish_buckets=("hour", "day"), series=None,
+                 flush_interval=5.0, flush_rows=1000):
+        self.path = path
+        self.publish = publish                  # publish(list of rollup dicts), may raise
+        self.publish_buckets = tuple(publish_buckets)
+        self.series = tuple(series) if series is not None else None   # None: publish every series
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+
+        self.written = 0
+        self.flushes = 0
+        self._buffer = []                       # (series, ts, value)
+        self._cond = threading.Condition()
+        self._closed = False
+        self._last_prune_ts = 0.0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Several processes (controller, temperature.py) share the file
+        self._db = sqlite3.connect(path, timeout=10.0, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._db_lock = threading.Lock()
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # ----------------- WRITE SIDE (cheap, any thread) -----------------
+    def record(self, series, value, ts=None):
+        with self._cond:
+            self._buffer.append((series, ts or time.time(), float(value)))
+            if len(self._buffer) >= self.flush_rows:
+                self._cond.notify()
+
+    # ----------------- FLUSH -----------------
+    def _aggregate(self, batch):
+        groups = {}
+        for series, ts, value in batch:
+            for bucket, width in BUCKETS.items():
+                key = (series, bucket, int(ts // width * width))
+                g = groups.get(key)
+                if g is None:
+                    groups[key] = [1, value, value, value, value, ts]
+                else:
+                    g[0] += 1
+                    g[1] += value
+                    g[2] = min(g[2], value)
+                    g[3] = max(g[3], value)
+                    if ts >= g[5]:
+                        g[4], g[5] = value, ts
+        return [(*key, *g) for key, g in groups.items()]
+
+    def flush(self):
+        with self._cond:
+            batch, self._buffer = self._buffer, []
+        if batch:
+            try:
+                with self._db_lock:
+                    self._db.execute("BEGIN")
+                    self._db.executemany("INSERT INTO samples (series, ts, value) VALUES (?, ?, ?)", batch)
+                    self._db.executemany(UPSERT_ROLLUP, self._aggregate(batch))
+                    self._db.execute("COMMIT")
+                self.written += len(batch)
+                self.flushes += 1
+            except sqlite3.Error as e:
+                print("Time-series flush error:", e)
+                with self._db_lock:
+                    if self._db.in_transaction:
+                        self._db.execute("ROLLBACK")
+                with self._cond:
+                    self._buffer[:0] = batch     # retried on the next flush
+                return
+
+        self._publish_closed()
+        if time.time() - self._last_prune_ts >= PRUNE_INTERVAL:
+            self.prune()
+
+    def _publish_closed(self):
+        if not self.publish or not self.publish_buckets:
+            return
+        now = time.time()
+        own, own_args = "", ()
+        if self.series is not None:
+            own = " AND series IN (%s)" % ", ".join("?" * len(self.series))
+            own_args = self.series
+        rows, keys = [], []
+        with self._db_lock:
+            for bucket in self.publish_buckets:
+                cur = self._db.execute(
+                    "SELECT series, start, count, sum, min, max, last FROM rollups "
+                    "WHERE bucket = ? AND published = 0 AND start + ? <= ?" + own,
+                    (bucket, BUCKETS[bucket], now, *own_args))
+                for series, start, count, total, lo, hi, last in cur:
+                    rows.append(rollup_row(series, bucket, start, count, total, lo, hi, last))
+                    keys.append((series, bucket, start))
+        if not rows:
+            return
+        try:
+            self.publish(rows)
+        except Exception as e:
+            print("Rollup publish error:", e)
+            return
+        with self._db_lock:
+            self._db.executemany(
+                "UPDATE rollups SET published = 1 WHERE series = ? AND bucket = ? AND start = ?", keys)
+
+    def prune(self, now=None):
+        now = now or time.time()
+        self._last_prune_ts = now
+        try:
+            with self._db_lock:
+                self._db.execute("DELETE FROM samples WHERE ts < ?", (now - RAW_RETENTION,))
+                self._db.execute("DELETE FROM rollups WHERE bucket = 'minute' AND start < ?",
+                                 (now - MINUTE_RETENTION,))
+        except sqlite3.Error as e:
+            print("Time-series prune error:", e)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._buffer) < self.flush_rows:
+                    self._cond.wait(self.flush_interval)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+    # ----------------- QUERIES -----------------
+    def range(self, series, start, end=None):
+        # Raw samples in [start, end) as (ts, value), oldest first
+        end = end or time.time() + 1
+        with self._db_lock:
+            return self._db.execute(
+                "SELECT ts, value FROM samples WHERE series = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                (series, start, end)).fetchall()
+
+    def rollups(self, series, bucket, start, end=None):
+        # Rollup buckets whose start lies in [start, end), oldest first
+        end = end or time.time() + 1
+        with self._db_lock:
+            cur = self._db.execute(
+                "SELECT start, count, sum, min, max, last FROM rollups "
+                "WHERE series = ? AND bucket = ? AND start >= ? AND start < ? ORDER BY start",
+                (series, bucket, start, end))
+            return [rollup_row(series, bucket, *row) for row in cur]
+
+    def close(self, timeout=10.0):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        with self._db_lock:
+            self._db.close()
+
+
+# ----------------- FIREBASE -----------------
+def rtdb_rollup_publisher(ref):
+    # All closed buckets go out in one multi-path update under `ref`:
+    #   history/<series>/<bucket>/<start>: {count, avg, min, max, last}
+    def publish(rows):
+        ref.update({
+            f"{row['series']}/{row['bucket']}/{row['start']}": {
+                k: row[k] for k in ("count", "avg", "min", "max", "last")
+            }
+            for row in rows
+        })
+    return publish
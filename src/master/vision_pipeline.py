@@ -0,0 +1,163 @@
+# Staged capture -> preprocess -> inference -> publish pipeline for camera.py
+#
+# Each stage runs on its own thread and hands work to the next through a
+# bounded queue. OpenCV releases the GIL inside cap.read() and net.detect(),
+# so threads are enough to keep all four Pi 4 cores busy without paying to
+# pickle 640x480 frames between processes.
+import queue
+import threading
+import time
+
+
+class FrameItem:
+    """One captured frame as it travels through the pipeline."""
+
+    __slots__ = ("seq", "captured_ts", "img", "data", "result", "infer_ms")
+
+    def __init__(self, seq, captured_ts, img):
+        self.seq = seq
+        self.captured_ts = captured_ts
+        self.img = img
+        self.data = img      # preprocessed input (defaults to the raw frame)
+        self.result = None   # whatever the inference stage returned
+        self.infer_ms = 0.0
+
+
+class LatestSlot:
+    """Single-slot mailbox: put() overwrites, get() waits for the newest item."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if self._item is not None:
+                self.dropped += 1
+            self._item = item
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._item is not None, timeout):
+                return None
+            item, self._item = self._item, None
+            return item
+
+
+def put_latest(q, item):
+    # Bounded queue that drops its oldest entry instead of blocking the producer.
+    # Returns how many stale entries were thrown away.
+    dropped = 0
+    while True:
+        try:
+            q.put_nowait(item)
+            return dropped
+        except queue.Full:
+            try:
+                q.get_nowait()
+                dropped += 1
+            except queue.Empty:
+                pass
+
+
+class VisionPipeline:
+    """
+    read_frame() -> (ok, img)       capture stage, newest frame always wins
+    preprocess(item) -> bool        optional; return False to drop the frame
+    infer(item) -> result           stored on item.result
+    publish(item) -> bool           runs on the caller's thread; False stops
+    """
+
+    def __init__(self, read_frame, infer, publish, preprocess=None, queue_size=2):
+        self.read_frame = read_frame
+        self.infer = infer
+        self.publish = publish
+        self.preprocess = preprocess
+
+        self.captured = LatestSlot()
+        self.to_infer = queue.Queue(maxsize=queue_size)
+        self.to_publish = queue.Queue(maxsize=queue_size)
+        self.stop_event = threading.Event()
+
+        self.frames = 0
+        self.skipped = 0
+        self.stale = 0
+        self.inferred = 0
+        self.published = 0
+        self.latency_sum = 0.0
+        self.started_ts = 0.0
+        self.error = None
+
+    # ----------------- STAGES -----------------
+    def _capture_loop(self):
+        seq = 0
+        while not self.stop_event.is_set():
+            ok, img = self.read_frame()
+            if not ok:
+                self.error = "Camera not found!"
+                self.stop_event.set()
+                break
+            seq += 1
+            self.frames += 1
+            self.captured.put(FrameItem(seq, time.time(), img))
+
+    def _preprocess_loop(self):
+        while not self.stop_event.is_set():
+            item = self.captured.get(timeout=0.5)
+            if item is None:
+                continue
+            if self.preprocess and not self.preprocess(item):
+                self.skipped += 1
+                continue
+            self.stale += put_latest(self.to_infer, item)
+
+    def _infer_loop(self):
+        while not self.stop_event.is_set():
+            try:
+                item = self.to_infer.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            t0 = time.time()
+            item.result = self.infer(item)
+            item.infer_ms = (time.time() - t0) * 1000.0
+            self.inferred += 1
+            self.stale += put_latest(self.to_publish, item)
+
+    # ----------------- CONTROL -----------------
+    def start(self):
+        self.started_ts = time.time()
+        for target in (self._capture_loop, self._preprocess_loop, self._infer_loop):
+            threading.Thread(target=target, daemon=True).start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        # Publish stage lives on the calling thread so cv2.imshow keeps working
+        self.start()
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    item = self.to_publish.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                self.published += 1
+                self.latency_sum += time.time() - item.captured_ts
+                if self.publish(item) is False:
+                    break
+        finally:
+            self.stop()
+        if self.error:
+            print(self.error)
+
+    def stats(self):
+        elapsed = max(time.time() - self.started_ts, 1e-6)
+        return {
+            "capture_fps": round(self.frames / elapsed, 1),
+            "infer_fps": round(self.inferred / elapsed, 1),
+            "stale_dropped": self.captured.dropped + self.stale,
+            "preprocess_dropped": self.skipped,
+            "avg_latency_ms": round(1000.0 * self.latency_sum / max(self.published, 1), 1),
+        }
@@ -1,15 +1,38 @@
-#include <Stepper.h>
+#include <AccelStepper.h>
+#include <util/crc16.h>
 #include "HX711.h"
 
 //  DISPENSER STEPPER
-Stepper dispStepper(2048, 7, 5, 6, 4);
-const int DISP_OPEN_STEPS  = 350;
-const int DISP_CLOSE_STEPS = -350;
+// 28BYJ-48 + ULN2003, full steps (2048 / rev), pins IN1, IN3, IN2, IN4
+AccelStepper dispStepper(AccelStepper::FULL4WIRE, 7, 5, 6, 4);
+const long DISP_OPEN_POS   = 350;
+const long DISP_CLOSED_POS = 0;
 
 //  LID STEPPER
-Stepper lidStepper(2048, 11, 9, 10, 8);
-const int LID_OPEN_STEPS  = 500;
-const int LID_CLOSE_STEPS = -500;
+AccelStepper lidStepper(AccelStepper::FULL4WIRE, 11, 9, 10, 8);
+const long LID_OPEN_POS   = 500;
+const long LID_CLOSED_POS = 0;
+
+//  MOTION
+// Moves are started with moveTo() and stepped by run() on every pass of
+// loop(), with trapezoidal speed ramps, so weighing and serial commands
+// carry on while the motors turn. The cruise speed is the old fixed 15 rpm
+// (512 steps/s); only raise it after checking on the feeder that the
+// 28BYJ-48 does not skip steps under load.
+// Reaching the target is reported as its own event (LID_OPENED,
+// LID_CLOSED, OPEN_DISP, CLOSED_DISP) and a lid command FINs only then.
+// Both motors start at position 0, i.e. closed, as the old relative moves assumed.
+// A reset (the host reopening the port toggles DTR) with the lid open breaks
+// that assumption, so FORCE_CLOSE_LID does not trust the position: it
+// assumes the lid is fully open and drives the whole travel shut. A lid that
+// was nearer closed just stalls against the closed stop for the remaining
+// steps (the 28BYJ-48 skips harmlessly there), which homes it to 0.
+const float MAX_STEPS_PER_S    = 512;
+const float ACCEL_STEPS_PER_S2 = 4000;
+byte lidMotion = 0;                    // 0 idle, 1 opening, 2 closing
+byte dispMotion = 0;
+unsigned int lidSeq = 0;               // lid command waiting for its motion
+bool dispenseAfterLid = false;         // DISPENSE waiting for the lid to open
 
 //  HX711 SCALE
 #define DT 2
@@ -17,129 +40,489 @@ const int LID_CLOSE_STEPS = -500;
 HX711 scale;
 float calibration_factor = 471709.53;
 
+//  LOAD CELL FILTER
+// The HX711 converts continuously (10 SPS); loop() only reads it when DOUT
+// says a conversion is ready, so weighing never blocks. Raw samples go into
+// a ring buffer with a running sum: LIVE / WEIGHT report the moving average,
+// the dispensing cutoff uses the median of the newest 3 samples (reacts
+// within a sample, ignores single spikes).
+const byte FILTER_LEN = 8;
+long ring[FILTER_LEN];
+long ringSum = 0;                      // 24-bit samples, 8 of them fit easily
+byte ringHead = 0;
+byte ringCount = 0;
+unsigned long samplesTaken = 0;
+bool settling = false;                 // dispenser closed, waiting for a settled WEIGHT
+unsigned long settleFrom = 0;
+
 //  STATE
 bool dispensing = false;
 float targetGrams = 0;
 unsigned long lastLiveSend = 0;
 bool lidStatus = false;
 
-float getFastWeight() {
-  long raw = scale.read();
+//  COMMAND SEQUENCE IDS
+// "#<seq> CMD" is answered with "ACK <seq>" as soon as it is read and
+// "FIN <seq> [status]" once it has completed ("NAK <seq>" if unknown).
+// The host resends a command it got no ACK for; a seq seen recently is
+// re-ACKed (and re-FINished if done) instead of being run twice.
+// Commands without a seq behave as before.
+const byte SEQ_HISTORY = 4;
+unsigned int seenSeq[SEQ_HISTORY] = {0};
+byte seenState[SEQ_HISTORY] = {0};     // 0 running, 1 done, 2 stopped
+byte seenNext = 0;
+unsigned int dispenseSeq = 0;          // DISPENSE waiting for its FIN
+
+//  BINARY MODE
+// "#<seq> BIN <baud>" switches to binary frames at <baud> after its FIN:
+//   COBS(type, fields, crc16) 0x00
+// fields are little-endian (seq uint16, grams float), crc16 is CCITT
+// (0x1021, init 0xFFFF) over type + fields; see src/master/serial_frames.py.
+// Frames with a bad CRC are dropped; MAX_BAD_FRAMES of them in a row drop
+// back to text at 9600, where the host renegotiates. A reset does the same.
+// So does a text line read in binary mode (a host that restarted without
+// resetting the board): its first byte is larger than any COBS code byte a
+// FRAME_MAX frame can start with, and it ends in '\n' before any 0x00.
+const long TEXT_BAUD = 9600;
+const byte MAX_BAD_FRAMES = 8;
+bool binMode = false;
+byte badFrames = 0;                    // corrupt frames in a row
+
+const byte EV_READY       = 0x01;
+const byte EV_LIVE        = 0x02;
+const byte EV_WEIGHT      = 0x03;
+const byte EV_DONE        = 0x04;
+const byte EV_STOPPED     = 0x05;
+const byte EV_LID_OPENED  = 0x06;
+const byte EV_LID_CLOSED  = 0x07;
+const byte EV_OPEN_DISP   = 0x08;
+const byte EV_CLOSED_DISP = 0x09;
+const byte EV_TARGET      = 0x0A;
+const byte EV_ACK         = 0x10;
+const byte EV_FIN         = 0x11;
+const byte EV_NAK         = 0x12;
+
+const byte CMD_OPEN_LID        = 0x81;
+const byte CMD_CLOSE_LID       = 0x82;
+const byte CMD_DISPENSE        = 0x83;
+const byte CMD_STOP            = 0x84;
+const byte CMD_FORCE_CLOSE_LID = 0x85;
+const byte CMD_UNKNOWN         = 0;
+
+const byte TEXT_MAX = 32;
+char textLine[TEXT_MAX + 1];
+byte textLen = 0;
+
+const byte FRAME_MAX = 16;
+byte rxFrame[FRAME_MAX];
+byte rxLen = 0;
+bool rxOverflow = false;
+
+uint16_t crc16(const byte* data, byte len) {
+  uint16_t crc = 0xFFFF;
+  for (byte i = 0; i < len; i++) crc = _crc_xmodem_update(crc, data[i]);
+  return crc;
+}
+
+void sendFrame(byte type, const byte* fields, byte len) {
+  byte raw[FRAME_MAX];
+  raw[0] = type;
+  memcpy(raw + 1, fields, len);
+  uint16_t crc = crc16(raw, len + 1);
+  raw[len + 1] = crc & 0xFF;
+  raw[len + 2] = crc >> 8;
+
+  // COBS: each zero is replaced by the distance to the next one
+  byte out[FRAME_MAX + 2];
+  byte codeAt = 0, code = 1, n = 1;
+  for (byte i = 0; i < len + 3; i++) {
+    if (raw[i] == 0) {
+      out[codeAt] = code;
+      codeAt = n++;
+      code = 1;
+    } else {
+      out[n++] = raw[i];
+      code++;
+    }
+  }
+  out[codeAt] = code;
+  Serial.write(out, n);
+  Serial.write((byte)0);
+}
+
+//  REPORTS (text line or binary frame)
+void report(byte type, const char* text) {
+  if (binMode) sendFrame(type, NULL, 0);
+  else Serial.println(text);
+}
+
+void reportGrams(byte type, const char* text, float grams, byte decimals) {
+  if (binMode) {
+    sendFrame(type, (const byte*)&grams, sizeof(grams));
+  } else {
+    Serial.print(text);
+    Serial.print(' ');
+    Serial.println(grams, decimals);
+  }
+}
+
+void reportSeq(byte type, const char* text, unsigned int seq, byte state) {
+  if (binMode) {
+    byte fields[3] = {(byte)(seq & 0xFF), (byte)(seq >> 8), state};
+    sendFrame(type, fields, type == EV_FIN ? 3 : 2);
+  } else {
+    Serial.print(text);
+    Serial.print(' ');
+    Serial.print(seq);
+    Serial.println(type == EV_FIN && state == 2 ? " STOPPED" : "");
+  }
+}
+
+bool pollScale() {
+  if (!scale.is_ready()) return false;
+  long raw = scale.read();             // conversion is waiting, returns at once
+  if (ringCount == FILTER_LEN) ringSum -= ring[ringHead];
+  else ringCount++;
+  ring[ringHead] = raw;
+  ringSum += raw;
+  ringHead = (ringHead + 1) % FILTER_LEN;
+  samplesTaken++;
+  return true;
+}
+
+void resetFilter() {
+  ringSum = 0;
+  ringHead = 0;
+  ringCount = 0;
+}
+
+long recentSample(byte back) {
+  return ring[(ringHead + FILTER_LEN - 1 - back) % FILTER_LEN];
+}
+
+float toGrams(float raw) {
   float kg = (raw - scale.get_offset()) / scale.get_scale();
   if (kg < 0) kg = 0;
   return kg * 1000.0;
 }
 
 float getLiveWeight() {
-  float kg = scale.get_units(10);
-  if (kg < 0) kg = 0;
-  return kg * 1000.0;
+  return toGrams((float)ringSum / ringCount);
+}
+
+float getCutoffWeight() {
+  if (ringCount < 3) return toGrams(recentSample(0));
+  long a = recentSample(0), b = recentSample(1), c = recentSample(2);
+  return toGrams(max(min(a, b), min(max(a, b), c)));
 }
 
 void openDispenser() {
-  dispStepper.step(DISP_OPEN_STEPS);
-  Serial.println("OPEN_DISP");
+  dispMotion = 1;
+  dispStepper.moveTo(DISP_OPEN_POS);
 }
 
 void closeDispenser() {
-  dispStepper.step(DISP_CLOSE_STEPS);
-  Serial.println("CLOSED_DISP");
+  dispMotion = 2;
+  dispStepper.moveTo(DISP_CLOSED_POS);
+}
+
+void moveLid(unsigned int seq, byte motion, long pos) {
+  // A lid move still running is superseded: its command finishes STOPPED
+  finCommand(lidSeq, 2);
+  lidSeq = seq;
+  lidMotion = motion;
+  lidStatus = false;
+  lidStepper.moveTo(pos);
 }
 
-void openLid() {
-  lidStepper.step(LID_OPEN_STEPS);
-  lidStatus = true;
-  Serial.println("OPEN_LID");
-  Serial.println("LID_OPENED");
+void openLid(unsigned int seq) {
+  moveLid(seq, 1, LID_OPEN_POS);
+  if (!binMode) Serial.println("OPEN_LID");
 }
 
-void closeLid() {
-  lidStepper.step(LID_CLOSE_STEPS);
-  lidStatus = false;
-  Serial.println("CLOSE_LID");
-  Serial.println("LID_CLOSED");
+void closeLid(unsigned int seq, bool force) {
+  if (force) lidStepper.setCurrentPosition(LID_OPEN_POS);
+  moveLid(seq, 2, LID_CLOSED_POS);
+  if (!binMode) Serial.println("CLOSE_LID");
+  if (dispenseAfterLid) {
+    // The dispense was still waiting for the lid; it won't open now
+    dispenseAfterLid = false;
+    dispensing = false;
+    finCommand(dispenseSeq, 2);
+    dispenseSeq = 0;
+  }
 }
 
 void startDispense(float grams) {
   targetGrams = grams;
   dispensing = true;
-  if ( lidStatus == false){
-    openLid();
+  if (lidStatus) {
+    openDispenser();
+  } else {
+    if (lidMotion != 1) openLid(0);
+    dispenseAfterLid = true;
+  }
+  reportGrams(EV_TARGET, "TARGET", targetGrams, 2);
+}
+
+void runMotors() {
+  lidStepper.run();
+  dispStepper.run();
+
+  if (lidMotion != 0 && lidStepper.distanceToGo() == 0) {
+    bool opened = lidMotion == 1;
+    lidMotion = 0;
+    lidStatus = opened;
+    if (opened) report(EV_LID_OPENED, "LID_OPENED");
+    else report(EV_LID_CLOSED, "LID_CLOSED");
+    finCommand(lidSeq, 1);
+    lidSeq = 0;
+    if (opened && dispenseAfterLid) {
+      dispenseAfterLid = false;
+      openDispenser();
+    }
+  }
+
+  if (dispMotion != 0 && dispStepper.distanceToGo() == 0) {
+    bool opened = dispMotion == 1;
+    dispMotion = 0;
+    if (opened) {
+      report(EV_OPEN_DISP, "OPEN_DISP");
+    } else {
+      report(EV_CLOSED_DISP, "CLOSED_DISP");
+      settleFrom = samplesTaken;       // weigh from the moment the gate is shut
+    }
+  }
+}
+
+int seqSlot(unsigned int seq) {
+  for (byte i = 0; i < SEQ_HISTORY; i++) {
+    if (seq != 0 && seenSeq[i] == seq) return i;
+  }
+  return -1;
+}
+
+void ackCommand(unsigned int seq) {
+  if (seq == 0) return;
+  seenSeq[seenNext] = seq;
+  seenState[seenNext] = 0;
+  seenNext = (seenNext + 1) % SEQ_HISTORY;
+  reportSeq(EV_ACK, "ACK", seq, 0);
+}
+
+void finCommand(unsigned int seq, byte state) {
+  if (seq == 0) return;
+  int slot = seqSlot(seq);
+  if (slot >= 0) seenState[slot] = state;
+  reportSeq(EV_FIN, "FIN", seq, state);
+}
+
+void nakCommand(unsigned int seq) {
+  if (seq == 0) return;
+  reportSeq(EV_NAK, "NAK", seq, 0);
+}
+
+void runCommand(unsigned int seq, byte cmd, float grams) {
+  int slot = seqSlot(seq);
+  if (slot >= 0) {
+    // Resend of a command we already have: answer again, don't rerun it
+    reportSeq(EV_ACK, "ACK", seq, 0);
+    if (seenState[slot] != 0) finCommand(seq, seenState[slot]);
+  } else if (cmd == CMD_OPEN_LID) {
+    ackCommand(seq);
+    openLid(seq);                      // FIN when the lid gets there
+  } else if (cmd == CMD_CLOSE_LID || cmd == CMD_FORCE_CLOSE_LID) {
+    ackCommand(seq);
+    closeLid(seq, cmd == CMD_FORCE_CLOSE_LID);
+  } else if (cmd == CMD_DISPENSE && grams > 0) {
+    ackCommand(seq);
+    // A new target replaces a dispense still running
+    finCommand(dispenseSeq, 2);
+    settling = false;
+    dispenseSeq = seq;
+    startDispense(grams);
+  } else if (cmd == CMD_STOP) {
+    ackCommand(seq);
+    dispensing = false;
+    settling = false;
+    dispenseAfterLid = false;
+    closeDispenser();
+    report(EV_STOPPED, "STOPPED");
+    finCommand(dispenseSeq, 2);
+    dispenseSeq = 0;
+    finCommand(seq, 1);
+  } else {
+    nakCommand(seq);
+  }
+}
+
+void readText() {
+  // Collect characters without waiting; run each line once it is complete
+  while (Serial.available() > 0) {
+    char c = Serial.read();
+    if (c != '\n') {
+      if (textLen < TEXT_MAX) textLine[textLen++] = c;
+      continue;
+    }
+    textLine[textLen] = 0;
+    textLen = 0;
+    runTextCommand(String(textLine));
+    if (binMode) return;               // the rest arrives as frames
+  }
+}
+
+void runTextCommand(String cmd) {
+  cmd.trim();
+
+  // Commands, optionally prefixed with "#<seq> ":
+  // OPEN_LID / CLOSE_LID / FORCE_CLOSE_LID
+  // DISPENSE <grams>
+  // STOP
+  // BIN <baud>
+
+  unsigned int seq = 0;
+  if (cmd.startsWith("#")) {
+    int space = cmd.indexOf(' ');
+    seq = cmd.substring(1, space).toInt();
+    cmd = space > 0 ? cmd.substring(space + 1) : "";
+  }
+
+  if (cmd.startsWith("BIN") && seqSlot(seq) < 0) {
+    long baud = cmd.substring(3).toInt();
+    if (seq == 0 || baud <= TEXT_BAUD || baud > 250000) {
+      nakCommand(seq);
+      return;
+    }
+    ackCommand(seq);
+    finCommand(seq, 1);
+    Serial.flush();              // FIN goes out at the old baud
+    Serial.begin(baud);
+    binMode = true;
+    badFrames = 0;
+    rxLen = 0;
+    return;
+  }
+
+  byte code = CMD_UNKNOWN;
+  float grams = 0;
+  if (cmd == "OPEN_LID") code = CMD_OPEN_LID;
+  else if (cmd == "CLOSE_LID") code = CMD_CLOSE_LID;
+  else if (cmd == "FORCE_CLOSE_LID") code = CMD_FORCE_CLOSE_LID;
+  else if (cmd == "STOP") code = CMD_STOP;
+  else if (cmd.startsWith("DISPENSE")) {
+    code = CMD_DISPENSE;
+    grams = cmd.substring(8).toFloat();
+  }
+  runCommand(seq, code, grams);
+}
+
+bool handleFrame(byte* buf, byte len) {
+  // COBS decode in place; false if the frame is corrupt
+  byte n = 0, i = 0;
+  while (i < len) {
+    byte code = buf[i];
+    if (code == 0 || i + code > len) return false;
+    for (byte j = 1; j < code; j++) buf[n++] = buf[i + j];
+    i += code;
+    if (i < len) buf[n++] = 0;
+  }
+  // type, seq (2), crc (2)
+  if (n < 5) return false;
+  uint16_t crc = buf[n - 2] | (buf[n - 1] << 8);
+  if (crc16(buf, n - 2) != crc) return false;
+
+  unsigned int seq = buf[1] | (buf[2] << 8);
+  float grams = 0;
+  if (buf[0] == CMD_DISPENSE && n - 2 >= 7) memcpy(&grams, buf + 3, sizeof(grams));
+  runCommand(seq, buf[0], grams);
+  return true;
+}
+
+void textMode() {
+  Serial.flush();
+  Serial.begin(TEXT_BAUD);
+  binMode = false;
+  badFrames = 0;
+  textLen = 0;
+  rxLen = 0;
+  rxOverflow = false;
+}
+
+void readFrames() {
+  while (Serial.available() > 0) {
+    byte b = Serial.read();
+    if (b == '\n' && rxLen > 0 && rxFrame[0] > FRAME_MAX) {
+      textMode();                      // the host is talking text; it resends
+      return;
+    }
+    if (b != 0) {
+      if (rxLen < FRAME_MAX) rxFrame[rxLen++] = b;
+      else rxOverflow = true;
+      continue;
+    }
+    bool good = rxLen == 0 || (!rxOverflow && handleFrame(rxFrame, rxLen));
+    rxLen = 0;
+    rxOverflow = false;
+    if (good) {
+      badFrames = 0;
+    } else if (++badFrames >= MAX_BAD_FRAMES) {
+      textMode();                      // baud mismatch or a host that reset
+      return;
+    }
   }
-  Serial.print("TARGET ");
-  Serial.println(targetGrams);
 }
 
 void setup() {
-  Serial.begin(9600);
+  Serial.begin(TEXT_BAUD);
 
-  dispStepper.setSpeed(15);
-  lidStepper.setSpeed(15);
+  dispStepper.setMaxSpeed(MAX_STEPS_PER_S);
+  dispStepper.setAcceleration(ACCEL_STEPS_PER_S2);
+  lidStepper.setMaxSpeed(MAX_STEPS_PER_S);
+  lidStepper.setAcceleration(ACCEL_STEPS_PER_S2);
 
   scale.begin(DT, SCK);
   scale.set_scale(calibration_factor);
 
   delay(1500);
   scale.tare();
+  resetFilter();
 
-  Serial.println("READY");
+  report(EV_READY, "READY");
 }
 
 void loop() {
 
-  if (dispensing) {
-    float fastW = getFastWeight();
+  runMotors();
+  bool fresh = pollScale();
 
-    if (fastW >= targetGrams) {
-      closeDispenser();
-      dispensing = false;
-
-      // final stable reading
-      float finalW = getLiveWeight();
+  if (dispensing && fresh && getCutoffWeight() >= targetGrams) {
+    closeDispenser();
+    dispensing = false;
+    dispenseAfterLid = false;
+    settling = true;
+  }
 
-      Serial.println("DONE");
-      Serial.print("WEIGHT ");
-      Serial.println(finalW, 1);
-    }
+  // final stable reading: a full window of samples taken after the close
+  if (settling && dispMotion == 0 && samplesTaken - settleFrom >= FILTER_LEN) {
+    settling = false;
+    report(EV_DONE, "DONE");
+    reportGrams(EV_WEIGHT, "WEIGHT", getLiveWeight(), 1);
+    finCommand(dispenseSeq, 1);
+    dispenseSeq = 0;
   }
 
-  if (millis() - lastLiveSend > 300) {
+  if (millis() - lastLiveSend > 300 && ringCount > 0) {
     float liveW = getLiveWeight();
 
-    Serial.print("LIVE ");
-    Serial.println(liveW, 1);
+    reportGrams(EV_LIVE, "LIVE", liveW, 1);
 
     lastLiveSend = millis();
   }
 
-  if (Serial.available() > 0) {
-    String cmd = Serial.readStringUntil('\n');
-    cmd.trim();
-
-    // Commands:
-    // OPEN_LID / CLOSE_LID
-    // DISPENSE <grams>
-    // STOP
-    // OPEN_DISP / CLOSE_DISP
-
-    if (cmd == "OPEN_LID") {
-      openLid();
-    } else if (cmd == "CLOSE_LID") {
-      closeLid();
-    } else if (cmd.startsWith("DISPENSE")) {
-      float grams = cmd.substring(8).toFloat();
-      if (grams > 0) {
-        startDispense(grams);
-        openDispenser();
-      }
-    } else if (cmd == "STOP") {
-      dispensing = false;
-      closeDispenser();
-      Serial.println("STOPPED");
-    } else if (cmd == "FORCE_CLOSE_LID") {
-      closeLid();
-    } 
-  }
-
-  delay(10);
-}
\ No newline at end of file
+  // No delay(): run() has to be called at least once per step
+  if (binMode) {
+    readFrames();
+  } else {
+    readText();
+  }
+}
@@ -1,7 +1,13 @@
-import serial
-import serial.tools.list_ports
+import os
+import sys
+import threading
 import time
 
+import serial.tools.list_ports
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "src", "master"))
+from serial_link import SerialLink
+
 # --------- Auto-find Arduino port ---------
 def find_arduino():
     ports = list(serial.tools.list_ports.comports())
@@ -18,23 +24,27 @@ if arduino_port is None:
 print(f"Arduino found at: {arduino_port}")
 
 # --------- Open Serial ---------
-arduino = serial.Serial(arduino_port, 9600, timeout=1)
+# The link's reader thread prints every line as it arrives
+arduino = SerialLink(arduino_port, 9600, name="LID")
+replied = threading.Event()
+arduino.on_line(lambda msg: replied.set())
+arduino.start()
 time.sleep(2)  # give Arduino time to reset
 
 # --------- Helper functions ---------
 def send(cmd):
     """Send command to Arduino."""
-    arduino.write((cmd + "\n").encode())
+    replied.clear()
+    arduino.write(cmd)
     print(f"[SEND] {cmd}")
 
-def read_response(timeout=2):
-    """Read lines from Arduino for given timeout in seconds."""
+def read_response(timeout=2, quiet=0.3):
+    """Wait up to timeout seconds for replies, until the link goes quiet."""
     end_time = time.time() + timeout
-    while time.time() < end_time:
-        while arduino.in_waiting > 0:
-            line = arduino.readline().decode().strip()
-            if line:
-                print("[ARDUINO]", line)
+    while replied.wait(max(end_time - time.time(), 0)):
+        replied.clear()
+        if not replied.wait(quiet):
+            break
 
 # --------- Test Menu ---------
 def menu():
@@ -54,38 +64,31 @@ while True:
 
     if choice == "1":
         send("CAT")
-        time.sleep(1)
         read_response()
 
     elif choice == "2":
         send("DISPENSE")
-        time.sleep(1)
         read_response()
 
     elif choice == "3":
         weight = input("Enter max weight (grams): ")
         send(f"MAX_WEIGHT:{weight}")
-        time.sleep(1)
         read_response()
         send("DISPENSE")
-        time.sleep(1)
         read_response()
 
     elif choice == "4":
         send("WEIGHT")
-        time.sleep(1)
         read_response()
 
     elif choice == "5":
         send("CLOSE_ALL")
-        time.sleep(1)
         read_response()
 
     elif choice == "0":
         print("Exiting.")
+        arduino.close()
         break
 
     else:
         print("Invalid choice. Try again.")
-
-    time.sleep(0.5)
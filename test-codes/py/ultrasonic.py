@@ -1,41 +1,39 @@
-import serial
+import os
+import sys
+import threading
 import time
 
-try:
-    arduino = serial.Serial('/dev/ttyACM0', 9600, timeout=1)
-    time.sleep(2)
-    print("Connected to Arduino")
-except Exception as e:
-    print(f"Connection failed: {e}")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "src", "master"))
+from serial_link import SerialLink
+
+# Lines are handled on the link's reader thread as they arrive; nothing polls
+arduino = SerialLink('/dev/ttyACM0', 9600, name="ULTRASONIC", echo=False)
+if not arduino.open():
     exit()
+print("Connected to Arduino")
 
-def read_distance():
+def parse_distance(line):
+    if line.startswith("DISTANCE:"):
+        line = line.split(':')[1]
     try:
-        if arduino.in_waiting > 0:
-            line = arduino.readline().decode('utf-8').rstrip()
-            if line.startswith("DISTANCE:"):
-                distance = int(line.split(':')[1])
-                return distance
-            else:
-                try:
-                    return int(line)
-                except:
-                    return None
-    except Exception as e:
-        print(f"Read error: {e}")
+        return int(line)
+    except ValueError:
         return None
 
+def on_line(msg):
+    distance = parse_distance(msg.line)
+    if distance is not None:
+        if distance == -1 or distance == 999:
+            print("No object detected or sensor timeout")
+        else:
+            print(f"Distance: {distance} cm")
+
+arduino.on_line(on_line)
+arduino.start()
+
 try:
-    while True:
-        distance = read_distance()
-        if distance is not None:
-            if distance == -1 or distance == 999:
-                print("No object detected or sensor timeout")
-            else:
-                print(f"Distance: {distance} cm")
-        
-        time.sleep(0.1)
+    threading.Event().wait()
 
 except KeyboardInterrupt:
     print("\nExiting...")
-    arduino.close()
\ No newline at end of file
+    arduino.close()